@@ -1,4 +1,4 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify, make_response
 from flask_login import LoginManager
 from config import Config
 import os
@@ -24,6 +24,15 @@ def create_app(config_class=Config):
     # Configurar user loader
     setup_login_manager(login_manager)
 
+    # IP real del cliente detrás del proxy (límites de solicitudes por IP)
+    if app.config['PROXIES_CONFIABLES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXIES_CONFIABLES'])
+
+    # Sesiones guardadas en el servidor (la cookie solo lleva un id)
+    from services.sesiones import iniciar_sesiones
+    iniciar_sesiones(app)
+
     # Crear carpeta de uploads si no existe
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -34,6 +43,15 @@ def create_app(config_class=Config):
     app.register_blueprint(afiliado.bp)
     app.register_blueprint(tienda.bp)
 
+    # Archivos estáticos versionados (manifiesto de construir_assets.py)
+    from services.assets import iniciar_assets
+    iniciar_assets(app)
+
+    # Compresión gzip/brotli de HTML y JSON (opcional)
+    if app.config['COMPRESION_ACTIVA']:
+        from services.compresion import iniciar_compresion
+        iniciar_compresion(app)
+
     # Manejadores de errores
     @app.errorhandler(404)
     def page_not_found(e):
@@ -62,6 +80,21 @@ def create_app(config_class=Config):
             error_message='No tienes permiso para acceder a esta página.'
         ), 403
 
+    @app.errorhandler(429)
+    def too_many_requests(e):
+        if request.path.startswith('/api/'):
+            respuesta = jsonify({'success': False, 'error': 'Demasiadas solicitudes, intenta de nuevo en unos segundos'})
+        else:
+            respuesta = make_response(render_template(
+                'error.html',
+                error_code=429,
+                error_title='Demasiadas solicitudes',
+                error_message='Hiciste demasiados intentos seguidos. Espera un momento e intenta de nuevo.'
+            ))
+        respuesta.status_code = 429
+        respuesta.headers['Retry-After'] = str(e.retry_after)
+        return respuesta
+
     @app.errorhandler(400)
     def bad_request(e):
         return render_template(
@@ -75,6 +108,14 @@ def create_app(config_class=Config):
     with app.app_context():
         db.create_all()
 
+        # Motor de búsqueda según los índices creados por init_db.py / migrate_db.py
+        from services.busqueda import detectar_busqueda
+        detectar_busqueda()
+
+    # Pedidos que quedaron en la cola de un arranque anterior (con la primera solicitud)
+    from services.cola_pedidos import iniciar_cola
+    iniciar_cola(app)
+
     return app
 
 
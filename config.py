@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta  # <--- esto faltaba
+from decimal import Decimal
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -28,10 +29,98 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'gif'}
 
+    # Delegar el envío de archivos al servidor web (requiere nginx/Apache con X-Sendfile)
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+    # Versiones redimensionadas de las imágenes subidas (WebP + JPEG)
+    IMAGENES_ANCHOS = (320, 640, 1024)
+    IMAGENES_ANCHO_MINIATURA = 640  # Tarjetas de la tienda (~300px en pantallas 2x)
+    IMAGENES_CALIDAD = 80
+
+    # Identificador del despliegue (invalida ETags cuando cambian las plantillas)
+    VERSION_DESPLIEGUE = os.environ.get('RENDER_GIT_COMMIT', 'dev')
+
+    # Caché del catálogo (segundos antes de releer productos de la BD)
+    CATALOGO_TTL = int(os.environ.get('CATALOGO_TTL', 300))
+    CATALOGO_POR_PAGINA = 24  # Productos por página en la tienda y en /api/productos
+    CATALOGO_MAX_POR_PAGINA = 100
+    BUSQUEDA_MAX_RESULTADOS = 50
+
+    # Caché de códigos de afiliado: cada cuántos segundos se compara con la BD
+    # (una consulta al sello; se relee solo si un afiliado cambió en otro worker)
+    AFILIADOS_VERIFICAR_CADA = int(os.environ.get('AFILIADOS_VERIFICAR_CADA', 5))
+
+    # Caché de las estadísticas del dashboard del admin (segundos; los cambios
+    # de pedidos y comisiones la invalidan en el proceso que los hace)
+    ESTADISTICAS_TTL = int(os.environ.get('ESTADISTICAS_TTL', 30))
+    ADMIN_POR_PAGINA = 50  # Filas por página en los listados del admin
+    LISTADOS_CONTEO_TTL = 60  # Segundos que se reutiliza el total de un listado por cursor
+    EXPORTAR_LOTE = 1000  # Filas leídas y enviadas por lote en las exportaciones CSV
+
+    # Caché de páginas renderizadas de la tienda (LRU por proceso)
+    PAGINAS_CACHE_MAX_ENTRADAS = int(os.environ.get('PAGINAS_CACHE_MAX_ENTRADAS', 256))
+    PAGINAS_CACHE_MAX_BYTES = int(os.environ.get('PAGINAS_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # Compresión de respuestas HTML/JSON (brotli si está instalado, si no gzip)
+    COMPRESION_ACTIVA = os.environ.get('COMPRESION_ACTIVA', '0') == '1'
+    COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))  # Menos no compensa
+    COMPRESION_NIVEL_GZIP = 6
+    COMPRESION_NIVEL_BROTLI = 5
+
     # Configuración de PayPal
     PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID')
     PAYPAL_SECRET = os.environ.get('PAYPAL_SECRET')
     PAYPAL_MODE = os.environ.get('PAYPAL_MODE', 'sandbox')  # 'sandbox' o 'live'
+    PAYPAL_COMISION_PORCENTAJE = Decimal('5.4')  # Recargo al pagar con PayPal/tarjeta
+    PAYPAL_TOKEN_MARGEN = 60  # Segundos antes de expires_in en que el token se da por vencido
+    PAYPAL_TOKEN_REFRESCO = 600  # Renovar en segundo plano cuando quede menos que esto
+    PAYPAL_API_URL = os.environ.get('PAYPAL_API_URL')  # Opcional: stub local para pruebas de carga
+    PAYPAL_TIMEOUT_CONEXION = 3.05  # Segundos
+    PAYPAL_TIMEOUT_LECTURA = 20
+    PAYPAL_REINTENTOS = 2  # Solo llamadas idempotentes (token y con PayPal-Request-Id)
+    PAYPAL_REINTENTO_ESPERA = 0.3  # Backoff base en segundos
+    PAYPAL_CIRCUITO_FALLOS = 5  # Fallos seguidos que abren el circuito
+    PAYPAL_CIRCUITO_ESPERA = 30  # Segundos sin llamar a PayPal con el circuito abierto
+    PAYPAL_POOL_MAX = 10  # Conexiones keep-alive por proceso
+
+    # Sesiones en el servidor: 'db' (tabla sesiones), 'redis', 'memoria' (un solo proceso)
+    # o 'cookie' (sesión firmada de Flask, sin almacén)
+    SESIONES_BACKEND = os.environ.get('SESIONES_BACKEND', 'db')
+    SESIONES_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    SESIONES_TTL_TEMPORAL = timedelta(days=1)  # Sesiones no permanentes
+    SESIONES_RENOVAR_CADA = 24 * 3600  # Segundos entre renovaciones de una sesión sin cambios
+    SESIONES_GC_INTERVALO = 3600  # Segundos entre limpiezas de sesiones vencidas (por proceso)
+    SESIONES_GC_LOTE = 500  # Filas borradas por transacción
+
+    # Cola de pedidos para picos de venta: el checkout responde con una referencia
+    # y un hilo por proceso guarda los pedidos en lotes
+    COLA_PEDIDOS_ACTIVA = os.environ.get('COLA_PEDIDOS_ACTIVA', '0') == '1'
+    COLA_PEDIDOS_RUTA = os.environ.get('COLA_PEDIDOS_RUTA') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'cola_pedidos.db')
+    COLA_PEDIDOS_MAX = 1000  # Pedidos en espera antes de rechazar con 503
+    COLA_PEDIDOS_LOTE = 50  # Pedidos por commit
+    COLA_PEDIDOS_ESPERA = 0.25  # Segundos que el worker espera para juntar un lote
+    COLA_PEDIDOS_RETENCION = 7 * 24 * 3600  # Segundos que se guardan los ya procesados
+    COLA_PEDIDOS_INTENTOS = 10  # Intentos ante errores transitorios de la BD antes de quedar en 'error'
+    COLA_PEDIDOS_REINTENTO_ESPERA = 2  # Segundos antes del primer reintento (luego se duplica, máx. 5 min)
+
+    # Límites de solicitudes por IP y por sesión: (ráfaga, segundos para recuperarla)
+    LIMITES_ACTIVOS = os.environ.get('LIMITES_ACTIVOS', '1') == '1'
+    LIMITES_BACKEND = os.environ.get('LIMITES_BACKEND', 'memoria')  # 'memoria' (por proceso) o 'redis'
+    LIMITES_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    LIMITES = {
+        'pedidos': (5, 60),  # /api/crear-pedido y checkout
+        'paypal': (10, 60),  # Crear y capturar órdenes de PayPal
+        'login': (5, 300),  # Intentos de login de admin y afiliados
+    }
+    LIMITES_FACTOR_IP = 4  # Una IP puede ser de varios clientes (NAT, redes móviles)
+    # Proxies delante de la app (nginx): la IP real viene en X-Forwarded-For.
+    # Render define RENDER=true y siempre pone un proxy delante
+    PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', '1' if os.environ.get('RENDER') else '0'))
+    # Presupuesto por IP también para sesiones ya establecidas (las nuevas o vacías
+    # siempre cuentan por IP). Sin proxy configurado todos los clientes podrían llegar
+    # con la IP del proxy, así que solo se activa si se pide o si hay proxies configurados
+    LIMITES_POR_IP = os.environ.get('LIMITES_POR_IP', '1' if PROXIES_CONFIABLES else '0') == '1'
 
     # Duración de la cookie permanente
     PERMANENT_SESSION_LIFETIME = timedelta(days=180)  # 3 meses
@@ -0,0 +1,98 @@
+"""
+Script para versionar los archivos estáticos
+Copia cada archivo de static/ (excepto uploads/) a static/build/ con el hash
+de su contenido en el nombre, genera las versiones .gz y .br de los archivos
+de texto y escribe static/build/manifest.json
+Ejecutar en cada despliegue: python construir_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+# Configurar encoding para Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from services.assets import CARPETA_BUILD, MANIFIESTO, EXTENSIONES_COMPRIMIBLES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CARPETA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+EXCLUIR = {CARPETA_BUILD, 'uploads'}
+
+
+def nombre_versionado(ruta_relativa, contenido):
+    """'css/style.css' -> 'css/style.<hash>.css'"""
+    base, extension = os.path.splitext(ruta_relativa)
+    return f'{base}.{hashlib.sha256(contenido).hexdigest()[:12]}{extension}'
+
+
+def escribir_si_menor(ruta, datos, tamano_original):
+    """Guardar una versión comprimida solo si ahorra bytes"""
+    if len(datos) >= tamano_original:
+        return False
+    with open(ruta, 'wb') as f:
+        f.write(datos)
+    return True
+
+
+def construir_assets():
+    """Generar archivos versionados, precomprimidos y el manifiesto"""
+    print("="*60)
+    print("CONSTRUCCIÓN DE ARCHIVOS ESTÁTICOS")
+    print("="*60)
+    if brotli is None:
+        print("\n⚠️  Módulo 'brotli' no instalado: solo se generan versiones .gz")
+
+    destino = os.path.join(CARPETA_STATIC, CARPETA_BUILD)
+    manifiesto = {}
+    comprimidos = 0
+
+    for carpeta, subcarpetas, archivos in os.walk(CARPETA_STATIC):
+        if carpeta == CARPETA_STATIC:
+            subcarpetas[:] = [d for d in subcarpetas if d not in EXCLUIR]
+
+        for nombre in sorted(archivos):
+            origen = os.path.join(carpeta, nombre)
+            relativa = os.path.relpath(origen, CARPETA_STATIC).replace(os.sep, '/')
+            with open(origen, 'rb') as f:
+                contenido = f.read()
+
+            versionada = nombre_versionado(relativa, contenido)
+            ruta = os.path.join(destino, versionada)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            if not os.path.exists(ruta):
+                shutil.copy2(origen, ruta)
+
+            if nombre.rsplit('.', 1)[-1].lower() in EXTENSIONES_COMPRIMIBLES:
+                if escribir_si_menor(ruta + '.gz', gzip.compress(contenido, compresslevel=9, mtime=0), len(contenido)):
+                    comprimidos += 1
+                if brotli is not None:
+                    if escribir_si_menor(ruta + '.br', brotli.compress(contenido, quality=11), len(contenido)):
+                        comprimidos += 1
+
+            manifiesto[relativa] = f'{CARPETA_BUILD}/{versionada}'
+            print(f"   ✓ {relativa} -> {manifiesto[relativa]}")
+
+    # Escritura atómica: los workers nunca leen un manifiesto a medias.
+    # Los archivos de builds anteriores se conservan para páginas ya servidas.
+    ruta_manifiesto = os.path.join(destino, MANIFIESTO)
+    with open(ruta_manifiesto + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    os.replace(ruta_manifiesto + '.tmp', ruta_manifiesto)
+
+    print("\n" + "="*60)
+    print(f"✓ {len(manifiesto)} archivos versionados, {comprimidos} versiones comprimidas")
+    print("="*60)
+    return manifiesto
+
+
+if __name__ == '__main__':
+    construir_assets()
@@ -0,0 +1,65 @@
+"""
+Script para exportar pedidos (una fila por producto) o comisiones a CSV
+Lee por lotes: sirve para tablas de cualquier tamaño sin cargarlas en memoria
+Ejecutar: python exportar_csv.py pedidos|comisiones [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+                                 [--estado ESTADO] [--tipo TIPO] [--salida archivo.csv]
+"""
+
+import argparse
+import sys
+from datetime import date
+
+# Configurar encoding para Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app import create_app
+from services.exportaciones import (filas_pedidos, filas_comisiones, escribir_csv,
+                                    ENCABEZADO_PEDIDOS, ENCABEZADO_COMISIONES)
+from services.listados import ESTADOS_PEDIDO, TIPOS_PEDIDO, ESTADOS_COMISION
+
+
+def exportar(que, desde=None, hasta=None, estado='todos', tipo='todos', salida=None):
+    """Escribir la exportación en `salida`; retorna el número de filas"""
+    app = create_app()
+    salida = salida or f'{que}-{date.today().isoformat()}.csv'
+
+    with app.app_context():
+        print("="*60)
+        print(f"EXPORTACIÓN DE {que.upper()}")
+        print("="*60)
+
+        lote = app.config['EXPORTAR_LOTE']
+        if que == 'pedidos':
+            encabezado = ENCABEZADO_PEDIDOS
+            filas = filas_pedidos(estado=estado, tipo=tipo, desde=desde, hasta=hasta, lote=lote)
+        else:
+            encabezado = ENCABEZADO_COMISIONES
+            filas = filas_comisiones(estado=estado, desde=desde, hasta=hasta, lote=lote)
+
+        with open(salida, 'w', newline='', encoding='utf-8') as archivo:
+            total = escribir_csv(archivo, encabezado, filas)
+
+        print(f"\n✓ {total} filas escritas en {salida}")
+        print("="*60)
+
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exportar pedidos o comisiones a CSV')
+    parser.add_argument('que', choices=['pedidos', 'comisiones'])
+    parser.add_argument('--desde', type=date.fromisoformat, help='Fecha inicial (AAAA-MM-DD, incluida)')
+    parser.add_argument('--hasta', type=date.fromisoformat, help='Fecha final (AAAA-MM-DD, incluida)')
+    parser.add_argument('--estado', default='todos',
+                        choices=sorted(set(ESTADOS_PEDIDO) | set(ESTADOS_COMISION)))
+    parser.add_argument('--tipo', default='todos', choices=TIPOS_PEDIDO, help='Solo pedidos')
+    parser.add_argument('--salida', help='Archivo de salida (por defecto <que>-<fecha>.csv)')
+    args = parser.parse_args()
+
+    estados = ESTADOS_PEDIDO if args.que == 'pedidos' else ESTADOS_COMISION
+    if args.estado not in estados:
+        parser.error(f"estado inválido para {args.que}: {', '.join(estados)}")
+
+    exportar(args.que, desde=args.desde, hasta=args.hasta, estado=args.estado,
+             tipo=args.tipo, salida=args.salida)
@@ -0,0 +1,56 @@
+"""
+Script para generar las versiones redimensionadas (WebP + JPEG) de las
+imágenes ya subidas a static/uploads
+Ejecutar: python generar_imagenes.py [--forzar]
+"""
+
+import os
+import sys
+
+# Configurar encoding para Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app import create_app
+from services.imagenes import generar_derivados, anchos_disponibles
+
+
+def generar_imagenes(forzar=False):
+    """Generar miniaturas de las imágenes que aún no las tienen"""
+    app = create_app()
+
+    with app.app_context():
+        print("="*60)
+        print("GENERACIÓN DE MINIATURAS")
+        print("="*60)
+
+        carpeta = app.config['UPLOAD_FOLDER']
+        extensiones = app.config['ALLOWED_EXTENSIONS']
+        archivos = sorted(
+            nombre for nombre in os.listdir(carpeta)
+            if os.path.isfile(os.path.join(carpeta, nombre))
+            and nombre.rsplit('.', 1)[-1].lower() in extensiones
+        )
+
+        generadas = omitidas = errores = 0
+        for nombre in archivos:
+            if not forzar and anchos_disponibles(nombre):
+                omitidas += 1
+                continue
+            try:
+                anchos = generar_derivados(nombre)
+                print(f"   ✓ {nombre} -> {', '.join(str(a) for a in anchos)}px")
+                generadas += 1
+            except Exception as e:
+                print(f"   ❌ {nombre}: {str(e)}")
+                errores += 1
+
+        print("\n" + "="*60)
+        print(f"✓ {generadas} generadas, {omitidas} ya existían, {errores} con error")
+        print("="*60)
+
+    return errores == 0
+
+
+if __name__ == '__main__':
+    generar_imagenes(forzar='--forzar' in sys.argv)
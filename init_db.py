@@ -11,6 +11,7 @@ if sys.platform == 'win32':
 
 from app import create_app
 from models import db, Admin, Afiliado, Producto
+from services.busqueda import crear_indices_busqueda
 
 def init_database():
     """Inicializar base de datos y crear admin por defecto"""
@@ -111,6 +112,13 @@ def init_database():
             print(f"   Comision: 80%")
             print(f"   Contrasena: afiliado123")
 
+        # Índices de búsqueda (después de los productos: el FTS se reconstruye con ellos)
+        try:
+            motor = crear_indices_busqueda()
+            print(f"\n[OK] Búsqueda de productos con '{motor}'")
+        except Exception as e:
+            print(f"\n[!] Búsqueda con LIKE, no se pudo crear el índice de texto completo: {e}")
+
         print("\n" + "="*50)
         print("[OK] BASE DE DATOS INICIALIZADA CORRECTAMENTE")
         print("="*50)
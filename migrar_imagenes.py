@@ -0,0 +1,117 @@
+"""
+Script de migración de imágenes subidas al almacenamiento por contenido
+Renombra cada archivo de static/uploads al hash de su contenido, unifica
+los duplicados, actualiza Producto.imagen / Producto.imagenes y reconstruye
+el conteo de referencias (tabla archivos_imagen)
+Ejecutar: python migrar_imagenes.py
+"""
+
+import os
+import shutil
+import sys
+
+# Configurar encoding para Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app import create_app
+from models import db, Producto, ArchivoImagen
+from services.imagenes import (
+    hash_archivo, nombre_por_contenido, es_nombre_por_contenido,
+    anchos_disponibles, generar_derivados, eliminar_archivos
+)
+
+
+def migrar_imagenes():
+    """Pasar las imágenes existentes a nombres por hash sin perder ninguna"""
+    app = create_app()
+
+    with app.app_context():
+        print("="*60)
+        print("MIGRACIÓN DE IMÁGENES A NOMBRES POR CONTENIDO")
+        print("="*60)
+
+        carpeta = app.config['UPLOAD_FOLDER']
+        extensiones = app.config['ALLOWED_EXTENSIONS']
+        archivos = sorted(
+            nombre for nombre in os.listdir(carpeta)
+            if not nombre.startswith('.')
+            and os.path.isfile(os.path.join(carpeta, nombre))
+            and nombre.rsplit('.', 1)[-1].lower() in extensiones
+        )
+
+        # [1/4] Copiar cada archivo a su nombre por hash (los originales se borran al final)
+        print(f"\n[1/4] Calculando hash de {len(archivos)} archivos...")
+        mapa = {}
+        for nombre in archivos:
+            if es_nombre_por_contenido(nombre):
+                mapa[nombre] = nombre
+                continue
+            nuevo = nombre_por_contenido(hash_archivo(os.path.join(carpeta, nombre)), nombre.rsplit('.', 1)[-1])
+            if not os.path.exists(os.path.join(carpeta, nuevo)):
+                shutil.copy2(os.path.join(carpeta, nombre), os.path.join(carpeta, nuevo))
+            mapa[nombre] = nuevo
+
+        unicos = set(mapa.values())
+        duplicados = len(archivos) - len(unicos)
+        print(f"   ✓ {len(unicos)} archivos únicos, {duplicados} duplicados")
+
+        try:
+            # [2/4] Reescribir las imágenes de los productos
+            print("\n[2/4] Actualizando imágenes de productos...")
+            referencias = {}
+            actualizados = 0
+            for producto in Producto.query.all():
+                anteriores = producto.archivos_locales()
+                if producto.imagen:
+                    producto.imagen = mapa.get(producto.imagen, producto.imagen)
+                if producto.imagenes:
+                    # Lista nueva para que SQLAlchemy detecte el cambio en la columna JSON
+                    producto.imagenes = [mapa.get(img, img) for img in producto.imagenes]
+                if producto.archivos_locales() != anteriores:
+                    actualizados += 1
+                for archivo in producto.archivos_locales():
+                    referencias[archivo] = referencias.get(archivo, 0) + 1
+            print(f"   ✓ {actualizados} productos actualizados")
+
+            # [3/4] Reconstruir el conteo de referencias
+            print("\n[3/4] Reconstruyendo conteo de referencias...")
+            ArchivoImagen.query.delete()
+            for archivo in unicos | set(referencias):
+                ruta = os.path.join(carpeta, archivo)
+                db.session.add(ArchivoImagen(
+                    archivo=archivo,
+                    tamano=os.path.getsize(ruta) if os.path.exists(ruta) else 0,
+                    referencias=referencias.get(archivo, 0)
+                ))
+            db.session.commit()
+            sin_uso = sum(1 for archivo in unicos if not referencias.get(archivo))
+            print(f"   ✓ {len(unicos | set(referencias))} archivos registrados ({sin_uso} sin productos, se conservan)")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n❌ ERROR durante la migración: {str(e)}")
+            print("Los archivos originales no se modificaron.\n")
+            return False
+
+        # [4/4] Borrar los nombres antiguos y generar miniaturas de los nuevos
+        print("\n[4/4] Eliminando nombres antiguos y generando miniaturas...")
+        antiguos = [nombre for nombre, nuevo in mapa.items() if nombre != nuevo]
+        eliminar_archivos(antiguos)
+        for archivo in sorted(unicos):
+            if not anchos_disponibles(archivo):
+                try:
+                    generar_derivados(archivo)
+                except Exception as e:
+                    print(f"   ❌ {archivo}: {str(e)}")
+
+        print("\n" + "="*60)
+        print("✓ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+        print("="*60)
+        print(f"\n{len(antiguos)} archivos renombrados, {duplicados} duplicados eliminados.\n")
+
+    return True
+
+
+if __name__ == '__main__':
+    migrar_imagenes()
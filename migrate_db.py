@@ -10,7 +10,8 @@ if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
 from app import create_app
-from models import db, Afiliado, Pedido
+from models import db, Afiliado, Pedido, Producto
+from services.busqueda import crear_indices_busqueda
 from sqlalchemy import text
 
 def migrate_database():
@@ -25,6 +26,12 @@ def migrate_database():
         print("  - afiliados.whatsapp (VARCHAR)")
         print("  - pedidos.validado_por_vendedor (BOOLEAN)")
         print("  - pedidos.validado_en (DATETIME)")
+        print("  - productos.actualizado_en (DATETIME)")
+        print("  - pedidos.referencia (VARCHAR, única)")
+        print("  - índices compuestos de pedidos (listado del admin)")
+        print("  - comisiones.liquidacion_id (INTEGER, pagos por lote)")
+        print("  - afiliados.actualizado_en (DATETIME)")
+        print("  - índices de búsqueda de productos (PostgreSQL: tsvector + trigramas; SQLite: FTS5)")
         print("\n⚠️  NO se eliminarán datos existentes")
         print("="*60)
         
@@ -33,28 +40,29 @@ def migrate_database():
             inspector = db.inspect(db.engine)
             columns_afiliados = [col['name'] for col in inspector.get_columns('afiliados')]
             columns_pedidos = [col['name'] for col in inspector.get_columns('pedidos')]
+            columns_productos = [col['name'] for col in inspector.get_columns('productos')]
 
             # Agregar campo whatsapp a afiliados
             if 'whatsapp' not in columns_afiliados:
-                print("\n[1/3] Agregando campo 'whatsapp' a tabla 'afiliados'...")
+                print("\n[1/9] Agregando campo 'whatsapp' a tabla 'afiliados'...")
                 db.session.execute(text("ALTER TABLE afiliados ADD COLUMN whatsapp VARCHAR(20)"))
                 db.session.commit()
                 print("   ✓ Campo 'whatsapp' agregado exitosamente")
             else:
-                print("\n[1/3] Campo 'whatsapp' ya existe en 'afiliados'")
+                print("\n[1/9] Campo 'whatsapp' ya existe en 'afiliados'")
 
             # Agregar campo validado_por_vendedor a pedidos
             if 'validado_por_vendedor' not in columns_pedidos:
-                print("\n[2/3] Agregando campo 'validado_por_vendedor' a tabla 'pedidos'...")
+                print("\n[2/9] Agregando campo 'validado_por_vendedor' a tabla 'pedidos'...")
                 db.session.execute(text("ALTER TABLE pedidos ADD COLUMN validado_por_vendedor BOOLEAN DEFAULT FALSE"))
                 db.session.commit()
                 print("   ✓ Campo 'validado_por_vendedor' agregado exitosamente")
             else:
-                print("\n[2/3] Campo 'validado_por_vendedor' ya existe en 'pedidos'")
+                print("\n[2/9] Campo 'validado_por_vendedor' ya existe en 'pedidos'")
 
             # Agregar campo validado_en a pedidos
             if 'validado_en' not in columns_pedidos:
-                print("\n[3/3] Agregando campo 'validado_en' a tabla 'pedidos'...")
+                print("\n[3/9] Agregando campo 'validado_en' a tabla 'pedidos'...")
                 # PostgreSQL usa TIMESTAMP, MySQL/MariaDB usa DATETIME
                 db_type = db.engine.dialect.name
                 if db_type == 'postgresql':
@@ -64,7 +72,71 @@ def migrate_database():
                 db.session.commit()
                 print("   ✓ Campo 'validado_en' agregado exitosamente")
             else:
-                print("\n[3/3] Campo 'validado_en' ya existe en 'pedidos'")
+                print("\n[3/9] Campo 'validado_en' ya existe en 'pedidos'")
+
+            # Agregar campo actualizado_en a productos (ETag / Last-Modified)
+            if 'actualizado_en' not in columns_productos:
+                print("\n[4/9] Agregando campo 'actualizado_en' a tabla 'productos'...")
+                db_type = db.engine.dialect.name
+                if db_type == 'postgresql':
+                    db.session.execute(text("ALTER TABLE productos ADD COLUMN actualizado_en TIMESTAMP"))
+                else:
+                    db.session.execute(text("ALTER TABLE productos ADD COLUMN actualizado_en DATETIME"))
+                db.session.execute(text("UPDATE productos SET actualizado_en = creado_en WHERE actualizado_en IS NULL"))
+                db.session.commit()
+                print("   ✓ Campo 'actualizado_en' agregado exitosamente")
+            else:
+                print("\n[4/9] Campo 'actualizado_en' ya existe en 'productos'")
+
+            # Agregar campo referencia a pedidos (cola de pedidos)
+            if 'referencia' not in columns_pedidos:
+                print("\n[5/9] Agregando campo 'referencia' a tabla 'pedidos'...")
+                db.session.execute(text("ALTER TABLE pedidos ADD COLUMN referencia VARCHAR(20)"))
+                db.session.execute(text("CREATE UNIQUE INDEX ix_pedidos_referencia ON pedidos (referencia)"))
+                db.session.commit()
+                print("   ✓ Campo 'referencia' agregado exitosamente")
+            else:
+                print("\n[5/9] Campo 'referencia' ya existe en 'pedidos'")
+
+            # Índices compuestos para el listado de pedidos (keyset por fecha)
+            print("\n[6/9] Creando índices compuestos en 'pedidos'...")
+            for indice in Pedido.__table__.indexes:
+                if len(indice.columns) > 1:
+                    indice.create(bind=db.engine, checkfirst=True)
+            print("   ✓ Índices listos")
+
+            # Agregar campo liquidacion_id a comisiones (la tabla liquidaciones la crea create_all)
+            columns_comisiones = [col['name'] for col in inspector.get_columns('comisiones')]
+            if 'liquidacion_id' not in columns_comisiones:
+                print("\n[7/9] Agregando campo 'liquidacion_id' a tabla 'comisiones'...")
+                db.session.execute(text("ALTER TABLE comisiones ADD COLUMN liquidacion_id INTEGER REFERENCES liquidaciones(id)"))
+                db.session.execute(text("CREATE INDEX ix_comisiones_liquidacion_id ON comisiones (liquidacion_id)"))
+                db.session.commit()
+                print("   ✓ Campo 'liquidacion_id' agregado exitosamente")
+            else:
+                print("\n[7/9] Campo 'liquidacion_id' ya existe en 'comisiones'")
+
+            # Agregar campo actualizado_en a afiliados (los workers detectan cambios de otro proceso)
+            if 'actualizado_en' not in columns_afiliados:
+                print("\n[8/9] Agregando campo 'actualizado_en' a tabla 'afiliados'...")
+                if db.engine.dialect.name == 'postgresql':
+                    db.session.execute(text("ALTER TABLE afiliados ADD COLUMN actualizado_en TIMESTAMP"))
+                else:
+                    db.session.execute(text("ALTER TABLE afiliados ADD COLUMN actualizado_en DATETIME"))
+                db.session.execute(text("UPDATE afiliados SET actualizado_en = creado_en WHERE actualizado_en IS NULL"))
+                db.session.commit()
+                print("   ✓ Campo 'actualizado_en' agregado exitosamente")
+            else:
+                print("\n[8/9] Campo 'actualizado_en' ya existe en 'afiliados'")
+
+            # Índices de búsqueda (la app solo detecta si existen al arrancar)
+            print("\n[9/9] Creando índices de búsqueda de productos...")
+            try:
+                motor = crear_indices_busqueda()
+                print(f"   ✓ Búsqueda con '{motor}'")
+            except Exception as e:
+                # Sin permisos para extensiones o SQLite sin FTS5: la tienda busca con LIKE
+                print(f"   ⚠️  No se pudo crear el índice de texto completo, se usará LIKE: {e}")
 
             print("\n" + "="*60)
             print("✓ MIGRACIÓN COMPLETADA EXITOSAMENTE")
@@ -45,6 +45,7 @@ class Afiliado(UserMixin, db.Model):
     whatsapp = db.Column(db.String(20), nullable=True)  # WhatsApp del vendedor
     activo = db.Column(db.Boolean, default=True)
     creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+    actualizado_en = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Sello del mapa de vendedores
 
     # Relaciones
     pedidos = db.relationship('Pedido', backref='afiliado', lazy='dynamic')
@@ -102,6 +103,9 @@ CATEGORIAS_PRODUCTO = [
     ('otros', 'Otros')
 ]
 
+# Nombre legible por categoría (búsqueda O(1))
+NOMBRES_CATEGORIAS = dict(CATEGORIAS_PRODUCTO)
+
 
 # Modelo de Producto
 class Producto(db.Model):
@@ -120,6 +124,7 @@ class Producto(db.Model):
     imagenes_url = db.Column(db.JSON, default=list)  # Lista de URLs externas de imágenes
     activo = db.Column(db.Boolean, default=True)
     creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+    actualizado_en = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Para ETag / Last-Modified
 
     def calcular_margen(self):
         """Calcular margen del producto"""
@@ -165,15 +170,70 @@ class Producto(db.Model):
 
         return todas if todas else ['/static/img/no-image.png']
 
+    def archivos_locales(self):
+        """Nombres de las imágenes locales del producto (principal + adicionales)"""
+        archivos = [self.imagen] if self.imagen else []
+        return archivos + list(self.imagenes or [])
+
+    def obtener_variantes_imagen_principal(self):
+        """srcset de la imagen principal local (None si es URL externa o aún no tiene versiones)"""
+        if self.imagen_url or not self.imagen:
+            return None
+        from services.imagenes import variantes_imagen
+        return variantes_imagen(self.imagen)
+
+    def obtener_miniatura_principal(self):
+        """Versión reducida de la imagen principal para listados (el original si no existe)"""
+        variantes = self.obtener_variantes_imagen_principal()
+        return variantes['miniatura'] if variantes else self.obtener_imagen_principal()
+
+    def obtener_miniaturas(self):
+        """Igual que obtener_todas_imagenes, con la versión reducida de cada imagen local"""
+        from services.imagenes import variantes_imagen
+
+        def miniatura(archivo):
+            variantes = variantes_imagen(archivo)
+            return variantes['miniatura'] if variantes else f'/static/uploads/{archivo}'
+
+        todas = []
+
+        if self.imagen_url:
+            todas.append(self.imagen_url)
+        elif self.imagen:
+            todas.append(miniatura(self.imagen))
+
+        if self.imagenes_url:
+            todas.extend(self.imagenes_url)
+
+        if self.imagenes:
+            for img in self.imagenes:
+                todas.append(miniatura(img))
+
+        return todas if todas else ['/static/img/no-image.png']
+
     def __repr__(self):
         return f'<Producto {self.nombre}>'
 
 
+# Modelo de archivo de imagen subido (nombre = hash del contenido)
+class ArchivoImagen(db.Model):
+    __tablename__ = 'archivos_imagen'
+
+    archivo = db.Column(db.String(100), primary_key=True)  # <sha256[:32]>.<ext> en UPLOAD_FOLDER
+    tamano = db.Column(db.Integer, nullable=False, default=0)  # Bytes del original
+    referencias = db.Column(db.Integer, nullable=False, default=0)  # Productos que lo usan
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ArchivoImagen {self.archivo} ({self.referencias} refs)>'
+
+
 # Modelo de Pedido
 class Pedido(db.Model):
     __tablename__ = 'pedidos'
 
     id = db.Column(db.Integer, primary_key=True)
+    referencia = db.Column(db.String(20), unique=True, nullable=True, index=True)  # Pedidos de la cola
     cliente_nombre = db.Column(db.String(100), nullable=False)
     cliente_telefono = db.Column(db.String(20), nullable=False)
     cliente_direccion = db.Column(db.Text, nullable=False)
@@ -189,16 +249,28 @@ class Pedido(db.Model):
     # Relaciones
     comisiones = db.relationship('Comision', backref='pedido', lazy='dynamic', cascade='all, delete-orphan')
 
-    def marcar_como_pagado(self):
+    # Listado del admin: keyset sobre (creado_en, id) con cada filtro
+    __table_args__ = (
+        db.Index('ix_pedidos_creado_id', 'creado_en', 'id'),
+        db.Index('ix_pedidos_estado_creado_id', 'estado', 'creado_en', 'id'),
+        db.Index('ix_pedidos_afiliado_creado_id', 'afiliado_id', 'creado_en', 'id'),
+        db.Index('ix_pedidos_validado_creado_id', 'validado_por_vendedor', 'creado_en', 'id'),
+    )
+
+    # Cambios de estado: con commit=False el llamador confirma la transacción
+    # (permite crear pedido, pago y comisión en un solo commit)
+
+    def marcar_como_pagado(self, commit=True):
         """Marcar pedido como pagado (solo cambia estado, no genera comisión aún)"""
         if self.estado == 'pagado':
             return  # Ya está pagado
 
         self.estado = 'pagado'
         self.pagado_en = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
-    def marcar_como_cancelado(self):
+    def marcar_como_cancelado(self, commit=True):
         """Marcar pedido como cancelado"""
         if self.estado == 'cancelado':
             return  # Ya está cancelado
@@ -208,10 +280,11 @@ class Pedido(db.Model):
             return False
 
         self.estado = 'cancelado'
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
 
-    def validar_para_admin(self):
+    def validar_para_admin(self, commit=True):
         """Validar pedido para que el admin lo vea y se genere la comisión"""
         if not self.estado == 'pagado':
             return False  # Debe estar pagado primero
@@ -226,30 +299,50 @@ class Pedido(db.Model):
         if self.afiliado_id:
             self._generar_comision()
 
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
 
+    def calcular_margen_total(self):
+        """Margen del pedido con el margen unitario guardado en cada línea"""
+        lineas = self.productos_json or []
+
+        # Pedidos anteriores sin margen en las líneas: sus productos en una sola consulta
+        sin_margen = {item['id'] for item in lineas if 'margen' not in item}
+        productos = {}
+        if sin_margen:
+            productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(sin_margen))}
+
+        margen_total = Decimal('0.00')
+        for item in lineas:
+            if 'margen' in item:
+                margen_unitario = Decimal(str(item['margen']))
+            elif item['id'] in productos:
+                margen_unitario = productos[item['id']].calcular_margen()
+            else:
+                continue
+            margen_total += margen_unitario * Decimal(str(item['cantidad']))
+
+        return margen_total
+
     def _generar_comision(self):
         """Generar comisión para el afiliado"""
-        afiliado = Afiliado.query.get(self.afiliado_id)
+        # Por afiliado_id, no por la relación: en un pedido aún sin flush la
+        # relación sigue en None. get() no consulta si ya está en la sesión
+        afiliado = db.session.get(Afiliado, self.afiliado_id) if self.afiliado_id else None
         if not afiliado:
             return
 
         # Calcular margen total del pedido
-        margen_total = Decimal('0.00')
-
-        for item in self.productos_json:
-            producto = Producto.query.get(item['id'])
-            if producto:
-                margen_unitario = producto.calcular_margen()
-                margen_total += margen_unitario * Decimal(str(item['cantidad']))
+        margen_total = self.calcular_margen_total()
 
         # Calcular comisión según porcentaje del afiliado
         monto_comision = margen_total * (afiliado.porcentaje_comision / Decimal('100'))
 
         # Crear registro de comisión
+        # Por la relación (no pedido_id): el pedido puede no tener id aún
         comision = Comision(
-            pedido_id=self.id,
+            pedido=self,
             afiliado_id=self.afiliado_id,
             margen=margen_total,
             monto=monto_comision,
@@ -273,18 +366,52 @@ class Comision(db.Model):
     monto = db.Column(db.Numeric(10, 2), nullable=False)
     estado = db.Column(db.String(20), default='pendiente')  # pendiente, generada, pagada
     pagada_en = db.Column(db.DateTime, nullable=True)
+    liquidacion_id = db.Column(db.Integer, db.ForeignKey('liquidaciones.id'), nullable=True, index=True)  # Pago por lote
     creado_en = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def marcar_como_pagada(self):
+    def marcar_como_pagada(self, commit=True):
         """Marcar comisión como pagada"""
         self.estado = 'pagada'
         self.pagada_en = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def __repr__(self):
         return f'<Comision #{self.id} - Pedido #{self.pedido_id} - ${self.monto}>'
 
 
+# Modelo de liquidación: un pago por lote de comisiones generadas
+class Liquidacion(db.Model):
+    __tablename__ = 'liquidaciones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    afiliado_id = db.Column(db.Integer, db.ForeignKey('afiliados.id'), nullable=True)  # None: todos los afiliados
+    num_comisiones = db.Column(db.Integer, nullable=False, default=0)
+    num_afiliados = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    creado_por = db.Column(db.String(80))  # Usuario admin que la ejecutó
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relaciones
+    afiliado = db.relationship('Afiliado')
+    comisiones = db.relationship('Comision', backref='liquidacion', lazy='dynamic')
+
+    def __repr__(self):
+        return f'<Liquidacion #{self.id} - {self.num_comisiones} comisiones - ${self.total}>'
+
+
+# Modelo de sesión guardada en el servidor (la cookie solo lleva el id)
+class SesionGuardada(db.Model):
+    __tablename__ = 'sesiones'
+
+    id = db.Column(db.String(100), primary_key=True)  # 'sesion:<id aleatorio>'
+    datos = db.Column(db.Text, nullable=False)  # JSON de Flask (carrito, afiliado, login)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<SesionGuardada {self.id[:16]}...>'
+
+
 # User loader para Flask-Login
 def setup_login_manager(login_manager):
     """Configurar login manager"""
@@ -0,0 +1,63 @@
+"""
+Script para revisar y reprocesar los pedidos de la cola que quedaron en 'error'
+(datos inválidos o reintentos agotados con la base de datos caída)
+Ejecutar en el nodo de la cola: python reprocesar_cola.py [--reintentar [ID ...]]
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+# Configurar encoding para Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app import create_app
+from services.cola_pedidos import obtener_cola, procesar_lote
+
+
+def reprocesar_cola(reintentar=False, ids=None):
+    """Listar los pedidos en error y, con `reintentar`, guardarlos de nuevo"""
+    app = create_app()
+
+    with app.app_context():
+        print("="*60)
+        print("PEDIDOS DE LA COLA CON ERROR")
+        print("="*60)
+
+        cola = obtener_cola()
+        errores = cola.errores(limite=1000)
+        if not errores:
+            print("\n✓ No hay pedidos con error en la cola")
+            return True
+
+        for id_, referencia, intentos, error, creado_en in errores:
+            fecha = datetime.fromtimestamp(creado_en).strftime('%Y-%m-%d %H:%M')
+            print(f"\n   #{id_} {referencia} ({fecha}, {intentos} intentos)")
+            print(f"      {error}")
+
+        if not reintentar:
+            print("\nPara reprocesarlos: python reprocesar_cola.py --reintentar [ID ...]")
+            return True
+
+        reactivados = cola.reactivar_errores(ids)
+        print(f"\n   {reactivados} pedidos devueltos a la cola, procesando...")
+        while procesar_lote(cola, app.config['COLA_PEDIDOS_LOTE']):
+            pass
+
+        pendientes = len(cola.errores(limite=1000))
+        print("\n" + "="*60)
+        print(f"✓ {reactivados} devueltos a la cola, {pendientes} siguen con error")
+        print("="*60)
+
+    return pendientes == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reprocesar pedidos de la cola con error')
+    parser.add_argument('--reintentar', nargs='*', type=int, metavar='ID',
+                        help='Devolver a la cola los pedidos en error (todos, o solo esos ids)')
+    args = parser.parse_args()
+
+    ok = reprocesar_cola(reintentar=args.reintentar is not None, ids=args.reintentar or None)
+    sys.exit(0 if ok else 1)
@@ -3,10 +3,20 @@ Rutas del panel de administración
 Gestión de productos, pedidos, afiliados y comisiones
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session, current_app, abort, make_response,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
-from models import db, Admin, Producto, Pedido, Afiliado, Comision
+from models import db, Admin, Producto, Pedido, Afiliado, Comision, Liquidacion
+from services.catalogo import invalidar_catalogo
+from services.afiliados import invalidar_afiliados
+from services.estadisticas import obtener_estadisticas
+from services.listados import (listar_afiliados, listar_pedidos, listar_comisiones, totales_comisiones, listar_liquidaciones,
+                               ORDENES_AFILIADOS, ESTADOS_PEDIDO, TIPOS_PEDIDO, ESTADOS_COMISION)
+from services.liquidaciones import liquidar_comisiones, archivo_liquidacion
+from services.exportaciones import (filas_pedidos, filas_comisiones, csv_por_partes,
+                                    ENCABEZADO_PEDIDOS, ENCABEZADO_COMISIONES)
+from services.imagenes import guardar_subida, registrar_referencias, liberar_referencias, eliminar_archivos
+from datetime import date
 from decimal import Decimal
 import os
 
@@ -35,53 +45,8 @@ def allowed_file(filename):
 @admin_required
 def dashboard():
     """Dashboard principal del admin"""
-    # Estadísticas generales
-    total_productos = Producto.query.filter_by(activo=True).count()
-    
-    # Solo pedidos sin vendedor o validados por vendedores
-    total_pedidos = Pedido.query.filter(
-        db.or_(
-            Pedido.afiliado_id.is_(None),
-            Pedido.validado_por_vendedor == True
-        )
-    ).count()
-    
-    pedidos_pendientes = Pedido.query.filter(
-        db.or_(
-            db.and_(Pedido.afiliado_id.is_(None), Pedido.estado == 'pendiente'),
-            db.and_(Pedido.validado_por_vendedor == True, Pedido.estado == 'pendiente')
-        )
-    ).count()
-    
-    pedidos_pagados = Pedido.query.filter(
-        db.or_(
-            db.and_(Pedido.afiliado_id.is_(None), Pedido.estado == 'pagado'),
-            db.and_(Pedido.validado_por_vendedor == True, Pedido.estado == 'pagado')
-        )
-    ).count()
-    
-    total_afiliados = Afiliado.query.filter_by(activo=True).count()
-
-    # Comisiones pendientes de pago
-    comisiones_pendientes = db.session.query(db.func.sum(Comision.monto))\
-        .filter(Comision.estado.in_(['pendiente', 'generada'])).scalar() or Decimal('0.00')
-
-    # Últimos pedidos (solo validados o sin vendedor)
-    ultimos_pedidos = Pedido.query.filter(
-        db.or_(
-            Pedido.afiliado_id.is_(None),
-            Pedido.validado_por_vendedor == True
-        )
-    ).order_by(Pedido.creado_en.desc()).limit(5).all()
-
-    return render_template('admin/dashboard.html',
-                         total_productos=total_productos,
-                         total_pedidos=total_pedidos,
-                         pedidos_pendientes=pedidos_pendientes,
-                         pedidos_pagados=pedidos_pagados,
-                         total_afiliados=total_afiliados,
-                         comisiones_pendientes=comisiones_pendientes,
-                         ultimos_pedidos=ultimos_pedidos)
+    # Contadores y últimos pedidos cacheados (ESTADISTICAS_TTL)
+    return render_template('admin/dashboard.html', **obtener_estadisticas().a_dict())
 
 
 # ============== GESTIÓN DE PRODUCTOS ==============
@@ -154,14 +119,11 @@ def crear_producto():
 
         # Si no hay URL principal, verificar archivos locales
         if not imagen_url:
-            import time
             if 'imagenes' in request.files:
                 files = request.files.getlist('imagenes')
                 for i, file in enumerate(files[:4]):  # Máximo 4 imágenes
                     if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        filename = f"{int(time.time())}_{i}_{filename}"
-                        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+                        filename = guardar_subida(file)
 
                         if i == 0:
                             imagen_principal = filename
@@ -184,7 +146,9 @@ def crear_producto():
         )
 
         db.session.add(producto)
+        registrar_referencias(producto.archivos_locales())
         db.session.commit()
+        invalidar_catalogo()
 
         flash(f'Producto "{nombre}" creado exitosamente', 'success')
         return redirect(url_for('admin.productos'))
@@ -226,6 +190,7 @@ def editar_producto(id):
             return render_template('admin/editar_producto.html', producto=producto)
 
         producto.activo = request.form.get('activo') == 'on'
+        archivos_anteriores = producto.archivos_locales()
 
         # Manejar imágenes - Priorizar URLs sobre archivos locales
         imagen_url = request.form.get('imagen_url', '').strip()
@@ -251,14 +216,11 @@ def editar_producto(id):
                 archivos_validos = [f for f in files if f and f.filename and allowed_file(f.filename)]
 
                 if archivos_validos:
-                    import time
                     imagen_principal = None
                     imagenes_adicionales = []
 
                     for i, file in enumerate(archivos_validos[:4]):
-                        filename = secure_filename(file.filename)
-                        filename = f"{int(time.time())}_{i}_{filename}"
-                        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+                        filename = guardar_subida(file)
 
                         if i == 0:
                             imagen_principal = filename
@@ -271,7 +233,15 @@ def editar_producto(id):
                     producto.imagen_url = None
                     producto.imagenes_url = None
 
+        # Conteo de referencias de las imágenes (se suman antes de restar por si se repiten)
+        archivos_sin_uso = []
+        if producto.archivos_locales() != archivos_anteriores:
+            registrar_referencias(producto.archivos_locales())
+            archivos_sin_uso = liberar_referencias(archivos_anteriores)
+
         db.session.commit()
+        eliminar_archivos(archivos_sin_uso)
+        invalidar_catalogo()
         flash(f'Producto "{producto.nombre}" actualizado exitosamente', 'success')
         return redirect(url_for('admin.productos'))
 
@@ -288,49 +258,59 @@ def eliminar_producto(id):
     producto = Producto.query.get_or_404(id)
     producto.activo = False
     db.session.commit()
+    invalidar_catalogo()
     flash(f'Producto "{producto.nombre}" desactivado', 'success')
     return redirect(url_for('admin.productos'))
 
 
 # ============== GESTIÓN DE PEDIDOS ==============
 
+def _rango_fechas():
+    """Fechas desde/hasta de la URL (YYYY-MM-DD, ambas incluidas); ValueError si no son válidas"""
+    desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') else None
+    hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') else None
+    return desde, hasta
+
+
 @bp.route('/pedidos')
 @admin_required
 def pedidos():
     """Lista de pedidos - Solo pedidos validados por vendedores o sin vendedor (tienda principal)"""
-    from models import Pedido
-
     estado_filter = request.args.get('estado', 'todos')
     tipo_filter = request.args.get('tipo', 'todos')  # todos, validados, sin_vendedor
-
-    # Pedidos sin vendedor (tienda principal) O pedidos validados por vendedores
-    query = Pedido.query.filter(
-        db.or_(
-            Pedido.afiliado_id.is_(None),  # Sin vendedor (tienda principal)
-            Pedido.validado_por_vendedor == True  # Validados por vendedores
+    if estado_filter not in ESTADOS_PEDIDO:
+        estado_filter = 'todos'
+    if tipo_filter not in TIPOS_PEDIDO:
+        tipo_filter = 'todos'
+
+    try:
+        desde, hasta = _rango_fechas()
+    except ValueError:
+        flash('Fecha inválida', 'error')
+        return redirect(url_for('admin.pedidos', estado=estado_filter, tipo=tipo_filter))
+
+    # Página por cursor: mismo costo en la primera página que en la milésima
+    try:
+        resultado = listar_pedidos(
+            estado=estado_filter,
+            tipo=tipo_filter,
+            desde=desde,
+            hasta=hasta,
+            despues=request.args.get('despues'),
+            antes=request.args.get('antes'),
+            limite=current_app.config['ADMIN_POR_PAGINA'],
+            ttl_conteo=current_app.config['LISTADOS_CONTEO_TTL']
         )
-    )
-
-    if estado_filter != 'todos':
-        query = query.filter_by(estado=estado_filter)
-
-    if tipo_filter == 'validados':
-        query = query.filter(Pedido.validado_por_vendedor == True)
-    elif tipo_filter == 'sin_vendedor':
-        query = query.filter(Pedido.afiliado_id.is_(None))
-
-    pedidos = query.order_by(Pedido.creado_en.desc()).all()
-    
-    # Estadísticas
-    total_validados = Pedido.query.filter_by(validado_por_vendedor=True).count()
-    total_sin_vendedor = Pedido.query.filter_by(afiliado_id=None).count()
-    
-    return render_template('admin/pedidos.html', 
-                         pedidos=pedidos, 
+    except ValueError:
+        abort(400)
+
+    return render_template('admin/pedidos.html',
+                         pedidos=resultado.items,
+                         paginacion=resultado,
                          estado_filter=estado_filter,
                          tipo_filter=tipo_filter,
-                         total_validados=total_validados,
-                         total_sin_vendedor=total_sin_vendedor)
+                         desde=desde,
+                         hasta=hasta)
 
 
 @bp.route('/pedidos/<int:id>')
@@ -392,38 +372,21 @@ def cancelar_pedido(id):
 @bp.route('/afiliados')
 @admin_required
 def afiliados():
-    """Lista de afiliados"""
-    from models import Afiliado, Comision, Pedido
-    from sqlalchemy import func
-
-    afiliados_data = []
-    afiliados = Afiliado.query.order_by(Afiliado.creado_en.desc()).all()
+    """Lista de afiliados con sus totales (paginada, ordenable por cualquier total)"""
+    orden = request.args.get('orden', 'recientes')
+    if orden not in ORDENES_AFILIADOS:
+        orden = 'recientes'
+    descendente = request.args.get('dir', 'desc') != 'asc'
+    pagina = request.args.get('pagina', 1, type=int)
 
-    for afiliado in afiliados:
-        # Total ganado (comisiones pagadas)
-        total_ganado = db.session.query(func.sum(Comision.monto))\
-            .filter(Comision.afiliado_id == afiliado.id, Comision.estado == 'pagada')\
-            .scalar() or 0
+    resultado = listar_afiliados(orden=orden, descendente=descendente, pagina=pagina,
+                                 por_pagina=current_app.config['ADMIN_POR_PAGINA'])
 
-        # Total generado pero no pagado (comisiones generadas)
-        total_generado = db.session.query(func.sum(Comision.monto))\
-            .filter(Comision.afiliado_id == afiliado.id, Comision.estado == 'generada')\
-            .scalar() or 0
-
-        # Número de ventas (pedidos pagados)
-        num_ventas = Pedido.query.filter(
-            Pedido.afiliado_id == afiliado.id,
-            Pedido.estado == 'pagado'
-        ).count()
-
-        afiliados_data.append({
-            'afiliado': afiliado,
-            'total_ganado': float(total_ganado),
-            'total_pendiente': float(total_generado),  # Comisiones generadas pero no pagadas
-            'num_ventas': num_ventas
-        })
-
-    return render_template('admin/afiliados.html', afiliados_data=afiliados_data)
+    return render_template('admin/afiliados.html',
+                         afiliados_data=resultado.items,
+                         paginacion=resultado,
+                         orden=orden,
+                         descendente=descendente)
 
 
 @bp.route('/afiliados/crear', methods=['GET', 'POST'])
@@ -478,6 +441,7 @@ def crear_afiliado():
 
         db.session.add(afiliado)
         db.session.commit()
+        invalidar_afiliados()
 
         flash(f'Afiliado "{nombre}" creado exitosamente con código {codigo}', 'success')
         return redirect(url_for('admin.afiliados'))
@@ -525,6 +489,7 @@ def editar_afiliado(id):
         afiliado.activo = request.form.get('activo') == 'on'
 
         db.session.commit()
+        invalidar_afiliados()
         flash(f'Afiliado "{afiliado.nombre}" actualizado exitosamente', 'success')
         return redirect(url_for('admin.afiliados'))
 
@@ -536,29 +501,24 @@ def editar_afiliado(id):
 @bp.route('/comisiones')
 @admin_required
 def comisiones():
-    """Lista de comisiones"""
-    from models import Comision
-    from app import db
-
+    """Lista de comisiones (paginada, con el afiliado en la misma consulta)"""
     estado_filter = request.args.get('estado', 'todos')
+    if estado_filter not in ESTADOS_COMISION:
+        estado_filter = 'todos'
 
-    query = Comision.query
-    if estado_filter != 'todos':
-        query = query.filter_by(estado=estado_filter)
-
-    comisiones = query.order_by(Comision.creado_en.desc()).all()
+    resultado = listar_comisiones(estado=estado_filter,
+                                  pagina=request.args.get('pagina', 1, type=int),
+                                  por_pagina=current_app.config['ADMIN_POR_PAGINA'])
 
     # Totales
-    total_generadas = db.session.query(db.func.sum(Comision.monto))\
-        .filter(Comision.estado == 'generada').scalar() or Decimal('0.00')
-    total_pagadas = db.session.query(db.func.sum(Comision.monto))\
-        .filter(Comision.estado == 'pagada').scalar() or Decimal('0.00')
+    totales = totales_comisiones()
 
     return render_template('admin/comisiones.html',
-                         comisiones=comisiones,
+                         comisiones=resultado.items,
+                         paginacion=resultado,
                          estado_filter=estado_filter,
-                         total_generadas=total_generadas,
-                         total_pagadas=total_pagadas)
+                         total_generadas=totales['generada'],
+                         total_pagadas=totales['pagada'])
 
 
 @bp.route('/comisiones/<int:id>/marcar-pagada', methods=['POST'])
@@ -581,32 +541,114 @@ def marcar_comision_pagada(id):
 @bp.route('/afiliados/<int:id>/pagar-comisiones', methods=['POST'])
 @admin_required
 def pagar_comisiones_afiliado(id):
-    """Pagar todas las comisiones generadas de un afiliado"""
-    from models import Afiliado, Comision
-    from datetime import datetime
-
+    """Pagar todas las comisiones generadas de un afiliado (una liquidación)"""
     afiliado = Afiliado.query.get_or_404(id)
 
-    # Obtener todas las comisiones generadas (no pagadas) del afiliado
-    comisiones = Comision.query.filter_by(
-        afiliado_id=afiliado.id,
-        estado='generada'
-    ).all()
+    liquidacion = liquidar_comisiones(afiliado_id=afiliado.id, creado_por=current_user.username)
 
-    if not comisiones:
+    if liquidacion is None:
         flash(f'El afiliado {afiliado.nombre} no tiene comisiones pendientes de pago', 'warning')
         return redirect(url_for('admin.afiliados'))
 
-    # Calcular total a pagar
-    total_a_pagar = sum(c.monto for c in comisiones)
-    num_comisiones = len(comisiones)
+    flash(f'✓ Pagadas {liquidacion.num_comisiones} comisiones a {afiliado.nombre} por un total de ${float(liquidacion.total):.2f}', 'success')
+    return redirect(url_for('admin.afiliados'))
 
-    # Marcar todas como pagadas
-    for comision in comisiones:
-        comision.estado = 'pagada'
-        comision.pagada_en = datetime.utcnow()
 
-    db.session.commit()
+# ============== LIQUIDACIONES ==============
 
-    flash(f'✓ Pagadas {num_comisiones} comisiones a {afiliado.nombre} por un total de ${float(total_a_pagar):.2f}', 'success')
-    return redirect(url_for('admin.afiliados'))
+@bp.route('/liquidaciones')
+@admin_required
+def liquidaciones():
+    """Historial de liquidaciones de comisiones"""
+    resultado = listar_liquidaciones(pagina=request.args.get('pagina', 1, type=int),
+                                     por_pagina=current_app.config['ADMIN_POR_PAGINA'])
+    totales = totales_comisiones()
+
+    return render_template('admin/liquidaciones.html',
+                         liquidaciones=resultado.items,
+                         paginacion=resultado,
+                         total_generadas=totales['generada'])
+
+
+@bp.route('/liquidaciones/crear', methods=['POST'])
+@admin_required
+def crear_liquidacion():
+    """Pagar las comisiones generadas de todos los afiliados en una liquidación"""
+    liquidacion = liquidar_comisiones(creado_por=current_user.username)
+
+    if liquidacion is None:
+        flash('No hay comisiones generadas pendientes de pago', 'warning')
+    else:
+        flash(f'✓ Liquidación #{liquidacion.id}: {liquidacion.num_comisiones} comisiones a '
+              f'{liquidacion.num_afiliados} afiliados por ${float(liquidacion.total):.2f}', 'success')
+    return redirect(url_for('admin.liquidaciones'))
+
+
+@bp.route('/liquidaciones/<int:id>/archivo.csv')
+@admin_required
+def archivo_liquidacion_csv(id):
+    """Descargar el archivo de liquidación (una fila por afiliado)"""
+    liquidacion = Liquidacion.query.get_or_404(id)
+
+    respuesta = make_response(archivo_liquidacion(liquidacion))
+    respuesta.headers['Content-Type'] = 'text/csv; charset=utf-8'
+    respuesta.headers['Content-Disposition'] = f'attachment; filename=liquidacion-{liquidacion.id}.csv'
+    return respuesta
+
+
+# ============== EXPORTACIONES ==============
+
+def _respuesta_csv(nombre, encabezado, filas):
+    """CSV enviado mientras se lee: ni la consulta ni la respuesta se cargan completas"""
+    lote = current_app.config['EXPORTAR_LOTE']
+    respuesta = Response(stream_with_context(csv_por_partes(encabezado, filas, lote=lote)),
+                         mimetype='text/csv')
+    respuesta.headers['Content-Disposition'] = f'attachment; filename={nombre}.csv'
+    respuesta.headers['Cache-Control'] = 'no-store'
+    return respuesta
+
+
+def _nombre_exportacion(base, desde, hasta):
+    """'pedidos', 'pedidos-desde-2026-01-01', 'pedidos-2026-01-01-a-2026-01-31'..."""
+    if desde and hasta:
+        return f'{base}-{desde.isoformat()}-a-{hasta.isoformat()}'
+    if desde:
+        return f'{base}-desde-{desde.isoformat()}'
+    if hasta:
+        return f'{base}-hasta-{hasta.isoformat()}'
+    return base
+
+
+@bp.route('/export/pedidos.csv')
+@admin_required
+def exportar_pedidos():
+    """Pedidos en CSV, una fila por producto (mismos filtros que el listado)"""
+    estado_filter = request.args.get('estado', 'todos')
+    tipo_filter = request.args.get('tipo', 'todos')
+    if estado_filter not in ESTADOS_PEDIDO or tipo_filter not in TIPOS_PEDIDO:
+        abort(400)
+    try:
+        desde, hasta = _rango_fechas()
+    except ValueError:
+        abort(400)
+
+    filas = filas_pedidos(estado=estado_filter, tipo=tipo_filter, desde=desde, hasta=hasta,
+                          lote=current_app.config['EXPORTAR_LOTE'])
+    return _respuesta_csv(_nombre_exportacion('pedidos', desde, hasta), ENCABEZADO_PEDIDOS, filas)
+
+
+@bp.route('/export/comisiones.csv')
+@admin_required
+def exportar_comisiones():
+    """Comisiones en CSV con su afiliado y el total del pedido"""
+    estado_filter = request.args.get('estado', 'todos')
+    if estado_filter not in ESTADOS_COMISION:
+        abort(400)
+    try:
+        desde, hasta = _rango_fechas()
+    except ValueError:
+        abort(400)
+
+    filas = filas_comisiones(estado=estado_filter, desde=desde, hasta=hasta,
+                             lote=current_app.config['EXPORTAR_LOTE'])
+    return _respuesta_csv(_nombre_exportacion('comisiones', desde, hasta), ENCABEZADO_COMISIONES, filas)
@@ -3,9 +3,10 @@ Rutas del panel de afiliado
 Ver productos con comisiones, ver comisiones ganadas
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from flask_login import login_required, current_user
 from decimal import Decimal
+from services.listados import listar_comisiones, totales_comisiones, ESTADOS_COMISION
 
 bp = Blueprint('afiliado', __name__, url_prefix='/afiliado')
 
@@ -68,29 +69,14 @@ def dashboard():
 @afiliado_required
 def productos():
     """Ver productos con información de comisiones"""
-    from models import Producto, CATEGORIAS_PRODUCTO
-    from sqlalchemy import func
-    from models import db
+    from models import Producto
+    from services.catalogo import obtener_catalogo
 
     afiliado = current_user
     productos = Producto.query.filter_by(activo=True).order_by(Producto.creado_en.desc()).all()
 
-    # Obtener categorías que tienen productos activos
-    categorias_con_productos = db.session.query(
-        Producto.categoria,
-        func.count(Producto.id).label('count')
-    ).filter(Producto.activo == True).group_by(Producto.categoria).all()
-
-    # Crear diccionario de categorías con sus conteos
-    categorias_activas = {}
-    for cat, count in categorias_con_productos:
-        if cat:
-            nombre_cat = cat
-            for valor, nombre in CATEGORIAS_PRODUCTO:
-                if valor == cat:
-                    nombre_cat = nombre
-                    break
-            categorias_activas[cat] = {'nombre': nombre_cat, 'count': count}
+    # Categorías con productos activos (facetas precalculadas del catálogo)
+    categorias_activas = obtener_catalogo().categorias
 
     # Agregar información de comisión a cada producto
     productos_con_comision = []
@@ -115,33 +101,31 @@ def productos():
 @bp.route('/comisiones')
 @afiliado_required
 def comisiones():
-    """Ver todas las comisiones del afiliado"""
-    from models import Comision
-
+    """Ver las comisiones del afiliado (paginadas, con sus pedidos precargados)"""
     afiliado = current_user
 
     # Filtro por estado
     estado_filter = request.args.get('estado', 'todos')
+    if estado_filter not in ESTADOS_COMISION:
+        estado_filter = 'todos'
 
-    query = Comision.query.filter_by(afiliado_id=afiliado.id)
-    if estado_filter != 'todos':
-        query = query.filter_by(estado=estado_filter)
+    resultado = listar_comisiones(estado=estado_filter,
+                                  afiliado_id=afiliado.id,
+                                  pagina=request.args.get('pagina', 1, type=int),
+                                  por_pagina=current_app.config['ADMIN_POR_PAGINA'],
+                                  con_pedido=True)
 
-    comisiones = query.order_by(Comision.creado_en.desc()).all()
-
-    # Totales
-    total_pendiente = afiliado.total_comisiones_pendientes()
-    total_generado = afiliado.total_comisiones_generadas()
-    total_pagado = afiliado.total_comisiones_pagadas()
-    total_ganado = afiliado.total_ganado()
+    # Totales (una consulta agrupada por estado)
+    totales = totales_comisiones(afiliado_id=afiliado.id)
 
     return render_template('afiliado/comisiones.html',
-                         comisiones=comisiones,
+                         comisiones=resultado.items,
+                         paginacion=resultado,
                          estado_filter=estado_filter,
-                         total_pendiente=total_pendiente,
-                         total_generado=total_generado,
-                         total_pagado=total_pagado,
-                         total_ganado=total_ganado)
+                         total_pendiente=totales['pendiente'],
+                         total_generado=totales['generada'],
+                         total_pagado=totales['pagada'],
+                         total_ganado=totales['generada'] + totales['pagada'])
 
 
 @bp.route('/pedidos')
@@ -274,6 +258,7 @@ def cancelar_pedido(id):
 def mi_cuenta():
     """El vendedor configura su perfil: WhatsApp, contraseña"""
     from models import Afiliado, db
+    from services.afiliados import invalidar_afiliados
 
     afiliado = current_user
 
@@ -294,6 +279,7 @@ def mi_cuenta():
             afiliado.set_password(nueva_password)
 
         db.session.commit()
+        invalidar_afiliados()
         flash('Tu perfil se actualizó correctamente.', 'success')
         return redirect(url_for('afiliado.mi_cuenta'))
 
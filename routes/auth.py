@@ -5,11 +5,13 @@ Maneja login/logout para Admin y Afiliado
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, current_user
+from services.limites import limitar
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
 @bp.route('/admin/login', methods=['GET', 'POST'])
+@limitar('login')
 def admin_login():
     """Login de administrador"""
     from models import Admin
@@ -50,6 +52,7 @@ def admin_login():
 
 
 @bp.route('/afiliado/login', methods=['GET', 'POST'])
+@limitar('login')
 def afiliado_login():
     """Login de afiliado"""
     from models import Afiliado
@@ -3,96 +3,145 @@ Rutas de la tienda pública
 Home, productos, carrito, checkout
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, make_response, abort, g
 from decimal import Decimal
 from models import db
+from services.catalogo import obtener_catalogo, paginar_productos
+from services.busqueda import buscar_ids
+from services.carrito import cotizar_carrito
+from services.cache_http import etag_pagina, no_modificado, con_validadores
+from services.cache_paginas import obtener_cache_paginas, pagina_cacheable
+from services.afiliados import obtener_vendedor, whatsapp_tienda
+from services.paypal import post_api, PayPalNoDisponible
+from services.cola_pedidos import encolar_pedido, estado_pedido, ColaLlena
+from services.limites import limitar
 import json
-import requests
-import base64
+import uuid
 
 bp = Blueprint('tienda', __name__)
 
+# Segundos sugeridos (Retry-After) cuando la cola de pedidos está llena
+REINTENTAR_EN = 5
+
+
+def _pagina_cacheada(clave, renderizar):
+    """HTML de la caché de páginas, o renderizarlo y guardarlo"""
+    if not pagina_cacheable():
+        return renderizar()
+
+    cache = obtener_cache_paginas()
+    pagina = cache.obtener(clave)
+    if pagina is None:
+        pagina = cache.guardar(clave, renderizar())
+    g.pagina_cacheada = pagina  # La compresión reutiliza sus versiones comprimidas
+    return pagina.cuerpo
+
 
 @bp.route('/')
 def index():
     """Página principal de la tienda (Shop Fusion - Admin)"""
-    from models import Producto, Afiliado, CATEGORIAS_PRODUCTO
-    from sqlalchemy import func
-
     # Si viene código de vendedor, redirigir a su tienda
     ref = request.args.get('ref')
-    if ref:
-        afiliado = Afiliado.query.filter_by(codigo=ref, activo=True).first()
-        if afiliado:
-            # Redirigir a la tienda del vendedor
-            return redirect(url_for('tienda.tienda_vendedor', codigo=ref))
-
-    # Obtener productos activos
-    productos_db = Producto.query.filter_by(activo=True).order_by(Producto.creado_en.desc()).all()
-
-    # Obtener categorías que tienen productos activos
-    categorias_con_productos = db.session.query(
-        Producto.categoria,
-        func.count(Producto.id).label('count')
-    ).filter(Producto.activo == True).group_by(Producto.categoria).all()
-
-    # Crear diccionario de categorías con sus conteos
-    categorias_activas = {}
-    for cat, count in categorias_con_productos:
-        if cat:
-            # Buscar el nombre legible de la categoría
-            nombre_cat = cat
-            for valor, nombre in CATEGORIAS_PRODUCTO:
-                if valor == cat:
-                    nombre_cat = nombre
-                    break
-            categorias_activas[cat] = {'nombre': nombre_cat, 'count': count}
-
-    # Convertir productos a diccionarios para JSON
-    productos = []
-    for p in productos_db:
-        # Obtener todas las imágenes usando el método helper
-        todas_imagenes = p.obtener_todas_imagenes()
-
-        productos.append({
-            'id': p.id,
-            'nombre': p.nombre,
-            'descripcion': p.descripcion,
-            'categoria': p.categoria or 'otros',
-            'precio_final': float(p.precio_final),
-            'precio_oferta': float(p.precio_oferta) if p.precio_oferta else None,
-            'imagen': todas_imagenes[0] if todas_imagenes else None,
-            'imagenes': todas_imagenes
-        })
+    if ref and obtener_vendedor(ref):
+        return redirect(url_for('tienda.tienda_vendedor', codigo=ref))
+
+    # Snapshot del catálogo (productos activos, categorías e imágenes)
+    catalogo = obtener_catalogo()
+
+    # Si el navegador ya tiene esta versión, no renderizar
+    etag = etag_pagina('index', catalogo.sello)
+    no_cambio = no_modificado(etag, catalogo.ultima_modificacion)
+    if no_cambio:
+        return no_cambio
 
     # Número de WhatsApp del admin (Shop Fusion)
-    whatsapp_numero = current_app.config.get('WHATSAPP_NUMBER', '')
-    # Asegurar formato internacional (sin el 0 inicial, con código de país)
-    if whatsapp_numero.startswith('0'):
-        whatsapp_numero = '593' + whatsapp_numero[1:]  # Ecuador
-    elif not whatsapp_numero.startswith('+') and not whatsapp_numero.startswith('593'):
-        whatsapp_numero = '593' + whatsapp_numero
-
-    return render_template('tienda/index.html',
+    whatsapp_numero = whatsapp_tienda()
+
+    def renderizar():
+        productos, siguiente_cursor = catalogo.primera_pagina(current_app.config['CATALOGO_POR_PAGINA'])
+        return render_template('tienda/index.html',
                          productos=productos,
-                         productos_db=productos_db,
-                         categorias=categorias_activas,
+                         siguiente_cursor=siguiente_cursor,
+                         total_productos=len(catalogo.productos),
+                         categorias=catalogo.categorias,
                          afiliado_codigo=None,  # Tienda principal sin afiliado
                          whatsapp_numero=whatsapp_numero,
                          es_tienda_vendedor=False)
 
+    clave = ('index', catalogo.version, whatsapp_numero)
+    respuesta = make_response(_pagina_cacheada(clave, renderizar))
+    return con_validadores(respuesta, etag, catalogo.ultima_modificacion)
+
+
+@bp.route('/api/productos')
+def api_productos():
+    """API de catálogo paginado por cursor (filtros y orden en SQL)"""
+    categoria = request.args.get('categoria') or None
+    orden = request.args.get('orden', 'recientes')
+    cursor = request.args.get('cursor') or None
+
+    try:
+        precio_min = request.args.get('precio_min')
+        precio_max = request.args.get('precio_max')
+        precio_min = Decimal(precio_min) if precio_min else None
+        precio_max = Decimal(precio_max) if precio_max else None
+
+        limite = int(request.args.get('limite', current_app.config['CATALOGO_POR_PAGINA']))
+        limite = max(1, min(limite, current_app.config['CATALOGO_MAX_POR_PAGINA']))
+
+        productos, siguiente_cursor = paginar_productos(
+            categoria=categoria,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            orden=orden,
+            limite=limite,
+            cursor=cursor
+        )
+    except (ValueError, ArithmeticError):
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+
+    # Facetas del catálogo completo (precalculadas en el snapshot)
+    catalogo = obtener_catalogo()
+
+    return jsonify({
+        'productos': productos,
+        'siguiente_cursor': siguiente_cursor,
+        'facetas': {
+            'categorias': catalogo.categorias,
+            'precios': catalogo.rangos_precio
+        }
+    })
+
+
+@bp.route('/api/buscar')
+def api_buscar():
+    """Búsqueda de texto completo sobre el catálogo activo"""
+    consulta = request.args.get('q', '').strip()
+    if len(consulta) < 2:
+        return jsonify({'productos': []})
+
+    try:
+        limite = int(request.args.get('limite', current_app.config['BUSQUEDA_MAX_RESULTADOS']))
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    limite = max(1, min(limite, current_app.config['BUSQUEDA_MAX_RESULTADOS']))
+
+    # El índice da los ids por relevancia; los datos salen del snapshot
+    catalogo = obtener_catalogo()
+    productos = [catalogo.por_id[i] for i in buscar_ids(consulta[:100], limite) if i in catalogo.por_id]
+
+    return jsonify({'productos': productos})
+
 
 @bp.route('/producto/<int:id>')
 def producto_detalle(id):
     """Detalle de un producto"""
-    from models import Producto, Afiliado
+    from models import Producto
 
     # Si viene código de vendedor, redirigir a su tienda
     ref = request.args.get('ref')
-    if ref:
-        afiliado = Afiliado.query.filter_by(codigo=ref, activo=True).first()
-        if afiliado:
-            return redirect(url_for('tienda.producto_vendedor', id=id, codigo=ref))
+    if ref and obtener_vendedor(ref):
+        return redirect(url_for('tienda.producto_vendedor', id=id, codigo=ref))
 
     producto = Producto.query.get_or_404(id)
 
@@ -100,51 +149,33 @@ def producto_detalle(id):
         flash('Este producto no está disponible', 'error')
         return redirect(url_for('tienda.index'))
 
+    etag = etag_pagina('producto', id, producto.actualizado_en.isoformat())
+    no_cambio = no_modificado(etag, producto.actualizado_en)
+    if no_cambio:
+        return no_cambio
+
     # WhatsApp del admin
-    whatsapp_numero = current_app.config.get('WHATSAPP_NUMBER', '')
-    if whatsapp_numero.startswith('0'):
-        whatsapp_numero = '593' + whatsapp_numero[1:]
-    elif not whatsapp_numero.startswith('+') and not whatsapp_numero.startswith('593'):
-        whatsapp_numero = '593' + whatsapp_numero
+    whatsapp_numero = whatsapp_tienda()
 
-    return render_template('tienda/producto.html',
+    respuesta = make_response(render_template('tienda/producto.html',
                          producto=producto,
                          afiliado_codigo=None,
                          whatsapp_numero=whatsapp_numero,
-                         es_tienda_vendedor=False)
+                         es_tienda_vendedor=False))
+    return con_validadores(respuesta, etag, producto.actualizado_en)
 
 
 @bp.route('/carrito')
 def carrito():
     """Ver carrito de compras"""
-    from models import Producto
-
-    carrito = session.get('carrito', [])
-
-    # Obtener información completa de productos
-    productos_carrito = []
-    total = Decimal('0.00')
-
-    for item in carrito:
-        producto = Producto.query.get(item['id'])
-        if producto and producto.activo:
-            precio = producto.precio_venta()
-            subtotal = precio * item['cantidad']
-
-            productos_carrito.append({
-                'producto': producto,
-                'cantidad': item['cantidad'],
-                'precio': precio,
-                'subtotal': subtotal
-            })
-
-            total += subtotal
+    # Obtener información completa de productos (una sola consulta)
+    cotizacion = cotizar_carrito(session.get('carrito', []))
 
     afiliado_codigo = session.get('afiliado_codigo')
 
     return render_template('tienda/carrito.html',
-                         productos=productos_carrito,
-                         total=total,
+                         productos=cotizacion.lineas,
+                         total=cotizacion.total,
                          afiliado_codigo=afiliado_codigo)
 
 
@@ -223,11 +254,42 @@ def eliminar_carrito(id):
     return redirect(url_for('tienda.carrito'))
 
 
+def _registrar_pedido(nombre, telefono, direccion, productos_pedido, total, afiliado_id):
+    """
+    Crear el pedido; con COLA_PEDIDOS_ACTIVA queda en la cola y se retorna un
+    PedidoEnCola (id None, con referencia). Lanza ColaLlena si la cola está llena.
+    """
+    from models import Pedido
+
+    if current_app.config['COLA_PEDIDOS_ACTIVA']:
+        return encolar_pedido({
+            'cliente_nombre': nombre,
+            'cliente_telefono': telefono,
+            'cliente_direccion': direccion,
+            'productos_json': productos_pedido,
+            'total': str(total),
+            'afiliado_id': afiliado_id
+        })
+
+    pedido = Pedido(
+        cliente_nombre=nombre,
+        cliente_telefono=telefono,
+        cliente_direccion=direccion,
+        productos_json=productos_pedido,
+        total=total,
+        afiliado_id=afiliado_id,
+        estado='pendiente'
+    )
+
+    db.session.add(pedido)
+    db.session.commit()
+    return pedido
+
+
 @bp.route('/checkout', methods=['GET', 'POST'])
+@limitar('pedidos')
 def checkout():
     """Proceso de checkout"""
-    from models import Producto, Pedido, Afiliado
-    from app import db
 
     carrito = session.get('carrito', [])
 
@@ -236,24 +298,9 @@ def checkout():
         return redirect(url_for('tienda.index'))
 
     # Calcular total
-    productos_pedido = []
-    total = Decimal('0.00')
-
-    for item in carrito:
-        producto = Producto.query.get(item['id'])
-        if producto and producto.activo:
-            precio = producto.precio_venta()
-            subtotal = precio * item['cantidad']
-
-            productos_pedido.append({
-                'id': producto.id,
-                'nombre': producto.nombre,
-                'cantidad': item['cantidad'],
-                'precio': float(precio),
-                'subtotal': float(subtotal)
-            })
-
-            total += subtotal
+    cotizacion = cotizar_carrito(carrito)
+    productos_pedido = cotizacion.productos_json()
+    total = cotizacion.total
 
     if request.method == 'POST':
         nombre = request.form.get('nombre')
@@ -265,29 +312,32 @@ def checkout():
             flash('Por favor completa todos los campos', 'error')
             return render_template('tienda/checkout.html',
                                  productos=productos_pedido,
-                                 total=total)
+                                 total=total,
+                                 total_con_paypal=cotizacion.total_con_paypal,
+                                 recargo_paypal=cotizacion.recargo_paypal,
+                                 comision_paypal=cotizacion.comision_paypal,
+                                 afiliado_codigo=session.get('afiliado_codigo'))
 
         # Obtener afiliado si existe en sesión
-        afiliado_id = None
         afiliado_codigo = session.get('afiliado_codigo')
-        if afiliado_codigo:
-            afiliado = Afiliado.query.filter_by(codigo=afiliado_codigo, activo=True).first()
-            if afiliado:
-                afiliado_id = afiliado.id
-
-        # Crear pedido
-        pedido = Pedido(
-            cliente_nombre=nombre,
-            cliente_telefono=telefono,
-            cliente_direccion=direccion,
-            productos_json=productos_pedido,
-            total=total,
-            afiliado_id=afiliado_id,
-            estado='pendiente'
-        )
-
-        db.session.add(pedido)
-        db.session.commit()
+        vendedor = obtener_vendedor(afiliado_codigo)
+
+        # Crear pedido (o dejarlo en la cola en modo alta demanda)
+        try:
+            pedido = _registrar_pedido(nombre, telefono, direccion, productos_pedido, total,
+                                       vendedor.id if vendedor else None)
+        except ColaLlena:
+            flash('Hay muchos pedidos en este momento, intenta de nuevo en unos segundos', 'error')
+            respuesta = make_response(render_template('tienda/checkout.html',
+                                 productos=productos_pedido,
+                                 total=total,
+                                 total_con_paypal=cotizacion.total_con_paypal,
+                                 recargo_paypal=cotizacion.recargo_paypal,
+                                 comision_paypal=cotizacion.comision_paypal,
+                                 afiliado_codigo=afiliado_codigo,
+                                 vendedor=vendedor), 503)
+            respuesta.headers['Retry-After'] = str(REINTENTAR_EN)
+            return respuesta
 
         # Limpiar carrito
         session['carrito'] = []
@@ -303,20 +353,10 @@ def checkout():
         mensaje += f"👤 {nombre}\n"
         mensaje += f"📱 {telefono}\n"
         mensaje += f"📍 {direccion}\n\n"
-        mensaje += f"Pedido #{pedido.id}"
+        mensaje += f"Pedido #{pedido.id}" if pedido.id else f"Pedido ref. {pedido.referencia}"
 
         # URL de WhatsApp - usar del vendedor si existe, sino del admin
-        whatsapp_numero = current_app.config['WHATSAPP_NUMBER']
-        if afiliado_codigo:
-            afiliado = Afiliado.query.filter_by(codigo=afiliado_codigo, activo=True).first()
-            if afiliado and afiliado.whatsapp:
-                whatsapp_numero = afiliado.whatsapp
-        
-        # Formatear número
-        if whatsapp_numero.startswith('0'):
-            whatsapp_numero = '593' + whatsapp_numero[1:]
-        elif not whatsapp_numero.startswith('+') and not whatsapp_numero.startswith('593'):
-            whatsapp_numero = '593' + whatsapp_numero
+        whatsapp_numero = vendedor.whatsapp if vendedor else whatsapp_tienda()
 
         import urllib.parse
         mensaje_encoded = urllib.parse.quote(mensaje)
@@ -327,33 +367,24 @@ def checkout():
                              whatsapp_url=whatsapp_url,
                              mensaje=mensaje)
 
-    # Calcular total con comisión PayPal (5.4%)
-    comision_paypal = Decimal('5.4')
-    total_con_paypal = total * (Decimal('1') + (comision_paypal / Decimal('100')))
-    recargo_paypal = total_con_paypal - total
-
     # Obtener código de vendedor si existe
     afiliado_codigo = session.get('afiliado_codigo')
-    vendedor = None
-    if afiliado_codigo:
-        vendedor = Afiliado.query.filter_by(codigo=afiliado_codigo, activo=True).first()
+    vendedor = obtener_vendedor(afiliado_codigo)
 
     return render_template('tienda/checkout.html',
                          productos=productos_pedido,
                          total=total,
-                         total_con_paypal=total_con_paypal,
-                         recargo_paypal=recargo_paypal,
-                         comision_paypal=comision_paypal,
+                         total_con_paypal=cotizacion.total_con_paypal,
+                         recargo_paypal=cotizacion.recargo_paypal,
+                         comision_paypal=cotizacion.comision_paypal,
                          afiliado_codigo=afiliado_codigo,
                          vendedor=vendedor)
 
 
 @bp.route('/api/crear-pedido', methods=['POST'])
+@limitar('pedidos')
 def api_crear_pedido():
     """API para crear pedido desde SPA (sin recargar página)"""
-    from models import Producto, Pedido, Afiliado
-    from app import db
-
     try:
         data = request.get_json()
 
@@ -370,60 +401,48 @@ def api_crear_pedido():
             return {'success': False, 'error': 'El carrito está vacío'}, 400
 
         # Calcular total y preparar productos
-        productos_pedido = []
-        total = Decimal('0.00')
-
-        for item in carrito:
-            producto = Producto.query.get(item['id'])
-            if producto and producto.activo:
-                precio = producto.precio_venta()
-                cantidad = item['cantidad']
-                subtotal = precio * cantidad
-
-                productos_pedido.append({
-                    'id': producto.id,
-                    'nombre': producto.nombre,
-                    'cantidad': cantidad,
-                    'precio': float(precio),
-                    'subtotal': float(subtotal)
-                })
-
-                total += subtotal
+        cotizacion = cotizar_carrito(carrito)
+        productos_pedido = cotizacion.productos_json()
+        total = cotizacion.total
 
         # Obtener afiliado si existe en sesión
-        afiliado_id = None
         afiliado_codigo = session.get('afiliado_codigo')
-        if afiliado_codigo:
-            afiliado = Afiliado.query.filter_by(codigo=afiliado_codigo, activo=True).first()
-            if afiliado:
-                afiliado_id = afiliado.id
+        vendedor = obtener_vendedor(afiliado_codigo)
+        afiliado_id = vendedor.id if vendedor else None
 
-        # Crear pedido
-        pedido = Pedido(
-            cliente_nombre=nombre,
-            cliente_telefono=telefono,
-            cliente_direccion=direccion,
-            productos_json=productos_pedido,
-            total=total,
-            afiliado_id=afiliado_id,
-            estado='pendiente'
-        )
-
-        db.session.add(pedido)
-        db.session.commit()
+        # Crear pedido (o dejarlo en la cola en modo alta demanda)
+        pedido = _registrar_pedido(nombre, telefono, direccion, productos_pedido, total, afiliado_id)
 
         return {
             'success': True,
             'pedido_id': pedido.id,
+            'referencia': pedido.referencia,
+            'en_cola': pedido.id is None,
             'total': float(total),
             'afiliado_codigo': afiliado_codigo
-        }, 200
+        }, 200 if pedido.id else 202
+
+    except ColaLlena:
+        return {'success': False, 'error': 'Hay muchos pedidos en este momento, intenta de nuevo en unos segundos'}, \
+            503, {'Retry-After': str(REINTENTAR_EN)}
 
     except Exception as e:
         db.session.rollback()
         return {'success': False, 'error': str(e)}, 500
 
 
+@bp.route('/api/pedidos/estado/<referencia>')
+def api_estado_pedido(referencia):
+    """Estado de un pedido de la cola (la confirmación consulta hasta tener número)"""
+    estado = estado_pedido(referencia)
+    if estado is None:
+        return jsonify({'error': 'Pedido no encontrado'}), 404
+
+    respuesta = jsonify({'referencia': referencia, **estado})
+    respuesta.headers['Cache-Control'] = 'no-store'
+    return respuesta
+
+
 @bp.route('/unete')
 def unete():
     """Página para unirse como afiliado"""
@@ -440,36 +459,10 @@ def unete():
 
 # ==================== PAYPAL INTEGRATION ====================
 
-def get_paypal_access_token():
-    """Obtener token de acceso de PayPal"""
-    client_id = current_app.config['PAYPAL_CLIENT_ID']
-    client_secret = current_app.config['PAYPAL_SECRET']
-    mode = current_app.config['PAYPAL_MODE']
-
-    if mode == 'live':
-        url = "https://api-m.paypal.com/v1/oauth2/token"
-    else:
-        url = "https://api-m.sandbox.paypal.com/v1/oauth2/token"
-
-    auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
-
-    headers = {
-        "Authorization": f"Basic {auth}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-
-    response = requests.post(url, headers=headers, data="grant_type=client_credentials")
-
-    if response.status_code == 200:
-        return response.json()['access_token']
-    return None
-
-
 @bp.route('/api/paypal/create-order', methods=['POST'])
+@limitar('paypal')
 def paypal_create_order():
     """Crear orden de PayPal"""
-    from models import Producto
-
     try:
         data = request.get_json()
         carrito = data.get('carrito', [])
@@ -477,57 +470,10 @@ def paypal_create_order():
         if not carrito:
             return jsonify({'error': 'Carrito vacío'}), 400
 
-        # Calcular total
-        total = Decimal('0.00')
-        items = []
-
-        for item in carrito:
-            producto = Producto.query.get(item['id'])
-            if producto and producto.activo:
-                precio = producto.precio_venta()
-                cantidad = item['cantidad']
-                subtotal = precio * cantidad
-                total += subtotal
-
-                items.append({
-                    "name": producto.nombre[:127],
-                    "quantity": str(cantidad),
-                    "unit_amount": {
-                        "currency_code": "USD",
-                        "value": f"{float(precio):.2f}"
-                    }
-                })
-
-        # Agregar comisión PayPal (5.4%)
-        comision_paypal = Decimal('5.4')
-        total_con_comision = total * (Decimal('1') + (comision_paypal / Decimal('100')))
-        recargo_paypal = total_con_comision - total
-
-        # Agregar el recargo como item separado en PayPal
-        items.append({
-            "name": f"Comisión PayPal/Tarjeta ({comision_paypal}%)",
-            "quantity": "1",
-            "unit_amount": {
-                "currency_code": "USD",
-                "value": f"{float(recargo_paypal):.2f}"
-            }
-        })
-
-        # Obtener token de PayPal
-        access_token = get_paypal_access_token()
-        if not access_token:
-            return jsonify({'error': 'Error de autenticación con PayPal'}), 500
-
-        mode = current_app.config['PAYPAL_MODE']
-        if mode == 'live':
-            url = "https://api-m.paypal.com/v2/checkout/orders"
-        else:
-            url = "https://api-m.sandbox.paypal.com/v2/checkout/orders"
-
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        # Calcular total (el recargo de PayPal va como item separado)
+        cotizacion = cotizar_carrito(carrito)
+        total_con_comision = cotizacion.total_con_paypal
+        items = cotizacion.items_paypal()
 
         order_data = {
             "intent": "CAPTURE",
@@ -546,21 +492,28 @@ def paypal_create_order():
             }]
         }
 
-        response = requests.post(url, headers=headers, json=order_data)
+        # Token OAuth cacheado (no se pide uno nuevo en cada checkout)
+        response = post_api('/v2/checkout/orders', id_solicitud=str(uuid.uuid4()), json=order_data)
+        if response is None:
+            return jsonify({'error': 'Error de autenticación con PayPal'}), 500
 
         if response.status_code in [200, 201]:
             return jsonify(response.json())
         else:
             return jsonify({'error': 'Error creando orden en PayPal'}), 500
 
+    except PayPalNoDisponible:
+        return jsonify({'error': 'PayPal no responde, intenta de nuevo en unos minutos'}), 503
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @bp.route('/api/paypal/capture-order', methods=['POST'])
+@limitar('paypal')
 def paypal_capture_order():
     """Capturar pago de PayPal y crear pedido"""
-    from models import Producto, Pedido, Afiliado
+    from models import Pedido
     from app import db
 
     try:
@@ -575,23 +528,11 @@ def paypal_capture_order():
             return jsonify({'error': 'Datos incompletos'}), 400
 
         # Capturar el pago en PayPal
-        access_token = get_paypal_access_token()
-        if not access_token:
+        # Id único por intento del cliente: los reintentos internos no capturan dos veces
+        response = post_api(f'/v2/checkout/orders/{order_id}/capture', id_solicitud=str(uuid.uuid4()))
+        if response is None:
             return jsonify({'error': 'Error de autenticación con PayPal'}), 500
 
-        mode = current_app.config['PAYPAL_MODE']
-        if mode == 'live':
-            url = f"https://api-m.paypal.com/v2/checkout/orders/{order_id}/capture"
-        else:
-            url = f"https://api-m.sandbox.paypal.com/v2/checkout/orders/{order_id}/capture"
-
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
-        response = requests.post(url, headers=headers)
-
         if response.status_code not in [200, 201]:
             return jsonify({'error': 'Error capturando pago'}), 500
 
@@ -600,40 +541,17 @@ def paypal_capture_order():
         if paypal_response.get('status') != 'COMPLETED':
             return jsonify({'error': 'Pago no completado'}), 400
 
-        # Calcular total y preparar productos
-        productos_pedido = []
-        total = Decimal('0.00')
-
-        for item in carrito:
-            producto = Producto.query.get(item['id'])
-            if producto and producto.activo:
-                precio = producto.precio_venta()
-                cantidad = item['cantidad']
-                subtotal = precio * cantidad
-
-                productos_pedido.append({
-                    'id': producto.id,
-                    'nombre': producto.nombre,
-                    'cantidad': cantidad,
-                    'precio': float(precio),
-                    'subtotal': float(subtotal)
-                })
-
-                total += subtotal
-
-        # Calcular total con comisión PayPal (5.4%)
-        comision_paypal = Decimal('5.4')
-        total_con_comision = total * (Decimal('1') + (comision_paypal / Decimal('100')))
+        # Calcular total con comisión PayPal y preparar productos
+        cotizacion = cotizar_carrito(carrito)
+        productos_pedido = cotizacion.productos_json()
+        total_con_comision = cotizacion.total_con_paypal
 
         # Obtener afiliado si existe
-        afiliado_id = None
         afiliado_codigo = session.get('afiliado_codigo')
-        if afiliado_codigo:
-            afiliado = Afiliado.query.filter_by(codigo=afiliado_codigo, activo=True).first()
-            if afiliado:
-                afiliado_id = afiliado.id
+        vendedor = obtener_vendedor(afiliado_codigo)
+        afiliado_id = vendedor.id if vendedor else None
 
-        # Crear pedido marcado como pagado (PayPal ya procesó el pago)
+        # Crear pedido (PayPal ya procesó el pago)
         # Guardamos el total CON comisión PayPal ya que ese es el monto que se cobró
         pedido = Pedido(
             cliente_nombre=nombre,
@@ -641,21 +559,16 @@ def paypal_capture_order():
             cliente_direccion=direccion,
             productos_json=productos_pedido,
             total=total_con_comision,  # Total con comisión PayPal
-            afiliado_id=afiliado_id,
-            estado='pagado'  # Ya está pagado con PayPal
+            afiliado_id=afiliado_id
         )
-
         db.session.add(pedido)
-        db.session.commit()
 
-        # Si tiene vendedor, marcar como pagado y validar automáticamente
+        # Pedido, pago y comisión en una sola transacción: todo o nada
+        pedido.marcar_como_pagado(commit=False)
         if afiliado_id:
-            pedido.marcar_como_pagado()
             # Validar automáticamente para que admin lo vea (PayPal es pago confirmado)
-            pedido.validar_para_admin()
-        else:
-            # Pedido sin vendedor (tienda principal), solo marcar como pagado
-            pedido.marcar_como_pagado()
+            pedido.validar_para_admin(commit=False)
+        db.session.commit()
 
         # Limpiar carrito de sesión
         session['carrito'] = []
@@ -667,6 +580,9 @@ def paypal_capture_order():
             'paypal_transaction_id': paypal_response.get('id')
         })
 
+    except PayPalNoDisponible:
+        return jsonify({'error': 'PayPal no responde, intenta de nuevo en unos minutos'}), 503
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -685,25 +601,15 @@ def pedido_exitoso(pedido_id):
 @bp.route('/api/get-vendedor-whatsapp')
 def get_vendedor_whatsapp():
     """Obtener WhatsApp del vendedor por código"""
-    from models import Afiliado
-    
     codigo = request.args.get('codigo')
     if not codigo:
         return jsonify({'error': 'Código no proporcionado'}), 400
     
-    vendedor = Afiliado.query.filter_by(codigo=codigo, activo=True).first()
+    vendedor = obtener_vendedor(codigo)
     if not vendedor:
         return jsonify({'error': 'Vendedor no encontrado'}), 404
     
-    whatsapp = vendedor.whatsapp or current_app.config.get('WHATSAPP_NUMBER', '')
-    
-    # Formatear número
-    if whatsapp.startswith('0'):
-        whatsapp = '593' + whatsapp[1:]
-    elif not whatsapp.startswith('+') and not whatsapp.startswith('593'):
-        whatsapp = '593' + whatsapp
-    
-    return jsonify({'whatsapp': whatsapp})
+    return jsonify({'whatsapp': vendedor.whatsapp})
 
 
 # ==================== TIENDA DE VENDEDOR ====================
@@ -711,96 +617,77 @@ def get_vendedor_whatsapp():
 @bp.route('/vendedor/<codigo>')
 def tienda_vendedor(codigo):
     """Tienda del vendedor (afiliado)"""
-    from models import Producto, Afiliado, CATEGORIAS_PRODUCTO
-    from sqlalchemy import func
-
     # Verificar que el vendedor existe y está activo
-    vendedor = Afiliado.query.filter_by(codigo=codigo, activo=True).first_or_404()
+    vendedor = obtener_vendedor(codigo)
+    if not vendedor:
+        abort(404)
     
     # Guardar código en sesión para el checkout
     session['afiliado_codigo'] = codigo
     session.permanent = True
 
-    # Obtener productos activos
-    productos_db = Producto.query.filter_by(activo=True).order_by(Producto.creado_en.desc()).all()
-
-    # Obtener categorías que tienen productos activos
-    categorias_con_productos = db.session.query(
-        Producto.categoria,
-        func.count(Producto.id).label('count')
-    ).filter(Producto.activo == True).group_by(Producto.categoria).all()
-
-    # Crear diccionario de categorías con sus conteos
-    categorias_activas = {}
-    for cat, count in categorias_con_productos:
-        if cat:
-            nombre_cat = cat
-            for valor, nombre in CATEGORIAS_PRODUCTO:
-                if valor == cat:
-                    nombre_cat = nombre
-                    break
-            categorias_activas[cat] = {'nombre': nombre_cat, 'count': count}
-
-    # Convertir productos a diccionarios para JSON
-    productos = []
-    for p in productos_db:
-        todas_imagenes = p.obtener_todas_imagenes()
-        productos.append({
-            'id': p.id,
-            'nombre': p.nombre,
-            'descripcion': p.descripcion,
-            'categoria': p.categoria or 'otros',
-            'precio_final': float(p.precio_final),
-            'precio_oferta': float(p.precio_oferta) if p.precio_oferta else None,
-            'imagen': todas_imagenes[0] if todas_imagenes else None,
-            'imagenes': todas_imagenes
-        })
+    # Snapshot del catálogo (productos activos, categorías e imágenes)
+    catalogo = obtener_catalogo()
 
     # WhatsApp del vendedor
-    whatsapp_numero = vendedor.whatsapp or current_app.config.get('WHATSAPP_NUMBER', '')
-    if whatsapp_numero.startswith('0'):
-        whatsapp_numero = '593' + whatsapp_numero[1:]
-    elif not whatsapp_numero.startswith('+') and not whatsapp_numero.startswith('593'):
-        whatsapp_numero = '593' + whatsapp_numero
+    whatsapp_numero = vendedor.whatsapp
+
+    # Si el navegador ya tiene esta versión, no renderizar
+    etag = etag_pagina('vendedor', codigo, whatsapp_numero, catalogo.sello)
+    no_cambio = no_modificado(etag, catalogo.ultima_modificacion)
+    if no_cambio:
+        return no_cambio
 
-    return render_template('tienda/index.html',
+    def renderizar():
+        productos, siguiente_cursor = catalogo.primera_pagina(current_app.config['CATALOGO_POR_PAGINA'])
+        return render_template('tienda/index.html',
                          productos=productos,
-                         productos_db=productos_db,
-                         categorias=categorias_activas,
+                         siguiente_cursor=siguiente_cursor,
+                         total_productos=len(catalogo.productos),
+                         categorias=catalogo.categorias,
                          afiliado_codigo=codigo,
                          whatsapp_numero=whatsapp_numero,
                          vendedor=vendedor,
                          es_tienda_vendedor=True)
 
+    # Misma versión del catálogo + mismo vendedor = mismo HTML
+    clave = ('vendedor', catalogo.version, codigo, whatsapp_numero)
+    respuesta = make_response(_pagina_cacheada(clave, renderizar))
+    return con_validadores(respuesta, etag, catalogo.ultima_modificacion)
+
 
 @bp.route('/vendedor/<codigo>/producto/<int:id>')
 def producto_vendedor(id, codigo):
     """Detalle de producto en tienda del vendedor"""
-    from models import Producto, Afiliado
+    from models import Producto
 
     # Verificar que el vendedor existe y está activo
-    vendedor = Afiliado.query.filter_by(codigo=codigo, activo=True).first_or_404()
+    vendedor = obtener_vendedor(codigo)
+    if not vendedor:
+        abort(404)
     
     # Guardar código en sesión
     session['afiliado_codigo'] = codigo
     session.permanent = True
 
+    # WhatsApp del vendedor
+    whatsapp_numero = vendedor.whatsapp
+
     producto = Producto.query.get_or_404(id)
 
     if not producto.activo:
         flash('Este producto no está disponible', 'error')
         return redirect(url_for('tienda.tienda_vendedor', codigo=codigo))
 
-    # WhatsApp del vendedor
-    whatsapp_numero = vendedor.whatsapp or current_app.config.get('WHATSAPP_NUMBER', '')
-    if whatsapp_numero.startswith('0'):
-        whatsapp_numero = '593' + whatsapp_numero[1:]
-    elif not whatsapp_numero.startswith('+') and not whatsapp_numero.startswith('593'):
-        whatsapp_numero = '593' + whatsapp_numero
+    etag = etag_pagina('producto', id, codigo, whatsapp_numero, producto.actualizado_en.isoformat())
+    no_cambio = no_modificado(etag, producto.actualizado_en)
+    if no_cambio:
+        return no_cambio
 
-    return render_template('tienda/producto.html',
+    respuesta = make_response(render_template('tienda/producto.html',
                          producto=producto,
                          afiliado_codigo=codigo,
                          whatsapp_numero=whatsapp_numero,
                          vendedor=vendedor,
-                         es_tienda_vendedor=True)
+                         es_tienda_vendedor=True))
+    return con_validadores(respuesta, etag, producto.actualizado_en)
@@ -0,0 +1 @@
+# Este archivo hace que 'services' sea un paquete Python
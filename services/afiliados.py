@@ -0,0 +1,115 @@
+"""
+Servicio de contexto de vendedores
+Resuelve códigos de afiliado desde memoria, con el WhatsApp ya normalizado
+"""
+
+import threading
+import time
+
+from flask import current_app
+
+
+def normalizar_whatsapp(numero):
+    """Asegurar formato internacional (sin el 0 inicial, con código de país)"""
+    numero = numero or ''
+    if numero.startswith('0'):
+        return '593' + numero[1:]  # Ecuador
+    if not numero.startswith('+') and not numero.startswith('593'):
+        return '593' + numero
+    return numero
+
+
+def whatsapp_tienda():
+    """WhatsApp del admin (Shop Fusion) en formato internacional"""
+    return normalizar_whatsapp(current_app.config.get('WHATSAPP_NUMBER', ''))
+
+
+class ContextoVendedor:
+    """Datos de un afiliado que necesita la tienda pública (no modificar)"""
+
+    def __init__(self, id, codigo, activo, whatsapp, porcentaje_comision):
+        self.id = id
+        self.codigo = codigo
+        self.activo = activo
+        self.whatsapp = whatsapp  # Normalizado; WhatsApp de la tienda si no tiene
+        self.porcentaje_comision = porcentaje_comision
+
+    def __repr__(self):
+        return f'<ContextoVendedor {self.codigo}>'
+
+
+# Mapa codigo -> ContextoVendedor del proceso
+_lock = threading.Lock()
+_vendedores = None
+_sello = None  # (cantidad, último actualizado_en) de la tabla al cargar el mapa
+_verificado_en = 0.0
+
+
+def invalidar_afiliados():
+    """Descartar el mapa de vendedores (llamar después de modificar un afiliado)"""
+    global _vendedores
+    with _lock:
+        _vendedores = None
+
+
+def _sello_afiliados():
+    """Cambia al crear, editar o borrar un afiliado (en cualquier proceso)"""
+    from models import db, Afiliado
+    return tuple(db.session.execute(
+        db.select(db.func.count(Afiliado.id), db.func.max(Afiliado.actualizado_en))
+    ).one())
+
+
+def _cargar_vendedores():
+    """Leer todos los afiliados en una sola consulta"""
+    from models import Afiliado
+
+    filas = Afiliado.query.with_entities(
+        Afiliado.id, Afiliado.codigo, Afiliado.activo,
+        Afiliado.whatsapp, Afiliado.porcentaje_comision
+    ).all()
+
+    tienda = whatsapp_tienda()
+    return {
+        fila.codigo: ContextoVendedor(
+            id=fila.id,
+            codigo=fila.codigo,
+            activo=bool(fila.activo),
+            whatsapp=normalizar_whatsapp(fila.whatsapp) if fila.whatsapp else tienda,
+            porcentaje_comision=fila.porcentaje_comision
+        )
+        for fila in filas
+    }
+
+
+def _mapa_vendedores():
+    """
+    Mapa vigente. Cada AFILIADOS_VERIFICAR_CADA segundos compara el sello de la
+    tabla y relee los afiliados solo si cambió (o si se invalidó en este proceso).
+    """
+    global _vendedores, _sello, _verificado_en
+
+    cada = current_app.config.get('AFILIADOS_VERIFICAR_CADA', 5)
+    vendedores = _vendedores
+    if vendedores is not None and time.monotonic() - _verificado_en < cada:
+        return vendedores
+
+    with _lock:
+        if _vendedores is None or time.monotonic() - _verificado_en >= cada:
+            # El sello antes que los datos: un cambio entre ambas lecturas se relee después
+            sello = _sello_afiliados()
+            if _vendedores is None or sello != _sello:
+                _vendedores = _cargar_vendedores()
+                _sello = sello
+            _verificado_en = time.monotonic()
+        return _vendedores
+
+
+def obtener_vendedor(codigo):
+    """Vendedor activo con ese código, o None"""
+    if not codigo:
+        return None
+    vendedor = _mapa_vendedores().get(codigo)
+    if vendedor is None or not vendedor.activo:
+        return None
+    return vendedor
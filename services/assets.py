@@ -0,0 +1,87 @@
+"""
+Archivos estáticos versionados
+url_for('static', ...) devuelve el nombre con hash del manifiesto generado
+por construir_assets.py, y esos archivos se sirven con caché inmutable y,
+si el navegador lo acepta, con su versión precomprimida (.br / .gz)
+"""
+
+import json
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory
+
+from services.imagenes import LONGITUD_HASH
+
+
+# Subcarpeta de static/ donde construir_assets.py deja los archivos con hash
+CARPETA_BUILD = 'build'
+MANIFIESTO = 'manifest.json'
+
+# Tipos de texto que vale la pena precomprimir (imágenes y video ya vienen comprimidos)
+EXTENSIONES_COMPRIMIBLES = {'css', 'js', 'svg', 'json', 'txt', 'html', 'xml', 'map', 'ico'}
+
+# Versiones precomprimidas en orden de preferencia: (Content-Encoding, sufijo)
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+# Uploads con nombre por hash (originales y derivados): su contenido nunca cambia
+_PATRON_UPLOAD_INMUTABLE = re.compile(
+    r'^uploads/(derivados/)?[0-9a-f]{%d}(-\d+)?\.[a-z0-9]+$' % LONGITUD_HASH
+)
+
+
+def leer_manifiesto(static_folder):
+    """Mapa 'css/style.css' -> 'build/css/style.<hash>.css' (vacío si no se construyó)"""
+    ruta = os.path.join(static_folder, CARPETA_BUILD, MANIFIESTO)
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def es_inmutable(filename):
+    """True si la ruta dentro de static/ incluye el hash de su contenido"""
+    return filename.startswith(CARPETA_BUILD + '/') or bool(_PATRON_UPLOAD_INMUTABLE.match(filename))
+
+
+def servir_static(filename):
+    """Vista de /static: caché inmutable y precomprimidos para archivos con hash"""
+    if not es_inmutable(filename):
+        return current_app.send_static_file(filename)
+
+    carpeta = current_app.static_folder
+    archivo = filename
+    codificacion = None
+    if filename.rsplit('.', 1)[-1].lower() in EXTENSIONES_COMPRIMIBLES:
+        for nombre, sufijo in CODIFICACIONES:
+            if nombre in request.accept_encodings and os.path.isfile(os.path.join(carpeta, filename + sufijo)):
+                archivo, codificacion = filename + sufijo, nombre
+                break
+
+    respuesta = send_from_directory(
+        carpeta, archivo,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    if filename.rsplit('.', 1)[-1].lower() in EXTENSIONES_COMPRIMIBLES:
+        respuesta.vary.add('Accept-Encoding')
+    respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+    return respuesta
+
+
+def iniciar_assets(app):
+    """Usar el manifiesto en url_for('static', ...) y servir /static con servir_static"""
+    manifiesto = leer_manifiesto(app.static_folder)
+    app.extensions['assets_manifiesto'] = manifiesto
+
+    @app.url_defaults
+    def url_versionada(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifiesto:
+            values['filename'] = manifiesto[values['filename']]
+
+    app.view_functions['static'] = servir_static
@@ -0,0 +1,214 @@
+"""
+Servicio de búsqueda de productos
+PostgreSQL: tsvector en español + trigramas (sin acentos)
+SQLite: tabla virtual FTS5 sincronizada con triggers
+Otro motor: LIKE sobre nombre y descripción
+
+Los índices se crean con init_db.py / migrate_db.py (crear_indices_busqueda);
+al arrancar cada worker solo detecta si existen (detectar_busqueda).
+"""
+
+import re
+
+from flask import current_app
+from sqlalchemy import text
+
+
+# Motor detectado al arrancar: 'postgresql', 'fts5' o 'like'
+_motor = 'like'
+
+# Solo letras y números; descarta operadores de tsquery/FTS5 del usuario
+_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+
+_SQL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # unaccent() no es IMMUTABLE; el wrapper permite usarlo en índices
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+    $$ SELECT public.unaccent('public.unaccent', $1) $$
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_productos_busqueda ON productos USING gin (
+        to_tsvector('spanish', f_unaccent(coalesce(nombre, '') || ' ' || coalesce(descripcion, '')))
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_productos_nombre_trgm ON productos
+        USING gin (f_unaccent(lower(nombre)) gin_trgm_ops)
+    """
+]
+
+_SQL_SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+        nombre, descripcion,
+        content='productos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+        INSERT INTO productos_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    # Reconstruir por si la tabla productos se recreó (init_db)
+    "INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')"
+]
+
+
+# Objetos que la búsqueda necesita en cada motor
+_DETECTAR_POSTGRES = """
+    SELECT (SELECT count(*) FROM pg_extension WHERE extname IN ('unaccent', 'pg_trgm')) = 2
+       AND EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'f_unaccent')
+"""
+_DETECTAR_SQLITE = """
+    SELECT count(*) = 4 FROM sqlite_master
+    WHERE name IN ('productos_fts', 'productos_fts_ai', 'productos_fts_ad', 'productos_fts_au')
+"""
+
+
+def crear_indices_busqueda():
+    """
+    Crear (o reconstruir) los índices de búsqueda del motor; retorna el motor.
+    Solo desde init_db.py / migrate_db.py: es DDL y no debe correr en cada worker.
+    Lanza la excepción de la base de datos si no se pudo (sin permisos, sin FTS5).
+    """
+    from models import db
+
+    dialecto = db.engine.dialect.name
+    if dialecto == 'postgresql':
+        sentencias = _SQL_POSTGRES
+    elif dialecto == 'sqlite':
+        sentencias = _SQL_SQLITE
+    else:
+        return 'like'
+
+    try:
+        for sql in sentencias:
+            db.session.execute(text(sql))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return detectar_busqueda()
+
+
+def detectar_busqueda():
+    """Elegir el motor según los objetos que ya existen (llamar dentro de app_context)"""
+    from models import db
+    global _motor
+
+    dialecto = db.engine.dialect.name
+    consultas = {'postgresql': (_DETECTAR_POSTGRES, 'postgresql'), 'sqlite': (_DETECTAR_SQLITE, 'fts5')}
+    if dialecto not in consultas:
+        _motor = 'like'
+        return _motor
+
+    sql, motor = consultas[dialecto]
+    try:
+        existe = bool(db.session.execute(text(sql)).scalar())
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f'No se pudo detectar el índice de búsqueda: {e}')
+        existe = False
+
+    if not existe:
+        current_app.logger.info('Búsqueda con LIKE: ejecuta python migrate_db.py para crear el índice de texto completo')
+    _motor = motor if existe else 'like'
+    return _motor
+
+
+def _palabras(consulta):
+    """Separar la consulta en palabras seguras para el motor"""
+    return _PALABRA.findall(consulta.lower())[:10]
+
+
+def _buscar_postgres(palabras, limite):
+    from models import db
+
+    # Prefijo en cada palabra para buscar mientras se escribe
+    tsquery = ' & '.join(f'{p}:*' for p in palabras)
+    frase = ' '.join(palabras)
+
+    filas = db.session.execute(text("""
+        SELECT id,
+               ts_rank(
+                   to_tsvector('spanish', f_unaccent(coalesce(nombre, '') || ' ' || coalesce(descripcion, ''))),
+                   to_tsquery('spanish', f_unaccent(:tsquery))
+               ) + similarity(f_unaccent(lower(nombre)), f_unaccent(:frase)) AS rango
+        FROM productos
+        WHERE activo = true
+          AND (
+              to_tsvector('spanish', f_unaccent(coalesce(nombre, '') || ' ' || coalesce(descripcion, '')))
+                  @@ to_tsquery('spanish', f_unaccent(:tsquery))
+              OR f_unaccent(lower(nombre)) % f_unaccent(:frase)
+          )
+        ORDER BY rango DESC, id DESC
+        LIMIT :limite
+    """), {'tsquery': tsquery, 'frase': frase, 'limite': limite})
+
+    return [fila.id for fila in filas]
+
+
+def _buscar_fts5(palabras, limite):
+    from models import db
+
+    # FTS5 no trae stemming en español; el prefijo cubre plurales y derivados
+    match = ' '.join(f'"{p}"*' for p in palabras)
+
+    filas = db.session.execute(text("""
+        SELECT p.id
+        FROM productos_fts
+        JOIN productos p ON p.id = productos_fts.rowid
+        WHERE productos_fts MATCH :match AND p.activo = 1
+        ORDER BY bm25(productos_fts, 10.0, 1.0), p.id DESC
+        LIMIT :limite
+    """), {'match': match, 'limite': limite})
+
+    return [fila.id for fila in filas]
+
+
+def _buscar_like(palabras, limite):
+    from models import db, Producto
+
+    query = Producto.query.with_entities(Producto.id).filter(Producto.activo == True)
+    for palabra in palabras:
+        patron = f'%{palabra}%'
+        query = query.filter(db.or_(
+            Producto.nombre.ilike(patron),
+            Producto.descripcion.ilike(patron)
+        ))
+
+    return [fila.id for fila in query.order_by(Producto.creado_en.desc()).limit(limite)]
+
+
+def buscar_ids(consulta, limite):
+    """Ids de productos activos que coinciden con la consulta, ordenados por relevancia"""
+    palabras = _palabras(consulta)
+    if not palabras:
+        return []
+
+    if _motor == 'postgresql':
+        return _buscar_postgres(palabras, limite)
+    if _motor == 'fts5':
+        return _buscar_fts5(palabras, limite)
+    return _buscar_like(palabras, limite)
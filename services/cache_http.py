@@ -0,0 +1,69 @@
+"""
+GET condicional (ETag / Last-Modified) para las páginas de la tienda
+Permite responder 304 sin renderizar Jinja (y en los listados, que salen del
+snapshot del catálogo, sin consultar la base de datos)
+"""
+
+import hashlib
+from datetime import timezone
+
+from flask import current_app, g, request, session
+
+
+def etag_pagina(*partes):
+    """
+    ETag de una página a partir de sus dependencias.
+    Siempre incluye el despliegue (plantillas) y el usuario logueado (navbar).
+    """
+    partes = (current_app.config['VERSION_DESPLIEGUE'], session.get('_user_id', '')) + partes
+    return hashlib.md5('|'.join(str(p) for p in partes).encode()).hexdigest()
+
+
+def _hay_mensajes_pendientes():
+    """
+    Los mensajes flash cambian el HTML; esas respuestas no se validan.
+    Se anota en `g` antes de renderizar: get_flashed_messages() los saca de la sesión.
+    """
+    if '_flashes' in session:
+        g.habia_mensajes = True
+    return g.get('habia_mensajes', False)
+
+
+def _utc(fecha):
+    """Las fechas del modelo se guardan en UTC sin zona horaria"""
+    if fecha is None:
+        return None
+    return fecha.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def no_modificado(etag, ultima_modificacion=None):
+    """Respuesta 304 si el navegador ya tiene esta versión; None si hay que renderizar"""
+    if _hay_mensajes_pendientes():
+        return None
+
+    # If-None-Match tiene prioridad sobre If-Modified-Since
+    if request.if_none_match:
+        # Comparación débil: con compresión el ETag se envía como W/"..."
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif request.if_modified_since and ultima_modificacion:
+        if _utc(ultima_modificacion) > request.if_modified_since:
+            return None
+    else:
+        return None
+
+    respuesta = current_app.response_class(status=304)
+    return con_validadores(respuesta, etag, ultima_modificacion)
+
+
+def con_validadores(respuesta, etag, ultima_modificacion=None):
+    """Agregar ETag, Last-Modified y Cache-Control a una respuesta de la tienda"""
+    if _hay_mensajes_pendientes() and respuesta.status_code != 304:
+        return respuesta
+
+    respuesta.set_etag(etag)
+    if ultima_modificacion:
+        respuesta.last_modified = _utc(ultima_modificacion)
+    # El navegador puede guardar la página pero debe revalidar siempre
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
@@ -0,0 +1,109 @@
+"""
+Caché de páginas renderizadas de la tienda
+LRU en memoria con límite de entradas y de bytes, por proceso
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app, session
+
+
+class PaginaCacheada:
+    """HTML renderizado de una página"""
+
+    def __init__(self, clave, cuerpo):
+        self.clave = clave
+        self.cuerpo = cuerpo  # bytes UTF-8
+        self.comprimidos = {}  # {'br' | 'gzip': bytes}
+
+    @property
+    def tamano(self):
+        return len(self.cuerpo) + sum(len(datos) for datos in self.comprimidos.values())
+
+
+class CachePaginas:
+    """LRU de páginas con tope de entradas y de memoria"""
+
+    def __init__(self, max_entradas, max_bytes):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._paginas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """Página cacheada o None; marca la entrada como usada recientemente"""
+        with self._lock:
+            pagina = self._paginas.get(clave)
+            if pagina is None:
+                self.fallos += 1
+                return None
+            self._paginas.move_to_end(clave)
+            self.aciertos += 1
+            return pagina
+
+    def guardar(self, clave, cuerpo):
+        """Guardar el HTML de una página y expulsar las menos usadas si hace falta"""
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode('utf-8')
+        pagina = PaginaCacheada(clave, cuerpo)
+
+        with self._lock:
+            anterior = self._paginas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior.tamano
+
+            if pagina.tamano <= self.max_bytes:
+                self._paginas[clave] = pagina
+                self._bytes += pagina.tamano
+                self._expulsar()
+
+        return pagina
+
+    def variante(self, pagina, codificacion, comprimir):
+        """Versión comprimida de una página; se calcula una sola vez y cuenta para el límite de bytes"""
+        datos = pagina.comprimidos.get(codificacion)
+        if datos is not None:
+            return datos
+
+        datos = comprimir()
+        with self._lock:
+            if codificacion not in pagina.comprimidos:
+                pagina.comprimidos[codificacion] = datos
+                if self._paginas.get(pagina.clave) is pagina:
+                    self._bytes += len(datos)
+                    self._expulsar()
+        return datos
+
+    def _expulsar(self):
+        while self._paginas and (len(self._paginas) > self.max_entradas or self._bytes > self.max_bytes):
+            _, pagina = self._paginas.popitem(last=False)
+            self._bytes -= pagina.tamano
+
+    def __len__(self):
+        return len(self._paginas)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache_paginas():
+    """Caché de páginas del proceso (se crea con los límites de Config)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CachePaginas(
+                    current_app.config['PAGINAS_CACHE_MAX_ENTRADAS'],
+                    current_app.config['PAGINAS_CACHE_MAX_BYTES']
+                )
+    return _cache
+
+
+def pagina_cacheable():
+    """Solo visitantes anónimos sin mensajes flash ven el mismo HTML"""
+    return not session.get('_user_id') and '_flashes' not in session
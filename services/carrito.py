@@ -0,0 +1,123 @@
+"""
+Servicio de cotización del carrito
+Resuelve todas las líneas del carrito con una sola consulta y calcula totales
+"""
+
+from decimal import Decimal
+
+from flask import current_app
+
+
+class LineaCarrito:
+    """Línea del carrito con precio de venta y costo vigentes"""
+
+    def __init__(self, producto, cantidad):
+        self.producto = producto
+        self.cantidad = cantidad
+        self.precio = producto.precio_venta()
+        self.costo = producto.precio_proveedor
+        self.margen = producto.calcular_margen()  # Unitario
+        self.subtotal = self.precio * cantidad
+
+    def a_dict(self):
+        """Formato guardado en Pedido.productos_json"""
+        return {
+            'id': self.producto.id,
+            'nombre': self.producto.nombre,
+            'cantidad': self.cantidad,
+            'precio': float(self.precio),
+            'subtotal': float(self.subtotal),
+            # Costo y margen al momento de la venta: la comisión no depende
+            # de cambios posteriores en precio_proveedor
+            'costo': float(self.costo),
+            'margen': float(self.margen)
+        }
+
+    def item_paypal(self):
+        """Formato de item para la API de órdenes de PayPal"""
+        return {
+            "name": self.producto.nombre[:127],
+            "quantity": str(self.cantidad),
+            "unit_amount": {
+                "currency_code": "USD",
+                "value": f"{float(self.precio):.2f}"
+            }
+        }
+
+
+class CarritoCotizado:
+    """Resultado de cotizar un carrito: líneas válidas y totales"""
+
+    def __init__(self, lineas):
+        self.lineas = lineas
+        self.total = sum((linea.subtotal for linea in lineas), Decimal('0.00'))
+
+    @property
+    def comision_paypal(self):
+        """Porcentaje que se recarga al pagar con PayPal/tarjeta"""
+        return current_app.config['PAYPAL_COMISION_PORCENTAJE']
+
+    @property
+    def total_con_paypal(self):
+        return self.total * (Decimal('1') + (self.comision_paypal / Decimal('100')))
+
+    @property
+    def recargo_paypal(self):
+        return self.total_con_paypal - self.total
+
+    def productos_json(self):
+        """Líneas en el formato de Pedido.productos_json"""
+        return [linea.a_dict() for linea in self.lineas]
+
+    def items_paypal(self):
+        """Items de la orden de PayPal, incluyendo el recargo como item aparte"""
+        items = [linea.item_paypal() for linea in self.lineas]
+        items.append({
+            "name": f"Comisión PayPal/Tarjeta ({self.comision_paypal}%)",
+            "quantity": "1",
+            "unit_amount": {
+                "currency_code": "USD",
+                "value": f"{float(self.recargo_paypal):.2f}"
+            }
+        })
+        return items
+
+    def __bool__(self):
+        return bool(self.lineas)
+
+    def __len__(self):
+        return len(self.lineas)
+
+
+def cotizar_carrito(carrito):
+    """
+    Cotizar un carrito [{id, cantidad}] (sesión o JSON del navegador).
+    Una sola consulta IN (...) para todos los productos; se ignoran
+    productos inactivos o inexistentes y cantidades inválidas.
+    """
+    from models import Producto
+
+    items = []
+    for item in carrito or []:
+        try:
+            producto_id = int(item['id'])
+            cantidad = int(item['cantidad'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if cantidad > 0:
+            items.append((producto_id, cantidad))
+
+    if not items:
+        return CarritoCotizado([])
+
+    ids = {producto_id for producto_id, _ in items}
+    productos = {
+        p.id: p for p in Producto.query.filter(Producto.id.in_(ids), Producto.activo == True)
+    }
+
+    lineas = [
+        LineaCarrito(productos[producto_id], cantidad)
+        for producto_id, cantidad in items
+        if producto_id in productos
+    ]
+    return CarritoCotizado(lineas)
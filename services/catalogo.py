@@ -0,0 +1,251 @@
+"""
+Servicio de catálogo
+Snapshot inmutable y versionado de los productos activos de la tienda
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+
+
+# Ordenamientos soportados por la API de productos
+ORDENES_PRODUCTOS = ('recientes', 'precio_asc', 'precio_desc', 'nombre')
+
+# Rangos de precio de venta para facetas: (desde, hasta) con hasta exclusivo
+RANGOS_PRECIO = [(0, 25), (25, 50), (50, 100), (100, 250), (250, None)]
+
+
+class CatalogoSnapshot:
+    """Foto del catálogo activo en un momento dado (no modificar)"""
+
+    def __init__(self, version, productos, categorias, rangos_precio, ultima_modificacion, total_registros):
+        self.version = version
+        self.productos = productos  # tupla de diccionarios listos para JSON
+        self.categorias = categorias  # {categoria: {'nombre', 'count'}}
+        self.rangos_precio = rangos_precio  # [{'desde', 'hasta', 'count'}]
+        self.ultima_modificacion = ultima_modificacion  # max(actualizado_en) de todos los productos
+        # Sello del contenido: igual en todos los workers (la versión es por proceso)
+        fecha = ultima_modificacion.isoformat() if ultima_modificacion else ''
+        self.sello = f'{fecha}:{total_registros}'
+        self.por_id = {p['id']: p for p in productos}
+        self.creado_en = time.monotonic()
+
+    def primera_pagina(self, limite):
+        """Primera página en orden 'recientes' (mismo orden que paginar_productos)"""
+        productos = self.productos[:limite]
+        siguiente_cursor = None
+        if len(self.productos) > limite:
+            siguiente_cursor = codificar_cursor(productos[-1], 'recientes')
+        return productos, siguiente_cursor
+
+    def __repr__(self):
+        return f'<CatalogoSnapshot v{self.version} - {len(self.productos)} productos>'
+
+
+# Estado del proceso: versión actual y último snapshot construido
+_lock = threading.Lock()
+_version = 1
+_snapshot = None
+
+
+def version_catalogo():
+    """Obtener la versión actual del catálogo"""
+    return _version
+
+
+def invalidar_catalogo():
+    """Incrementar la versión del catálogo (llamar después de modificar productos)"""
+    global _version, _snapshot
+    with _lock:
+        _version += 1
+        _snapshot = None
+
+
+def producto_a_dict(p):
+    """Convertir un producto a diccionario para la tienda"""
+    todas_imagenes = p.obtener_todas_imagenes()
+    return {
+        'id': p.id,
+        'nombre': p.nombre,
+        'descripcion': p.descripcion,
+        'categoria': p.categoria or 'otros',
+        'precio_final': float(p.precio_final),
+        'precio_oferta': float(p.precio_oferta) if p.precio_oferta else None,
+        'imagen': todas_imagenes[0] if todas_imagenes else None,
+        'imagenes': todas_imagenes,
+        'miniaturas': p.obtener_miniaturas(),  # Versiones reducidas para las tarjetas
+        'creado_en': p.creado_en.isoformat() if p.creado_en else None,
+        'actualizado_en': p.actualizado_en.isoformat() if p.actualizado_en else None
+    }
+
+
+def _calcular_facetas(productos):
+    """Conteos por categoría y por rango de precio (sin GROUP BY en la BD)"""
+    from models import CATEGORIAS_PRODUCTO, NOMBRES_CATEGORIAS
+
+    conteos = {}
+    rangos = [0] * len(RANGOS_PRECIO)
+    for p in productos:
+        conteos[p['categoria']] = conteos.get(p['categoria'], 0) + 1
+
+        precio = p['precio_oferta'] or p['precio_final']
+        for i, (desde, hasta) in enumerate(RANGOS_PRECIO):
+            if precio >= desde and (hasta is None or precio < hasta):
+                rangos[i] += 1
+                break
+
+    # Mismo orden que CATEGORIAS_PRODUCTO; categorías desconocidas al final
+    orden = [valor for valor, _ in CATEGORIAS_PRODUCTO]
+    orden += sorted(cat for cat in conteos if cat not in NOMBRES_CATEGORIAS)
+
+    categorias = {
+        cat: {'nombre': NOMBRES_CATEGORIAS.get(cat, cat), 'count': conteos[cat]}
+        for cat in orden if cat in conteos
+    }
+    rangos_precio = [
+        {'desde': desde, 'hasta': hasta, 'count': rangos[i]}
+        for i, (desde, hasta) in enumerate(RANGOS_PRECIO)
+    ]
+    return categorias, rangos_precio
+
+
+def _construir_snapshot(version):
+    """Leer productos activos de la base de datos y calcular facetas"""
+    from models import db, Producto
+    from sqlalchemy import func
+
+    productos_db = Producto.query.filter_by(activo=True)\
+        .order_by(Producto.creado_en.desc(), Producto.id.desc()).all()
+
+    # Incluye inactivos: desactivar un producto también cambia el catálogo
+    ultima_modificacion, total_registros = db.session.query(
+        func.max(Producto.actualizado_en),
+        func.count(Producto.id)
+    ).one()
+
+    productos = tuple(producto_a_dict(p) for p in productos_db)
+    categorias, rangos_precio = _calcular_facetas(productos)
+    return CatalogoSnapshot(version, productos, categorias, rangos_precio, ultima_modificacion, total_registros)
+
+
+def obtener_catalogo():
+    """
+    Obtener el snapshot vigente del catálogo.
+    Se reconstruye solo si cambió la versión o venció CATALOGO_TTL
+    (el TTL permite que otros workers vean los cambios del admin).
+    Una reconstrucción por TTL también incrementa la versión.
+    """
+    global _version, _snapshot
+
+    ttl = current_app.config.get('CATALOGO_TTL', 300)
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.creado_en < ttl:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is not None and time.monotonic() - snapshot.creado_en < ttl:
+            return snapshot
+
+        if snapshot is not None:
+            _version += 1  # TTL vencido: los datos pudieron cambiar en otro worker
+
+        _snapshot = _construir_snapshot(_version)
+        return _snapshot
+
+
+# ==================== PAGINACIÓN (API) ====================
+
+def _valor_orden(producto, orden):
+    """Valor de la columna de orden para un producto ya convertido a dict"""
+    if orden == 'recientes':
+        return producto['creado_en']
+    if orden == 'nombre':
+        return producto['nombre']
+    return producto['precio_oferta'] or producto['precio_final']
+
+
+def codificar_cursor(producto, orden):
+    """Cursor opaco con (valor de orden, id) del último producto de la página"""
+    datos = json.dumps([_valor_orden(producto, orden), producto['id']])
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+
+def decodificar_cursor(cursor, orden):
+    """Decodificar un cursor; lanza ValueError si no es válido"""
+    try:
+        valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        ultimo_id = int(ultimo_id)
+        if orden == 'recientes':
+            valor = datetime.fromisoformat(valor)
+        elif orden in ('precio_asc', 'precio_desc'):
+            valor = Decimal(str(valor))
+        else:
+            valor = str(valor)
+    except Exception:
+        raise ValueError('Cursor inválido')
+    return valor, ultimo_id
+
+
+def paginar_productos(categoria=None, precio_min=None, precio_max=None,
+                      orden='recientes', limite=24, cursor=None):
+    """
+    Página de productos activos con filtros y orden resueltos en SQL.
+    Paginación por cursor (keyset) sobre (columna de orden, id).
+    Retorna (productos, siguiente_cursor).
+    """
+    from models import db, Producto
+
+    if orden not in ORDENES_PRODUCTOS:
+        raise ValueError('Orden inválido')
+
+    precio = db.func.coalesce(Producto.precio_oferta, Producto.precio_final)
+    columnas = {
+        'recientes': (Producto.creado_en, True),
+        'precio_asc': (precio, False),
+        'precio_desc': (precio, True),
+        'nombre': (Producto.nombre, False)
+    }
+    columna, descendente = columnas[orden]
+
+    query = Producto.query.filter(Producto.activo == True)
+
+    if categoria:
+        query = query.filter(Producto.categoria == categoria)
+    if precio_min is not None:
+        query = query.filter(precio >= precio_min)
+    if precio_max is not None:
+        query = query.filter(precio <= precio_max)
+
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, orden)
+        if descendente:
+            query = query.filter(db.or_(
+                columna < valor,
+                db.and_(columna == valor, Producto.id < ultimo_id)
+            ))
+        else:
+            query = query.filter(db.or_(
+                columna > valor,
+                db.and_(columna == valor, Producto.id > ultimo_id)
+            ))
+
+    if descendente:
+        query = query.order_by(columna.desc(), Producto.id.desc())
+    else:
+        query = query.order_by(columna.asc(), Producto.id.asc())
+
+    # Pedir uno extra para saber si hay otra página
+    filas = query.limit(limite + 1).all()
+
+    productos = [producto_a_dict(p) for p in filas[:limite]]
+    siguiente_cursor = None
+    if len(filas) > limite:
+        siguiente_cursor = codificar_cursor(productos[-1], orden)
+
+    return productos, siguiente_cursor
@@ -0,0 +1,419 @@
+"""
+Cola de entrada de pedidos (modo de alta demanda)
+Con COLA_PEDIDOS_ACTIVA el checkout guarda el pedido validado en una cola
+SQLite local (durable, compartida por los workers del nodo) y responde al
+instante con una referencia. Un hilo por proceso pasa los pedidos a la
+tabla 'pedidos' en lotes, con un solo commit por lote.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+
+
+class ColaLlena(Exception):
+    """La cola alcanzó COLA_PEDIDOS_MAX pedidos pendientes"""
+
+
+class PedidoEnCola:
+    """Pedido aceptado que aún no tiene id en la tabla 'pedidos'"""
+
+    def __init__(self, referencia, datos):
+        self.id = None
+        self.referencia = referencia
+        self.cliente_nombre = datos['cliente_nombre']
+        self.cliente_telefono = datos['cliente_telefono']
+        self.cliente_direccion = datos['cliente_direccion']
+        self.total = Decimal(datos['total'])
+
+    def __repr__(self):
+        return f'<PedidoEnCola {self.referencia}>'
+
+
+def nueva_referencia():
+    """Referencia corta para mostrar al cliente (se guarda en Pedido.referencia)"""
+    return secrets.token_hex(6).upper()
+
+
+# ==================== COLA ====================
+
+class ColaPedidos:
+    """Cola durable en un archivo SQLite local"""
+
+    # Pedidos tomados por un worker que murió antes de terminar vuelven a la cola
+    TOMA_VENCIDA = 60
+    REINTENTO_MAXIMO = 300  # Segundos de espera máxima entre reintentos
+
+    def __init__(self, ruta, max_pendientes, max_intentos=10, espera_reintento=2):
+        self.ruta = ruta
+        self.max_pendientes = max_pendientes
+        self.max_intentos = max_intentos
+        self.espera_reintento = espera_reintento
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute('''
+                CREATE TABLE IF NOT EXISTS cola (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    referencia TEXT NOT NULL UNIQUE,
+                    datos TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    tomado_en REAL,
+                    pedido_id INTEGER,
+                    error TEXT,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    reintentar_en REAL,
+                    creado_en REAL NOT NULL
+                )
+            ''')
+            # Colas creadas antes de los reintentos
+            columnas = {fila[1] for fila in conexion.execute('PRAGMA table_info(cola)')}
+            if 'intentos' not in columnas:
+                conexion.execute('ALTER TABLE cola ADD COLUMN intentos INTEGER NOT NULL DEFAULT 0')
+                conexion.execute('ALTER TABLE cola ADD COLUMN reintentar_en REAL')
+            conexion.execute('CREATE INDEX IF NOT EXISTS ix_cola_estado ON cola (estado, id)')
+
+    def _conexion(self):
+        """Conexión SQLite por hilo (autocommit; transacciones explícitas)"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=FULL')  # Un pedido aceptado no se pierde
+            self._local.conexion = conexion
+        return _Transaccion(conexion)
+
+    def encolar(self, referencia, datos):
+        """Guardar un pedido; lanza ColaLlena si hay demasiados pendientes"""
+        with self._conexion() as conexion:
+            pendientes = conexion.execute(
+                "SELECT COUNT(*) FROM cola WHERE estado IN ('pendiente', 'procesando')"
+            ).fetchone()[0]
+            if pendientes >= self.max_pendientes:
+                raise ColaLlena('Demasiados pedidos en espera')
+            conexion.execute(
+                'INSERT INTO cola (referencia, datos, creado_en) VALUES (?, ?, ?)',
+                (referencia, json.dumps(datos), time.time())
+            )
+
+    def tomar_lote(self, limite):
+        """Marcar hasta `limite` pedidos como 'procesando' y devolverlos [(id, referencia, datos)]"""
+        ahora = time.time()
+        with self._conexion() as conexion:
+            filas = conexion.execute('''
+                SELECT id, referencia, datos FROM cola
+                WHERE (estado = 'pendiente' AND (reintentar_en IS NULL OR reintentar_en <= ?))
+                   OR (estado = 'procesando' AND tomado_en < ?)
+                ORDER BY id LIMIT ?
+            ''', (ahora, ahora - self.TOMA_VENCIDA, limite)).fetchall()
+            if filas:
+                conexion.execute(
+                    f"UPDATE cola SET estado = 'procesando', tomado_en = ? WHERE id IN ({','.join('?' * len(filas))})",
+                    [ahora] + [fila[0] for fila in filas]
+                )
+        return [(id_, referencia, json.loads(datos)) for id_, referencia, datos in filas]
+
+    def marcar_procesados(self, resultados):
+        """resultados: [(id en la cola, id del pedido)]"""
+        with self._conexion() as conexion:
+            conexion.executemany(
+                "UPDATE cola SET estado = 'procesado', pedido_id = ? WHERE id = ?",
+                [(pedido_id, id_) for id_, pedido_id in resultados]
+            )
+
+    def marcar_error(self, id_, error):
+        """Pedido que no se puede guardar (datos inválidos o reintentos agotados)"""
+        with self._conexion() as conexion:
+            conexion.execute("UPDATE cola SET estado = 'error', error = ? WHERE id = ?", (error[:500], id_))
+
+    def reintentar_luego(self, id_, error):
+        """
+        Error transitorio (base de datos caída, bloqueo, conexión perdida): el
+        pedido vuelve a la cola con espera exponencial. Retorna False si agotó
+        los intentos y quedó en 'error'.
+        """
+        with self._conexion() as conexion:
+            intentos = conexion.execute('SELECT intentos FROM cola WHERE id = ?', (id_,)).fetchone()[0] + 1
+            if intentos >= self.max_intentos:
+                conexion.execute(
+                    "UPDATE cola SET estado = 'error', intentos = ?, error = ? WHERE id = ?",
+                    (intentos, error[:500], id_)
+                )
+                return False
+            espera = min(self.espera_reintento * 2 ** (intentos - 1), self.REINTENTO_MAXIMO)
+            conexion.execute(
+                "UPDATE cola SET estado = 'pendiente', intentos = ?, reintentar_en = ?, error = ? WHERE id = ?",
+                (intentos, time.time() + espera, error[:500], id_)
+            )
+            return True
+
+    def errores(self, limite=100):
+        """Pedidos en 'error': [(id, referencia, intentos, error, creado_en)]"""
+        return self._conexion().conexion.execute(
+            "SELECT id, referencia, intentos, error, creado_en FROM cola WHERE estado = 'error' ORDER BY id LIMIT ?",
+            (limite,)
+        ).fetchall()
+
+    def reactivar_errores(self, ids=None):
+        """Devolver a la cola los pedidos en 'error' (todos, o los de `ids`). Retorna cuántos"""
+        consulta = "UPDATE cola SET estado = 'pendiente', intentos = 0, reintentar_en = NULL WHERE estado = 'error'"
+        parametros = []
+        if ids:
+            consulta += f" AND id IN ({','.join('?' * len(ids))})"
+            parametros = list(ids)
+        with self._conexion() as conexion:
+            return conexion.execute(consulta, parametros).rowcount
+
+    def estado(self, referencia):
+        """{'estado', 'pedido_id'} de una referencia, o None si no está en esta cola"""
+        fila = self._conexion().conexion.execute(
+            'SELECT estado, pedido_id FROM cola WHERE referencia = ?', (referencia,)
+        ).fetchone()
+        if fila is None:
+            return None
+        estado = 'pendiente' if fila[0] == 'procesando' else fila[0]
+        return {'estado': estado, 'pedido_id': fila[1]}
+
+    def profundidad(self):
+        """Pedidos aún no pasados a la tabla 'pedidos'"""
+        return self._conexion().conexion.execute(
+            "SELECT COUNT(*) FROM cola WHERE estado IN ('pendiente', 'procesando')"
+        ).fetchone()[0]
+
+    def purgar_procesados(self, antiguedad):
+        """Borrar pedidos ya procesados hace más de `antiguedad` segundos"""
+        with self._conexion() as conexion:
+            conexion.execute(
+                "DELETE FROM cola WHERE estado = 'procesado' AND creado_en < ?", (time.time() - antiguedad,)
+            )
+
+
+class _Transaccion:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK sobre una conexión en autocommit"""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        self.conexion.execute('BEGIN IMMEDIATE')
+        return self.conexion
+
+    def __exit__(self, tipo, valor, traza):
+        self.conexion.execute('ROLLBACK' if tipo else 'COMMIT')
+        return False
+
+
+# ==================== WORKER ====================
+
+def _crear_pedido(referencia, datos):
+    from models import Pedido
+    return Pedido(
+        referencia=referencia,
+        cliente_nombre=datos['cliente_nombre'],
+        cliente_telefono=datos['cliente_telefono'],
+        cliente_direccion=datos['cliente_direccion'],
+        productos_json=datos['productos_json'],
+        total=Decimal(datos['total']),
+        afiliado_id=datos['afiliado_id'],
+        estado='pendiente',
+        creado_en=datetime.fromisoformat(datos['creado_en'])
+    )
+
+
+def procesar_lote(cola, limite):
+    """Pasar un lote de la cola a 'pedidos' con un solo commit. Retorna cuántos tomó"""
+    from models import db, Pedido
+
+    lote = cola.tomar_lote(limite)
+    if not lote:
+        return 0
+
+    # Reintentos de un lote ya confirmado (worker caído): no duplicar
+    referencias = [referencia for _, referencia, _ in lote]
+    try:
+        existentes = dict(
+            db.session.query(Pedido.referencia, Pedido.id).filter(Pedido.referencia.in_(referencias))
+        )
+    except Exception as e:
+        db.session.rollback()
+        if not _es_transitorio(e):
+            raise
+        # Base de datos no disponible: todo el lote espera su próximo intento
+        current_app.logger.warning(f'Cola de pedidos: base de datos no disponible, se reintentará: {e}')
+        for id_, _, _ in lote:
+            cola.reintentar_luego(id_, str(e))
+        return len(lote)
+
+    try:
+        # Dentro del try: datos inválidos de un pedido no traban el lote completo
+        nuevos = [(id_, _crear_pedido(referencia, datos)) for id_, referencia, datos in lote
+                  if referencia not in existentes]
+        db.session.add_all([pedido for _, pedido in nuevos])
+        db.session.commit()
+        nuevos = [(id_, pedido.id) for id_, pedido in nuevos]
+    except Exception:
+        db.session.rollback()
+        # Aislar el pedido con problemas: de a uno
+        nuevos = _procesar_de_a_uno(cola, [(id_, referencia, datos) for id_, referencia, datos in lote
+                                           if referencia not in existentes])
+
+    resultados = [(id_, existentes[referencia]) for id_, referencia, _ in lote if referencia in existentes]
+    resultados += nuevos
+    cola.marcar_procesados(resultados)
+    return len(lote)
+
+
+def _procesar_de_a_uno(cola, lote):
+    """Guardar los pedidos de a uno; retorna [(id en la cola, id del pedido)]"""
+    from models import db, Pedido
+
+    procesados = []
+    for id_, referencia, datos in lote:
+        try:
+            pedido = _crear_pedido(referencia, datos)
+            db.session.add(pedido)
+            db.session.commit()
+            procesados.append((id_, pedido.id))
+        except Exception as e:
+            db.session.rollback()
+            if _es_transitorio(e):
+                if cola.reintentar_luego(id_, str(e)):
+                    current_app.logger.warning(f'Pedido en cola {referencia} se reintentará: {e}')
+                else:
+                    current_app.logger.error(f'Pedido en cola {referencia} agotó los reintentos: {e}')
+                continue
+            # Otro worker tomó el mismo lote vencido y ya lo guardó: no es un error
+            pedido_id = Pedido.query.with_entities(Pedido.id).filter_by(referencia=referencia).scalar()
+            if pedido_id is not None:
+                procesados.append((id_, pedido_id))
+                continue
+            current_app.logger.error(f'Pedido en cola {referencia} no se pudo guardar: {e}')
+            cola.marcar_error(id_, str(e))
+    return procesados
+
+
+def _es_transitorio(error):
+    """Errores de conexión o bloqueo: se reintentan; los de integridad o de datos no"""
+    from sqlalchemy import exc
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError))
+
+
+def _bucle_worker(app, cola, despertar):
+    """Hilo del proceso: vaciar la cola en lotes; esperar un poco para juntar pedidos"""
+    global _worker
+    config = app.config
+    ultima_purga = 0.0
+    while True:
+        try:
+            with app.app_context():
+                tomados = procesar_lote(cola, config['COLA_PEDIDOS_LOTE'])
+                if time.monotonic() - ultima_purga > 3600:
+                    cola.purgar_procesados(config['COLA_PEDIDOS_RETENCION'])
+                    ultima_purga = time.monotonic()
+        except Exception as e:
+            app.logger.error(f'Error procesando la cola de pedidos: {e}')
+            tomados = 0
+
+        # Cola desactivada: el hilo solo termina lo que quedó de antes
+        if not config['COLA_PEDIDOS_ACTIVA'] and not tomados and not cola.profundidad():
+            with _lock:
+                _worker = None
+            return
+
+        if tomados < config['COLA_PEDIDOS_LOTE']:
+            despertar.wait(config['COLA_PEDIDOS_ESPERA'])
+            despertar.clear()
+
+
+_lock = threading.Lock()
+_cola = None
+_despertar = threading.Event()
+_worker = None
+_pid = None  # Proceso dueño de la cola y del hilo (gunicorn --preload hace fork después)
+
+
+def obtener_cola():
+    """Cola del nodo (archivo en COLA_PEDIDOS_RUTA)"""
+    global _cola, _worker, _pid
+    if _cola is None or _pid != os.getpid():
+        with _lock:
+            if _cola is None or _pid != os.getpid():
+                # Después de un fork: ni la conexión SQLite ni el hilo del padre sirven aquí
+                config = current_app.config
+                _cola = ColaPedidos(config['COLA_PEDIDOS_RUTA'], config['COLA_PEDIDOS_MAX'],
+                                    max_intentos=config['COLA_PEDIDOS_INTENTOS'],
+                                    espera_reintento=config['COLA_PEDIDOS_REINTENTO_ESPERA'])
+                _worker = None
+                _pid = os.getpid()
+    return _cola
+
+
+def iniciar_worker():
+    """Arrancar el hilo de este proceso (después del fork de gunicorn)"""
+    global _worker
+    cola = obtener_cola()
+    if _worker is None:
+        with _lock:
+            if _worker is None:
+                _worker = threading.Thread(
+                    target=_bucle_worker,
+                    args=(current_app._get_current_object(), cola, _despertar),
+                    daemon=True
+                )
+                _worker.start()
+
+
+def iniciar_cola(app):
+    """
+    Si quedaron pedidos en la cola (reinicio, despliegue o cola desactivada
+    después) arrancar el hilo con la primera solicitud que atiende cada proceso
+    del servidor, aunque no lleguen pedidos nuevos. No al crear la app: los
+    scripts de mantenimiento también la crean y podrían tomar un lote y terminar
+    antes de guardarlo.
+    """
+    if not app.config['COLA_PEDIDOS_ACTIVA'] and not os.path.exists(app.config['COLA_PEDIDOS_RUTA']):
+        return
+
+    # Por pid: con gunicorn --preload cada worker es un proceso nuevo
+    revisado_en = {'pid': None}
+
+    @app.before_request
+    def _retomar_cola_en_este_proceso():
+        if revisado_en['pid'] == os.getpid() or current_app.testing:
+            return
+        revisado_en['pid'] = os.getpid()
+        if obtener_cola().profundidad():
+            iniciar_worker()
+
+
+def encolar_pedido(datos):
+    """Aceptar un pedido validado; retorna PedidoEnCola. Lanza ColaLlena"""
+    referencia = nueva_referencia()
+    datos = dict(datos, creado_en=datetime.utcnow().isoformat())
+    obtener_cola().encolar(referencia, datos)
+    iniciar_worker()
+    _despertar.set()
+    return PedidoEnCola(referencia, datos)
+
+
+def estado_pedido(referencia):
+    """Estado de una referencia en la cola de este nodo o, si no está, en 'pedidos'"""
+    from models import Pedido
+
+    estado = obtener_cola().estado(referencia)
+    if estado is not None:
+        return estado
+
+    pedido_id = Pedido.query.with_entities(Pedido.id).filter_by(referencia=referencia).scalar()
+    if pedido_id is None:
+        return None
+    return {'estado': 'procesado', 'pedido_id': pedido_id}
@@ -0,0 +1,78 @@
+"""
+Compresión de respuestas HTML y JSON (brotli o gzip según el navegador)
+Se activa con COMPRESION_ACTIVA. Las páginas de la caché de páginas guardan
+su versión comprimida, así un acierto no vuelve a comprimir.
+"""
+
+import gzip
+
+from flask import current_app, g, request
+
+from services.cache_paginas import obtener_cache_paginas
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Tipos de contenido de texto; imágenes, video y PDF ya vienen comprimidos
+TIPOS_COMPRIMIBLES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+
+
+def codificaciones_soportadas():
+    """Codificaciones disponibles en orden de preferencia"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def comprimir(datos, codificacion):
+    """Comprimir bytes con 'br' o 'gzip'"""
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=current_app.config['COMPRESION_NIVEL_BROTLI'])
+    return gzip.compress(datos, compresslevel=current_app.config['COMPRESION_NIVEL_GZIP'])
+
+
+def comprimir_respuesta(respuesta):
+    """after_request: comprimir el cuerpo si el navegador lo acepta y vale la pena"""
+    if (respuesta.status_code != 200
+            or respuesta.direct_passthrough  # Archivos (send_file): ya tienen .br/.gz propios
+            or respuesta.is_streamed
+            or 'Content-Encoding' in respuesta.headers
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+        return respuesta
+
+    # La respuesta depende de Accept-Encoding aunque esta vez no se comprima
+    respuesta.vary.add('Accept-Encoding')
+
+    codificacion = request.accept_encodings.best_match(codificaciones_soportadas())
+    if codificacion is None:
+        return respuesta
+
+    cuerpo = respuesta.get_data()
+    if len(cuerpo) < current_app.config['COMPRESION_MIN_BYTES']:
+        return respuesta
+
+    # Página servida desde la caché de páginas: reutilizar su versión comprimida
+    pagina = g.get('pagina_cacheada')
+    if pagina is not None and pagina.cuerpo == cuerpo:
+        datos = obtener_cache_paginas().variante(pagina, codificacion, lambda: comprimir(cuerpo, codificacion))
+    else:
+        datos = comprimir(cuerpo, codificacion)
+
+    respuesta.set_data(datos)
+    respuesta.headers['Content-Encoding'] = codificacion
+
+    # Otro cuerpo en bytes: el ETag pasa a ser débil (sigue validando con If-None-Match)
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
+
+    return respuesta
+
+
+def iniciar_compresion(app):
+    """Registrar la compresión de respuestas en la app"""
+    app.after_request(comprimir_respuesta)
@@ -0,0 +1,144 @@
+"""
+Estadísticas del dashboard del admin
+Contadores en una sola consulta (conteos condicionales con SUM(CASE ...)),
+cacheados por ESTADISTICAS_TTL segundos. Un commit que agrega o modifica
+pedidos o comisiones descarta la caché del proceso.
+"""
+
+import threading
+import time
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class EstadisticasDashboard:
+    """Foto de los contadores del dashboard (no modificar)"""
+
+    def __init__(self, total_productos, total_pedidos, pedidos_pendientes, pedidos_pagados,
+                 total_afiliados, comisiones_pendientes, ultimos_pedidos):
+        self.total_productos = total_productos
+        self.total_pedidos = total_pedidos
+        self.pedidos_pendientes = pedidos_pendientes
+        self.pedidos_pagados = pedidos_pagados
+        self.total_afiliados = total_afiliados
+        self.comisiones_pendientes = comisiones_pendientes
+        self.ultimos_pedidos = ultimos_pedidos  # Filas (id, cliente_nombre, total, estado, creado_en, afiliado_codigo)
+        self.creado_en = time.monotonic()
+
+    def a_dict(self):
+        """Variables para la plantilla admin/dashboard.html"""
+        return {
+            'total_productos': self.total_productos,
+            'total_pedidos': self.total_pedidos,
+            'pedidos_pendientes': self.pedidos_pendientes,
+            'pedidos_pagados': self.pedidos_pagados,
+            'total_afiliados': self.total_afiliados,
+            'comisiones_pendientes': self.comisiones_pendientes,
+            'ultimos_pedidos': self.ultimos_pedidos
+        }
+
+
+def _contar_si(condicion):
+    """COUNT condicional portable (PostgreSQL, MySQL y SQLite)"""
+    from models import db
+    return db.func.coalesce(db.func.sum(db.case((condicion, 1), else_=0)), 0)
+
+
+def _calcular():
+    """Todos los contadores en una consulta y los últimos pedidos en otra"""
+    from models import db, Producto, Pedido, Afiliado, Comision
+
+    # El admin ve los pedidos sin vendedor o ya validados por el vendedor
+    visible = db.or_(Pedido.afiliado_id.is_(None), Pedido.validado_por_vendedor == True)
+
+    total_productos = db.select(db.func.count()).select_from(Producto)\
+        .where(Producto.activo == True).scalar_subquery()
+    total_afiliados = db.select(db.func.count()).select_from(Afiliado)\
+        .where(Afiliado.activo == True).scalar_subquery()
+    comisiones_pendientes = db.select(db.func.sum(Comision.monto))\
+        .where(Comision.estado.in_(['pendiente', 'generada'])).scalar_subquery()
+
+    fila = db.session.execute(
+        db.select(
+            total_productos,
+            _contar_si(visible),
+            _contar_si(db.and_(visible, Pedido.estado == 'pendiente')),
+            _contar_si(db.and_(visible, Pedido.estado == 'pagado')),
+            total_afiliados,
+            comisiones_pendientes
+        ).select_from(Pedido)
+    ).one()
+
+    ultimos_pedidos = db.session.execute(
+        db.select(Pedido.id, Pedido.cliente_nombre, Pedido.total, Pedido.estado, Pedido.creado_en,
+                  Afiliado.codigo.label('afiliado_codigo'))
+        .outerjoin(Afiliado, Pedido.afiliado_id == Afiliado.id)
+        .where(visible)
+        .order_by(Pedido.creado_en.desc())
+        .limit(5)
+    ).all()
+
+    return EstadisticasDashboard(
+        total_productos=fila[0],
+        total_pedidos=int(fila[1]),
+        pedidos_pendientes=int(fila[2]),
+        pedidos_pagados=int(fila[3]),
+        total_afiliados=fila[4],
+        comisiones_pendientes=fila[5] if fila[5] is not None else Decimal('0.00'),
+        ultimos_pedidos=tuple(ultimos_pedidos)
+    )
+
+
+# Última foto del proceso
+_lock = threading.Lock()
+_estadisticas = None
+
+
+def invalidar_estadisticas():
+    """Descartar la foto (llamar después de cambios masivos que no pasan por el ORM)"""
+    global _estadisticas
+    _estadisticas = None
+
+
+def obtener_estadisticas():
+    """Estadísticas vigentes; se recalculan si se invalidaron o venció ESTADISTICAS_TTL"""
+    global _estadisticas
+
+    ttl = current_app.config['ESTADISTICAS_TTL']
+    estadisticas = _estadisticas
+    if estadisticas is not None and time.monotonic() - estadisticas.creado_en < ttl:
+        return estadisticas
+
+    with _lock:
+        # Otro request pudo haberlas recalculado mientras se esperaba el lock
+        if _estadisticas is None or time.monotonic() - _estadisticas.creado_en >= ttl:
+            _estadisticas = _calcular()
+        return _estadisticas
+
+
+# ==================== INVALIDACIÓN ====================
+
+def _afecta_estadisticas(session):
+    from models import Pedido, Comision, Producto, Afiliado
+    tipos = (Pedido, Comision, Producto, Afiliado)
+    return any(isinstance(obj, tipos) for obj in (*session.new, *session.dirty, *session.deleted))
+
+
+@event.listens_for(Session, 'before_flush')
+def _marcar_cambios(session, contexto, instancias):
+    if not session.info.get('estadisticas_cambiaron') and _afecta_estadisticas(session):
+        session.info['estadisticas_cambiaron'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_al_confirmar(session):
+    if session.info.pop('estadisticas_cambiaron', False):
+        invalidar_estadisticas()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_marca(session):
+    session.info.pop('estadisticas_cambiaron', None)
@@ -0,0 +1,131 @@
+"""
+Exportaciones CSV de pedidos (una fila por producto) y comisiones
+Las filas se leen por lotes (yield_per: cursor del lado del servidor en
+PostgreSQL y MySQL) y se escriben a medida que llegan: la memoria no crece
+con el número de filas. Son SELECT simples, sin bloqueos sobre las tablas.
+"""
+
+import csv
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ENCABEZADO_PEDIDOS = [
+    'pedido', 'referencia', 'fecha', 'estado', 'vendedor', 'cliente', 'telefono', 'direccion',
+    'linea', 'producto_id', 'producto', 'cantidad', 'precio', 'subtotal', 'total_pedido'
+]
+ENCABEZADO_COMISIONES = [
+    'comision', 'fecha', 'estado', 'vendedor', 'afiliado', 'pedido', 'total_pedido',
+    'margen', 'monto', 'pagada_en', 'liquidacion'
+]
+
+
+class _Linea:
+    """Destino de csv.writer: devuelve la línea en vez de guardarla"""
+
+    def write(self, texto):
+        return texto
+
+
+def _fecha(valor):
+    return valor.strftime('%Y-%m-%d %H:%M') if valor else ''
+
+
+def _monto(valor):
+    return f'{Decimal(str(valor)):.2f}' if valor is not None else ''
+
+
+def _rango(columna, desde, hasta):
+    """Condiciones de fecha (ambas incluidas completas)"""
+    condiciones = []
+    if desde is not None:
+        condiciones.append(columna >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        condiciones.append(columna < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    return condiciones
+
+
+def _en_lotes(consulta, lote):
+    """Filas de la consulta leídas de a `lote` (sin cargar el resultado completo)"""
+    from models import db
+    return db.session.execute(consulta, execution_options={'yield_per': lote})
+
+
+# ==================== FILAS ====================
+
+def filas_pedidos(estado='todos', tipo='todos', desde=None, hasta=None, lote=1000):
+    """Una fila por producto de cada pedido (mismos filtros que el listado del admin)"""
+    from models import db, Pedido, Afiliado
+    from services.listados import filtros_pedidos
+
+    # Columnas sueltas (no entidades): nada queda en la sesión al avanzar
+    consulta = db.select(
+        Pedido.id, Pedido.referencia, Pedido.creado_en, Pedido.estado, Afiliado.codigo,
+        Pedido.cliente_nombre, Pedido.cliente_telefono, Pedido.cliente_direccion,
+        Pedido.productos_json, Pedido.total
+    ).outerjoin(Afiliado, Pedido.afiliado_id == Afiliado.id)\
+        .where(*filtros_pedidos(estado, tipo, desde, hasta))\
+        .order_by(Pedido.creado_en, Pedido.id)
+
+    for fila in _en_lotes(consulta, lote):
+        pedido = [fila.id, fila.referencia or '', _fecha(fila.creado_en), fila.estado, fila.codigo or '',
+                  fila.cliente_nombre, fila.cliente_telefono, fila.cliente_direccion]
+        lineas = fila.productos_json or []
+        if not lineas:
+            yield pedido + ['', '', '', '', '', '', _monto(fila.total)]
+            continue
+
+        for numero, item in enumerate(lineas, start=1):
+            precio = Decimal(str(item.get('precio', 0)))
+            # Pedidos anteriores sin subtotal en las líneas
+            subtotal = item['subtotal'] if 'subtotal' in item else precio * item.get('cantidad', 0)
+            yield pedido + [numero, item.get('id', ''), item.get('nombre', ''), item.get('cantidad', ''),
+                            _monto(precio), _monto(subtotal), _monto(fila.total)]
+
+
+def filas_comisiones(estado='todos', desde=None, hasta=None, lote=1000):
+    """Una fila por comisión con su afiliado y el total del pedido"""
+    from models import db, Comision, Afiliado, Pedido
+
+    condiciones = _rango(Comision.creado_en, desde, hasta)
+    if estado != 'todos':
+        condiciones.append(Comision.estado == estado)
+
+    consulta = db.select(
+        Comision.id, Comision.creado_en, Comision.estado, Afiliado.codigo, Afiliado.nombre,
+        Comision.pedido_id, Pedido.total, Comision.margen, Comision.monto,
+        Comision.pagada_en, Comision.liquidacion_id
+    ).join(Afiliado, Comision.afiliado_id == Afiliado.id)\
+        .join(Pedido, Comision.pedido_id == Pedido.id)\
+        .where(*condiciones)\
+        .order_by(Comision.creado_en, Comision.id)
+
+    for fila in _en_lotes(consulta, lote):
+        yield [fila.id, _fecha(fila.creado_en), fila.estado, fila.codigo, fila.nombre,
+               fila.pedido_id, _monto(fila.total), _monto(fila.margen), _monto(fila.monto),
+               _fecha(fila.pagada_en), fila.liquidacion_id or '']
+
+
+# ==================== CSV ====================
+
+def csv_por_partes(encabezado, filas, lote=1000):
+    """Texto CSV en partes de `lote` filas (cuerpo de una respuesta en streaming)"""
+    escritor = csv.writer(_Linea())
+    parte = [escritor.writerow(encabezado)]
+    for fila in filas:
+        parte.append(escritor.writerow(fila))
+        if len(parte) >= lote:
+            yield ''.join(parte)
+            parte = []
+    if parte:
+        yield ''.join(parte)
+
+
+def escribir_csv(archivo, encabezado, filas):
+    """Escribir el CSV en un archivo abierto; retorna el número de filas"""
+    escritor = csv.writer(archivo)
+    escritor.writerow(encabezado)
+    total = 0
+    for fila in filas:
+        escritor.writerow(fila)
+        total += 1
+    return total
@@ -0,0 +1,258 @@
+"""
+Servicio de imágenes de productos
+Guarda las imágenes subidas con el hash de su contenido como nombre
+(sin duplicados, con conteo de referencias) y genera versiones
+redimensionadas (WebP y JPEG) para miniaturas y srcset
+"""
+
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+
+# Subcarpeta de UPLOAD_FOLDER donde se guardan las versiones redimensionadas
+CARPETA_DERIVADOS = 'derivados'
+
+# Nombre de los originales: primeros 32 caracteres hex del SHA-256 + extensión
+LONGITUD_HASH = 32
+_PATRON_NOMBRE_HASH = re.compile(r'^[0-9a-f]{%d}\.[a-z0-9]+$' % LONGITUD_HASH)
+TAMANO_BLOQUE = 64 * 1024
+
+# Anchos ya encontrados en disco por archivo (los derivados no cambian)
+_variantes = {}
+_lock = threading.Lock()
+
+
+def _carpeta_derivados():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], CARPETA_DERIVADOS)
+
+
+def _base(nombre_archivo):
+    return os.path.splitext(nombre_archivo)[0]
+
+
+def url_derivado(nombre_archivo, ancho, formato='webp'):
+    """URL pública de una versión redimensionada"""
+    extension = 'jpg' if formato == 'jpeg' else formato
+    return f'/static/uploads/{CARPETA_DERIVADOS}/{_base(nombre_archivo)}-{ancho}.{extension}'
+
+
+def generar_derivados(nombre_archivo):
+    """
+    Crear versiones WebP y JPEG de una imagen subida en los anchos de
+    IMAGENES_ANCHOS (nunca más anchas que el original).
+    Retorna la lista de anchos generados; vacía si Pillow no está instalado.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        current_app.logger.warning('Pillow no está instalado: no se generan miniaturas')
+        return []
+
+    carpeta = _carpeta_derivados()
+    os.makedirs(carpeta, exist_ok=True)
+
+    ruta = os.path.join(current_app.config['UPLOAD_FOLDER'], nombre_archivo)
+    base = _base(nombre_archivo)
+
+    with Image.open(ruta) as original:
+        imagen = ImageOps.exif_transpose(original)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            imagen = imagen.convert('RGBA')
+
+        anchos = sorted({min(ancho, imagen.width) for ancho in current_app.config['IMAGENES_ANCHOS']})
+
+        for ancho in anchos:
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            copia = imagen.resize((ancho, alto), Image.LANCZOS) if ancho != imagen.width else imagen
+
+            copia.save(os.path.join(carpeta, f'{base}-{ancho}.webp'), 'WEBP',
+                       quality=current_app.config['IMAGENES_CALIDAD'], method=4)
+
+            # JPEG no soporta transparencia: fondo blanco
+            if copia.mode == 'RGBA':
+                fondo = Image.new('RGB', copia.size, (255, 255, 255))
+                fondo.paste(copia, mask=copia.split()[3])
+                copia = fondo
+            copia.save(os.path.join(carpeta, f'{base}-{ancho}.jpg'), 'JPEG',
+                       quality=current_app.config['IMAGENES_CALIDAD'], optimize=True, progressive=True)
+
+    with _lock:
+        _variantes[nombre_archivo] = tuple(anchos)
+
+    return anchos
+
+
+def _derivados_en_disco(nombre_archivo):
+    """Pares (ancho, ruta) de las versiones redimensionadas de un archivo"""
+    base = _base(nombre_archivo)
+    for ruta in glob.glob(os.path.join(_carpeta_derivados(), glob.escape(base) + '-*')):
+        ancho, _, extension = os.path.basename(ruta)[len(base) + 1:].partition('.')
+        if ancho.isdigit() and extension in ('webp', 'jpg'):
+            yield int(ancho), ruta
+
+
+def anchos_disponibles(nombre_archivo):
+    """Anchos con versión redimensionada en disco (tupla vacía si no hay)"""
+    anchos = _variantes.get(nombre_archivo)
+    if anchos is not None:
+        return anchos
+
+    anchos = tuple(sorted(ancho for ancho, ruta in _derivados_en_disco(nombre_archivo) if ruta.endswith('.webp')))
+
+    # Solo se recuerdan aciertos: el backfill puede crearlos después
+    if anchos:
+        with _lock:
+            _variantes[nombre_archivo] = anchos
+    return anchos
+
+
+def variantes_imagen(nombre_archivo):
+    """
+    srcset WebP/JPEG y miniatura de una imagen local.
+    Retorna None si la imagen todavía no tiene versiones redimensionadas.
+    """
+    anchos = anchos_disponibles(nombre_archivo)
+    if not anchos:
+        return None
+
+    # Miniatura: el mayor ancho que no supere IMAGENES_ANCHO_MINIATURA
+    limite = current_app.config['IMAGENES_ANCHO_MINIATURA']
+    ancho_miniatura = max((a for a in anchos if a <= limite), default=anchos[0])
+
+    return {
+        'srcset': ', '.join(f'{url_derivado(nombre_archivo, a)} {a}w' for a in anchos),
+        'srcset_jpeg': ', '.join(f'{url_derivado(nombre_archivo, a, "jpeg")} {a}w' for a in anchos),
+        'miniatura': url_derivado(nombre_archivo, ancho_miniatura)
+    }
+
+
+# ==================== ALMACENAMIENTO POR CONTENIDO ====================
+
+def nombre_por_contenido(sha256_hex, extension):
+    """Nombre de archivo de un original a partir de su hash"""
+    return f'{sha256_hex[:LONGITUD_HASH]}.{extension.lower()}'
+
+
+def es_nombre_por_contenido(nombre_archivo):
+    """True si el archivo ya usa el esquema de nombres por hash"""
+    return bool(_PATRON_NOMBRE_HASH.match(nombre_archivo))
+
+
+def hash_archivo(ruta):
+    """SHA-256 (hex) del contenido de un archivo"""
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def guardar_subida(file):
+    """
+    Guardar una imagen subida con el hash de su contenido como nombre.
+    Si ya existe un archivo idéntico se reutiliza. Retorna el nombre.
+    """
+    carpeta = current_app.config['UPLOAD_FOLDER']
+    extension = secure_filename(file.filename).rsplit('.', 1)[-1].lower()
+
+    # Se escribe a un temporal mientras se calcula el hash (sin cargar todo en memoria)
+    fd, temporal = tempfile.mkstemp(dir=carpeta, prefix='.subida-')
+    sha = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            for bloque in iter(lambda: file.stream.read(TAMANO_BLOQUE), b''):
+                sha.update(bloque)
+                destino.write(bloque)
+
+        nombre = nombre_por_contenido(sha.hexdigest(), extension)
+        ruta = os.path.join(carpeta, nombre)
+        if os.path.exists(ruta):
+            os.remove(temporal)  # Duplicado: se usa el archivo existente
+        else:
+            os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    if not anchos_disponibles(nombre):
+        try:
+            generar_derivados(nombre)
+        except Exception as e:
+            # La tienda sigue usando el original si la imagen no se puede procesar
+            current_app.logger.warning(f'No se pudieron generar miniaturas de {nombre}: {e}')
+
+    return nombre
+
+
+def registrar_referencias(archivos):
+    """Sumar una referencia por cada archivo usado (no hace commit)"""
+    from models import db, ArchivoImagen
+
+    carpeta = current_app.config['UPLOAD_FOLDER']
+    for archivo in archivos:
+        actualizados = ArchivoImagen.query.filter_by(archivo=archivo).update(
+            {ArchivoImagen.referencias: ArchivoImagen.referencias + 1},
+            synchronize_session=False
+        )
+        if not actualizados:
+            ruta = os.path.join(carpeta, archivo)
+            db.session.add(ArchivoImagen(
+                archivo=archivo,
+                tamano=os.path.getsize(ruta) if os.path.exists(ruta) else 0,
+                referencias=1
+            ))
+            db.session.flush()
+
+
+def liberar_referencias(archivos):
+    """
+    Restar una referencia por cada archivo que dejó de usarse (no hace commit).
+    Retorna los archivos que quedaron sin referencias; borrarlos del disco con
+    eliminar_archivos() después del commit.
+    """
+    from models import ArchivoImagen
+
+    if not archivos:
+        return []
+
+    for archivo in archivos:
+        ArchivoImagen.query.filter(
+            ArchivoImagen.archivo == archivo, ArchivoImagen.referencias > 0
+        ).update({ArchivoImagen.referencias: ArchivoImagen.referencias - 1}, synchronize_session=False)
+
+    sin_uso = ArchivoImagen.query.filter(
+        ArchivoImagen.archivo.in_(set(archivos)), ArchivoImagen.referencias <= 0
+    )
+    huerfanos = [fila.archivo for fila in sin_uso.with_entities(ArchivoImagen.archivo)]
+    sin_uso.delete(synchronize_session=False)
+    return huerfanos
+
+
+def eliminar_archivos(archivos):
+    """Borrar del disco originales y versiones redimensionadas que ya no se usan"""
+    from models import ArchivoImagen
+
+    carpeta = current_app.config['UPLOAD_FOLDER']
+    for archivo in archivos:
+        # Otro proceso pudo volver a subir el mismo contenido
+        if ArchivoImagen.query.get(archivo) is not None:
+            continue
+
+        rutas = [os.path.join(carpeta, archivo)]
+        rutas += [ruta for _, ruta in _derivados_en_disco(archivo)]
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+        with _lock:
+            _variantes.pop(archivo, None)
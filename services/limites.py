@@ -0,0 +1,150 @@
+"""
+Límites de solicitudes (token bucket) para checkout, PayPal y login
+Cada presupuesto de LIMITES es (ráfaga, segundos): se permiten `ráfaga`
+solicitudes seguidas y se recuperan de a una cada segundos/ráfaga.
+Una sesión establecida cuenta por sesión (y con LIMITES_POR_IP también por
+IP); una nueva o vacía (sin cookie, login fallido) siempre cuenta por IP, con
+LIMITES_FACTOR_IP veces el presupuesto porque varios clientes pueden compartir
+una IP. Al agotarse se responde 429 con Retry-After.
+
+Contadores:
+- LimitadorMemoria: por proceso (cada worker de gunicorn cuenta por su lado)
+- LimitadorRedis: compartido por todos los nodos (requiere el paquete redis)
+"""
+
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import abort, current_app, request, session
+
+
+class LimitadorMemoria:
+    """Cubetas en un diccionario del proceso"""
+
+    # Por encima de estas claves se descartan las cubetas ya llenas
+    MAX_CLAVES = 10000
+
+    def __init__(self):
+        self._cubetas = {}  # clave -> (tokens, actualizado, segundos por token, capacidad)
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, capacidad, periodo):
+        """Tomar un token; retorna 0 si se permite o los segundos a esperar"""
+        intervalo = periodo / capacidad
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, actualizado, _, _ = self._cubetas.get(clave, (capacidad, ahora, intervalo, capacidad))
+            tokens = min(capacidad, tokens + (ahora - actualizado) / intervalo)
+            if tokens < 1:
+                self._cubetas[clave] = (tokens, ahora, intervalo, capacidad)
+                return (1 - tokens) * intervalo
+
+            self._cubetas[clave] = (tokens - 1, ahora, intervalo, capacidad)
+            if len(self._cubetas) > self.MAX_CLAVES:
+                self._descartar_llenas(ahora)
+            return 0
+
+    def _descartar_llenas(self, ahora):
+        """Olvidar cubetas que ya se recargaron (equivalen a una nueva)"""
+        for clave, (tokens, actualizado, intervalo, capacidad) in list(self._cubetas.items()):
+            if tokens + (ahora - actualizado) / intervalo >= capacidad:
+                del self._cubetas[clave]
+
+
+# Cubeta atómica en Redis; usa el reloj del servidor Redis (igual para todos los nodos)
+SCRIPT_CUBETA = """
+local capacidad = tonumber(ARGV[1])
+local intervalo = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local datos = redis.call('HMGET', KEYS[1], 'tokens', 'actualizado')
+local tokens = tonumber(datos[1]) or capacidad
+local actualizado = tonumber(datos[2]) or ahora
+tokens = math.min(capacidad, tokens + (ahora - actualizado) / intervalo)
+local espera = 0
+if tokens < 1 then
+    espera = (1 - tokens) * intervalo
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'actualizado', tostring(ahora))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidad * intervalo) + 1)
+return tostring(espera)
+"""
+
+
+class LimitadorRedis:
+    """Cubetas compartidas en Redis"""
+
+    PREFIJO = 'limite:'
+
+    def __init__(self, cliente):
+        self._script = cliente.register_script(SCRIPT_CUBETA)
+
+    def consumir(self, clave, capacidad, periodo):
+        return float(self._script(keys=[self.PREFIJO + clave], args=[capacidad, periodo / capacidad]))
+
+
+_lock = threading.Lock()
+_limitador = None
+
+
+def obtener_limitador():
+    """Limitador del proceso según LIMITES_BACKEND"""
+    global _limitador
+    if _limitador is None:
+        with _lock:
+            if _limitador is None:
+                if current_app.config['LIMITES_BACKEND'] == 'redis':
+                    import redis
+                    _limitador = LimitadorRedis(redis.Redis.from_url(current_app.config['LIMITES_REDIS_URL']))
+                else:
+                    _limitador = LimitadorMemoria()
+    return _limitador
+
+
+# ==================== DECORADOR ====================
+
+def _claves(nombre):
+    """[(clave, multiplicador del presupuesto)] para la solicitud actual"""
+    clave_ip = (f'{nombre}:ip:{request.remote_addr}', current_app.config['LIMITES_FACTOR_IP'])
+
+    # Una sesión recién creada o vacía no identifica a nadie: sin cookie (o tras un
+    # login fallido, que deja la sesión vacía) cada request trae una nueva.
+    # Solo queda la IP, la real del cliente detrás de un proxy gracias a ProxyFix
+    sid = getattr(session, 'sid', None)
+    if not sid or getattr(session, 'nueva', True) or not session:
+        return [clave_ip]
+
+    claves = [(f'{nombre}:sesion:{sid}', 1)]
+    if current_app.config['LIMITES_POR_IP']:
+        claves.append(clave_ip)
+    return claves
+
+
+def limitar(nombre):
+    """
+    Aplicar el presupuesto LIMITES[nombre] a la vista.
+    Solo cuentan los métodos que escriben (el GET de un formulario es libre).
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            config = current_app.config
+            if config['LIMITES_ACTIVOS'] and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                capacidad, periodo = config['LIMITES'][nombre]
+                limitador = obtener_limitador()
+                try:
+                    espera = max((limitador.consumir(clave, capacidad * factor, periodo)
+                                  for clave, factor in _claves(nombre)), default=0)
+                except Exception as e:
+                    # Sin contador (Redis caído) se atiende igual: mejor que rechazar todo
+                    current_app.logger.warning(f'Límite de solicitudes no disponible: {e}')
+                    espera = 0
+                if espera > 0:
+                    abort(429, retry_after=max(1, math.ceil(espera)))
+            return vista(*args, **kwargs)
+        return envoltura
+    return decorador
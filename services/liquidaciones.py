@@ -0,0 +1,103 @@
+"""
+Liquidaciones de comisiones (pagos por lote)
+Un solo UPDATE ... RETURNING pasa las comisiones generadas a 'pagada' y las
+asocia a la liquidación; los totales quedan en la tabla 'liquidaciones' y el
+archivo de liquidación (CSV por afiliado) se genera desde ella.
+"""
+
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal
+
+
+def _admite_returning():
+    from models import db
+    return db.engine.dialect.update_returning
+
+
+def liquidar_comisiones(afiliado_id=None, creado_por=None):
+    """
+    Pagar las comisiones generadas de un afiliado (o de todos con None).
+    Retorna la Liquidacion, o None si no había nada que pagar.
+    """
+    from models import db, Comision, Liquidacion
+    from services.estadisticas import invalidar_estadisticas
+
+    liquidacion = Liquidacion(afiliado_id=afiliado_id, creado_por=creado_por)
+    db.session.add(liquidacion)
+    db.session.flush()  # Id de la liquidación para marcar las comisiones
+
+    condiciones = [Comision.estado == 'generada']
+    if afiliado_id is not None:
+        condiciones.append(Comision.afiliado_id == afiliado_id)
+
+    # Una sentencia para todo el lote; las filas ya tomadas por otra liquidación
+    # dejan de estar 'generada' y no se pagan dos veces
+    sentencia = db.update(Comision).where(*condiciones).values(
+        estado='pagada',
+        pagada_en=datetime.utcnow(),
+        liquidacion_id=liquidacion.id
+    )
+    opciones = {'synchronize_session': False}
+
+    if _admite_returning():
+        filas = db.session.execute(
+            sentencia.returning(Comision.afiliado_id, Comision.monto), execution_options=opciones
+        ).all()
+        num_comisiones = len(filas)
+        num_afiliados = len({fila.afiliado_id for fila in filas})
+        total = sum((fila.monto for fila in filas), Decimal('0.00'))
+    else:
+        # MySQL: sin RETURNING, los totales salen de las filas ya marcadas
+        db.session.execute(sentencia, execution_options=opciones)
+        num_comisiones, num_afiliados, total = db.session.execute(
+            db.select(db.func.count(Comision.id),
+                      db.func.count(db.distinct(Comision.afiliado_id)),
+                      db.func.sum(Comision.monto))
+            .where(Comision.liquidacion_id == liquidacion.id)
+        ).one()
+
+    if not num_comisiones:
+        db.session.rollback()
+        return None
+
+    liquidacion.num_comisiones = num_comisiones
+    liquidacion.num_afiliados = num_afiliados
+    liquidacion.total = total or Decimal('0.00')
+    db.session.commit()
+
+    # El UPDATE no pasa por el ORM: avisar a la caché del dashboard
+    invalidar_estadisticas()
+    return liquidacion
+
+
+def detalle_liquidacion(liquidacion_id):
+    """Filas (codigo, nombre, email, whatsapp, comisiones, total) por afiliado"""
+    from models import db, Afiliado, Comision
+
+    return db.session.execute(
+        db.select(Afiliado.codigo, Afiliado.nombre, Afiliado.email, Afiliado.whatsapp,
+                  db.func.count(Comision.id).label('comisiones'),
+                  db.func.sum(Comision.monto).label('total'))
+        .join(Comision, Comision.afiliado_id == Afiliado.id)
+        .where(Comision.liquidacion_id == liquidacion_id)
+        .group_by(Afiliado.id, Afiliado.codigo, Afiliado.nombre, Afiliado.email, Afiliado.whatsapp)
+        .order_by(Afiliado.codigo)
+    ).all()
+
+
+def archivo_liquidacion(liquidacion):
+    """CSV de la liquidación: una fila por afiliado y el total al final"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['liquidacion', 'fecha', 'codigo', 'nombre', 'email', 'whatsapp', 'comisiones', 'total'])
+
+    fecha = liquidacion.creado_en.strftime('%Y-%m-%d %H:%M')
+    for fila in detalle_liquidacion(liquidacion.id):
+        escritor.writerow([liquidacion.id, fecha, fila.codigo, fila.nombre, fila.email,
+                           fila.whatsapp or '', fila.comisiones, f'{fila.total:.2f}'])
+
+    escritor.writerow([liquidacion.id, fecha, 'TOTAL', '', '', '',
+                       liquidacion.num_comisiones, f'{liquidacion.total:.2f}'])
+    return salida.getvalue()
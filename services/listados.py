@@ -0,0 +1,299 @@
+"""
+Listados del panel admin
+Totales calculados con consultas agrupadas (no una consulta por fila) y
+resultados paginados (por número de página o por cursor).
+"""
+
+import base64
+import json
+import math
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from time import monotonic
+
+
+class Pagina:
+    """Una página de resultados de un listado"""
+
+    def __init__(self, items, pagina, por_pagina, total):
+        self.items = items
+        self.pagina = pagina
+        self.por_pagina = por_pagina
+        self.total = total
+
+    @property
+    def paginas(self):
+        return max(1, math.ceil(self.total / self.por_pagina))
+
+    @property
+    def tiene_anterior(self):
+        return self.pagina > 1
+
+    @property
+    def tiene_siguiente(self):
+        return self.pagina < self.paginas
+
+    def __repr__(self):
+        return f'<Pagina {self.pagina}/{self.paginas} - {len(self.items)} de {self.total}>'
+
+
+# ==================== AFILIADOS ====================
+
+# Columnas por las que se puede ordenar el listado de afiliados
+ORDENES_AFILIADOS = ('recientes', 'nombre', 'ventas', 'ganado', 'pendiente')
+
+
+def listar_afiliados(orden='recientes', descendente=True, pagina=1, por_pagina=50):
+    """
+    Afiliados con sus totales: {'afiliado', 'total_ganado', 'total_pendiente', 'num_ventas'}.
+    Dos consultas por página: el conteo y la página con los totales agrupados.
+    """
+    from models import db, Afiliado, Comision, Pedido
+
+    # Totales de comisiones por afiliado en una sola pasada
+    comisiones = db.select(
+        Comision.afiliado_id,
+        db.func.sum(db.case((Comision.estado == 'pagada', Comision.monto), else_=0)).label('ganado'),
+        db.func.sum(db.case((Comision.estado == 'generada', Comision.monto), else_=0)).label('pendiente')
+    ).group_by(Comision.afiliado_id).subquery()
+
+    ventas = db.select(
+        Pedido.afiliado_id,
+        db.func.count().label('ventas')
+    ).where(Pedido.estado == 'pagado', Pedido.afiliado_id.isnot(None))\
+        .group_by(Pedido.afiliado_id).subquery()
+
+    total_ganado = db.func.coalesce(comisiones.c.ganado, 0)
+    total_pendiente = db.func.coalesce(comisiones.c.pendiente, 0)
+    num_ventas = db.func.coalesce(ventas.c.ventas, 0)
+
+    columnas = {
+        'recientes': Afiliado.creado_en,
+        'nombre': Afiliado.nombre,
+        'ventas': num_ventas,
+        'ganado': total_ganado,
+        'pendiente': total_pendiente
+    }
+    columna = columnas.get(orden, Afiliado.creado_en)
+    # Afiliado.id desempata: el orden es estable entre páginas
+    orden_sql = (columna.desc(), Afiliado.id.desc()) if descendente else (columna.asc(), Afiliado.id.asc())
+
+    total = db.session.execute(db.select(db.func.count()).select_from(Afiliado)).scalar()
+    pagina = min(max(1, pagina), max(1, math.ceil(total / por_pagina)))
+
+    filas = db.session.execute(
+        db.select(Afiliado, total_ganado, total_pendiente, num_ventas)
+        .outerjoin(comisiones, comisiones.c.afiliado_id == Afiliado.id)
+        .outerjoin(ventas, ventas.c.afiliado_id == Afiliado.id)
+        .order_by(*orden_sql)
+        .limit(por_pagina)
+        .offset((pagina - 1) * por_pagina)
+    ).all()
+
+    items = [
+        {
+            'afiliado': afiliado,
+            'total_ganado': float(ganado),
+            'total_pendiente': float(pendiente),  # Comisiones generadas pero no pagadas
+            'num_ventas': int(ventas_afiliado)
+        }
+        for afiliado, ganado, pendiente, ventas_afiliado in filas
+    ]
+    return Pagina(items, pagina, por_pagina, total)
+
+
+# ==================== PEDIDOS ====================
+
+# Filtros de tipo del listado de pedidos del admin
+TIPOS_PEDIDO = ('todos', 'validados', 'sin_vendedor')
+ESTADOS_PEDIDO = ('todos', 'pendiente', 'pagado', 'cancelado')
+
+
+class PaginaCursor:
+    """Página de un listado por cursor: sin OFFSET, cuesta lo mismo en cualquier página"""
+
+    def __init__(self, items, anterior, siguiente, total):
+        self.items = items
+        self.anterior = anterior  # Cursor para la página más reciente (o None)
+        self.siguiente = siguiente  # Cursor para la página más antigua (o None)
+        self.total = total  # Conteo cacheado (puede estar atrasado LISTADOS_CONTEO_TTL segundos)
+
+    def __repr__(self):
+        return f'<PaginaCursor {len(self.items)} de ~{self.total}>'
+
+
+def codificar_cursor(creado_en, id):
+    """Cursor opaco con (creado_en, id) de un pedido"""
+    datos = json.dumps([creado_en.isoformat(), id])
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """Decodificar un cursor; lanza ValueError si no es válido"""
+    try:
+        creado_en, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(creado_en), int(id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def filtros_pedidos(estado, tipo, desde, hasta):
+    """Condiciones del listado (cada combinación tiene un índice compuesto en Pedido)"""
+    from models import db, Pedido
+
+    # El admin ve los pedidos sin vendedor o ya validados por el vendedor
+    if tipo == 'validados':
+        condiciones = [Pedido.validado_por_vendedor == True]
+    elif tipo == 'sin_vendedor':
+        condiciones = [Pedido.afiliado_id.is_(None)]
+    else:
+        condiciones = [db.or_(Pedido.afiliado_id.is_(None), Pedido.validado_por_vendedor == True)]
+
+    if estado != 'todos':
+        condiciones.append(Pedido.estado == estado)
+    if desde is not None:
+        condiciones.append(Pedido.creado_en >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        # Fecha final incluida completa
+        condiciones.append(Pedido.creado_en < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    return condiciones
+
+
+# Conteos por combinación de filtros: clave -> (total, calculado_en)
+_lock_conteos = threading.Lock()
+_conteos = {}
+
+
+def contar_pedidos(estado='todos', tipo='todos', desde=None, hasta=None, ttl=60):
+    """Total de pedidos con esos filtros, cacheado `ttl` segundos por proceso"""
+    from models import db, Pedido
+
+    clave = (estado, tipo, desde, hasta)
+    guardado = _conteos.get(clave)
+    if guardado is not None and monotonic() - guardado[1] < ttl:
+        return guardado[0]
+
+    total = db.session.execute(
+        db.select(db.func.count(Pedido.id)).where(*filtros_pedidos(estado, tipo, desde, hasta))
+    ).scalar()
+    with _lock_conteos:
+        if len(_conteos) > 256:
+            _conteos.clear()  # Rangos de fechas arbitrarios: no crecer sin límite
+        _conteos[clave] = (total, monotonic())
+    return total
+
+
+def listar_pedidos(estado='todos', tipo='todos', desde=None, hasta=None,
+                   despues=None, antes=None, limite=50, ttl_conteo=60):
+    """
+    Página de pedidos del admin, de los más recientes a los más antiguos.
+    Keyset sobre (creado_en, id): `despues` avanza a pedidos más antiguos,
+    `antes` vuelve a los más recientes. Lanza ValueError con un cursor inválido.
+    """
+    from models import db, Pedido
+
+    query = db.select(Pedido).options(db.joinedload(Pedido.afiliado))\
+        .where(*filtros_pedidos(estado, tipo, desde, hasta))
+
+    if antes:
+        creado_en, ultimo_id = decodificar_cursor(antes)
+        query = query.where(db.or_(
+            Pedido.creado_en > creado_en,
+            db.and_(Pedido.creado_en == creado_en, Pedido.id > ultimo_id)
+        )).order_by(Pedido.creado_en.asc(), Pedido.id.asc())
+    else:
+        if despues:
+            creado_en, ultimo_id = decodificar_cursor(despues)
+            query = query.where(db.or_(
+                Pedido.creado_en < creado_en,
+                db.and_(Pedido.creado_en == creado_en, Pedido.id < ultimo_id)
+            ))
+        query = query.order_by(Pedido.creado_en.desc(), Pedido.id.desc())
+
+    # Pedir uno extra para saber si hay otra página en esa dirección
+    filas = db.session.execute(query.limit(limite + 1)).scalars().all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    if antes:
+        filas.reverse()
+        hay_recientes, hay_antiguos = hay_mas, True
+    else:
+        hay_recientes, hay_antiguos = despues is not None, hay_mas
+
+    anterior = codificar_cursor(filas[0].creado_en, filas[0].id) if filas and hay_recientes else None
+    siguiente = codificar_cursor(filas[-1].creado_en, filas[-1].id) if filas and hay_antiguos else None
+
+    total = contar_pedidos(estado, tipo, desde, hasta, ttl=ttl_conteo)
+    return PaginaCursor(filas, anterior, siguiente, total)
+
+
+# ==================== COMISIONES ====================
+
+ESTADOS_COMISION = ('todos', 'pendiente', 'generada', 'pagada')
+
+
+def totales_comisiones(afiliado_id=None):
+    """{'pendiente', 'generada', 'pagada'} -> suma de montos, en una consulta agrupada"""
+    from models import db, Comision
+
+    query = db.select(Comision.estado, db.func.sum(Comision.monto)).group_by(Comision.estado)
+    if afiliado_id is not None:
+        query = query.where(Comision.afiliado_id == afiliado_id)
+
+    totales = {estado: Decimal('0.00') for estado in ESTADOS_COMISION[1:]}
+    for estado, monto in db.session.execute(query):
+        totales[estado] = monto or Decimal('0.00')
+    return totales
+
+
+def listar_comisiones(estado='todos', afiliado_id=None, pagina=1, por_pagina=50, con_pedido=False):
+    """
+    Página de comisiones, de la más reciente a la más antigua.
+    El afiliado viene en la misma consulta (joinedload) y, con `con_pedido`,
+    los pedidos de la página en una sola consulta extra (selectinload).
+    """
+    from models import db, Comision
+
+    condiciones = []
+    if afiliado_id is not None:
+        condiciones.append(Comision.afiliado_id == afiliado_id)
+    if estado != 'todos':
+        condiciones.append(Comision.estado == estado)
+
+    total = db.session.execute(db.select(db.func.count(Comision.id)).where(*condiciones)).scalar()
+    pagina = min(max(1, pagina), max(1, math.ceil(total / por_pagina)))
+
+    opciones = [db.joinedload(Comision.afiliado)]
+    if con_pedido:
+        opciones.append(db.selectinload(Comision.pedido))
+
+    items = db.session.execute(
+        db.select(Comision)
+        .options(*opciones)
+        .where(*condiciones)
+        .order_by(Comision.creado_en.desc(), Comision.id.desc())
+        .limit(por_pagina)
+        .offset((pagina - 1) * por_pagina)
+    ).scalars().all()
+
+    return Pagina(items, pagina, por_pagina, total)
+
+
+def listar_liquidaciones(pagina=1, por_pagina=50):
+    """Página de liquidaciones, de la más reciente a la más antigua (con su afiliado)"""
+    from models import db, Liquidacion
+
+    total = db.session.execute(db.select(db.func.count(Liquidacion.id))).scalar()
+    pagina = min(max(1, pagina), max(1, math.ceil(total / por_pagina)))
+
+    items = db.session.execute(
+        db.select(Liquidacion)
+        .options(db.joinedload(Liquidacion.afiliado))
+        .order_by(Liquidacion.id.desc())
+        .limit(por_pagina)
+        .offset((pagina - 1) * por_pagina)
+    ).scalars().all()
+
+    return Pagina(items, pagina, por_pagina, total)
@@ -0,0 +1,270 @@
+"""
+Cliente de la API REST de PayPal
+- Sesión HTTP con pool de conexiones keep-alive (sin handshake TLS por llamada)
+- Timeouts de conexión y lectura, reintentos con backoff en llamadas idempotentes
+- Circuit breaker: si PayPal falla seguido, se responde sin esperarlo
+- Token OAuth cacheado por proceso: se renueva en segundo plano antes de que
+  venza y se descarta si PayPal responde 401
+"""
+
+import base64
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+
+URLS_PAYPAL = {
+    'live': 'https://api-m.paypal.com',
+    'sandbox': 'https://api-m.sandbox.paypal.com'
+}
+
+
+class PayPalNoDisponible(Exception):
+    """PayPal no respondió (timeout, conexión o circuito abierto)"""
+
+
+def url_api(ruta):
+    """URL completa de un endpoint de PayPal (PAYPAL_API_URL o según PAYPAL_MODE)"""
+    base = current_app.config.get('PAYPAL_API_URL')
+    if not base:
+        modo = current_app.config['PAYPAL_MODE']
+        base = URLS_PAYPAL['live' if modo == 'live' else 'sandbox']
+    return base.rstrip('/') + ruta
+
+
+# ==================== CONEXIÓN ====================
+
+class Circuito:
+    """Circuit breaker: tras `umbral` fallos seguidos no se llama a PayPal durante `espera` segundos"""
+
+    def __init__(self, umbral, espera):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_hasta = None
+        self._probando = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """True si se puede llamar a PayPal; con el circuito semiabierto pasa una sola prueba"""
+        with self._lock:
+            if self.abierto_hasta is None:
+                return True
+            if time.monotonic() < self.abierto_hasta or self._probando:
+                return False
+            self._probando = True
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_hasta = None
+            self._probando = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self._probando = False
+            if self.fallos >= self.umbral:
+                self.abierto_hasta = time.monotonic() + self.espera
+
+
+_lock_conexion = threading.Lock()
+_sesion = None
+_circuito = None
+
+
+def obtener_sesion():
+    """Sesión HTTP del proceso (se crea en el primer uso, después del fork de gunicorn)"""
+    global _sesion
+    if _sesion is None:
+        with _lock_conexion:
+            if _sesion is None:
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=current_app.config['PAYPAL_POOL_MAX'])
+                sesion.mount('https://', adaptador)
+                sesion.mount('http://', adaptador)  # Stub local (PAYPAL_API_URL)
+                _sesion = sesion
+    return _sesion
+
+
+def obtener_circuito():
+    """Circuit breaker del proceso (con los límites de Config)"""
+    global _circuito
+    if _circuito is None:
+        with _lock_conexion:
+            if _circuito is None:
+                _circuito = Circuito(
+                    current_app.config['PAYPAL_CIRCUITO_FALLOS'],
+                    current_app.config['PAYPAL_CIRCUITO_ESPERA']
+                )
+    return _circuito
+
+
+def _enviar(metodo, ruta, idempotente=False, **kwargs):
+    """
+    Llamada HTTP a PayPal con timeouts. Las idempotentes se reintentan con
+    backoff ante errores de red, 429 y 5xx.
+    Lanza PayPalNoDisponible si no hubo respuesta o el circuito está abierto.
+    """
+    config = current_app.config
+    circuito = obtener_circuito()
+    if not circuito.permitir():
+        raise PayPalNoDisponible('PayPal no disponible temporalmente')
+
+    timeout = (config['PAYPAL_TIMEOUT_CONEXION'], config['PAYPAL_TIMEOUT_LECTURA'])
+    intentos = 1 + (config['PAYPAL_REINTENTOS'] if idempotente else 0)
+    response = None
+    error = None
+
+    try:
+        for intento in range(intentos):
+            if intento:
+                # Backoff exponencial con jitter
+                time.sleep(random.uniform(0, config['PAYPAL_REINTENTO_ESPERA'] * 2 ** (intento - 1)))
+            try:
+                response = obtener_sesion().request(metodo, url_api(ruta), timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+                continue
+            if response.status_code < 500 and response.status_code != 429:
+                circuito.registrar_exito()
+                return response
+    except Exception:
+        circuito.registrar_fallo()
+        raise
+
+    circuito.registrar_fallo()
+    if response is not None:
+        return response  # 5xx / 429: quien llama lo trata como error de PayPal
+    raise PayPalNoDisponible(f'PayPal no respondió: {error}') from error
+
+
+# ==================== TOKEN OAUTH ====================
+
+class TokenPayPal:
+    """Token de acceso con su vencimiento (reloj monotónico)"""
+
+    def __init__(self, clave, access_token, expira_en):
+        self.clave = clave  # (modo, client_id): otro valor en Config invalida el token
+        self.access_token = access_token
+        self.expira_en = expira_en
+
+    def restante(self):
+        return self.expira_en - time.monotonic()
+
+
+_lock = threading.Lock()
+_token = None
+_refrescando = False
+
+
+def _clave_credenciales():
+    return (current_app.config['PAYPAL_MODE'], current_app.config['PAYPAL_CLIENT_ID'])
+
+
+def _solicitar_token():
+    """Pedir un token nuevo a /v1/oauth2/token (None si PayPal lo rechaza)"""
+    client_id = current_app.config['PAYPAL_CLIENT_ID']
+    client_secret = current_app.config['PAYPAL_SECRET']
+    auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+    headers = {
+        "Authorization": f"Basic {auth}",
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+
+    # Pedir otro token no tiene efectos: se puede reintentar
+    response = _enviar('POST', '/v1/oauth2/token', idempotente=True,
+                       headers=headers, data="grant_type=client_credentials")
+
+    if response.status_code != 200:
+        return None
+    datos = response.json()
+    # Se descuenta un margen para no usar un token que vence en pleno request
+    vigencia = int(datos.get('expires_in', 0)) - current_app.config['PAYPAL_TOKEN_MARGEN']
+    return TokenPayPal(_clave_credenciales(), datos['access_token'], time.monotonic() + max(vigencia, 0))
+
+
+def _refrescar_en_segundo_plano(app):
+    """Renovar el token sin bloquear al request que detectó que está por vencer"""
+    global _token, _refrescando
+    try:
+        with app.app_context():
+            nuevo = _solicitar_token()
+            if nuevo is not None:
+                with _lock:
+                    _token = nuevo
+    except Exception as e:
+        app.logger.warning(f'No se pudo renovar el token de PayPal: {e}')
+    finally:
+        _refrescando = False
+
+
+def obtener_token():
+    """Token de acceso vigente; solo un request a la vez lo pide a PayPal"""
+    global _token, _refrescando
+
+    token = _token
+    if token is not None and token.clave == _clave_credenciales() and token.restante() > 0:
+        # Cerca del vencimiento: renovar en segundo plano y seguir usando el actual
+        if token.restante() < current_app.config['PAYPAL_TOKEN_REFRESCO'] and not _refrescando:
+            with _lock:
+                if not _refrescando:
+                    _refrescando = True
+                    threading.Thread(
+                        target=_refrescar_en_segundo_plano,
+                        args=(current_app._get_current_object(),),
+                        daemon=True
+                    ).start()
+        return token.access_token
+
+    with _lock:
+        # Otro request pudo haberlo renovado mientras se esperaba el lock
+        token = _token
+        if token is None or token.clave != _clave_credenciales() or token.restante() <= 0:
+            token = _solicitar_token()
+            _token = token
+        return token.access_token if token else None
+
+
+def invalidar_token(access_token=None):
+    """Descartar el token (PayPal respondió 401); solo si sigue siendo el mismo"""
+    global _token
+    with _lock:
+        if _token is not None and (access_token is None or _token.access_token == access_token):
+            _token = None
+
+
+# ==================== LLAMADAS A LA API ====================
+
+def post_api(ruta, id_solicitud=None, **kwargs):
+    """
+    POST autenticado a la API de PayPal.
+    Con `id_solicitud` (header PayPal-Request-Id) PayPal ignora los duplicados,
+    así que la llamada se puede reintentar sin cobrar dos veces.
+    Si el token fue revocado (401) se pide uno nuevo y se reintenta una vez.
+    Retorna None si no se pudo obtener un token.
+    """
+    for intento in range(2):
+        access_token = obtener_token()
+        if not access_token:
+            return None
+
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        if id_solicitud:
+            headers["PayPal-Request-Id"] = id_solicitud
+        response = _enviar('POST', ruta, idempotente=bool(id_solicitud), headers=headers, **kwargs)
+
+        if response.status_code != 401:
+            return response
+        invalidar_token(access_token)
+
+    return response
@@ -0,0 +1,256 @@
+"""
+Sesiones guardadas en el servidor
+La cookie solo lleva un id opaco (firmado); el carrito, el código de
+afiliado y el login viven en un almacén compartido por todos los nodos.
+
+Almacenes con interfaz compatible con Redis (get / setex / delete):
+- AlmacenBaseDatos: tabla 'sesiones' (SQLite o PostgreSQL)
+- redis.Redis: cualquier cliente de redis-py
+- AlmacenMemoria: reemplazo local para desarrollo y pruebas (un solo proceso)
+"""
+
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession, SecureCookieSessionInterface
+from itsdangerous import BadSignature, Signer
+
+
+PREFIJO_CLAVE = 'sesion:'
+
+
+class SesionServidor(SecureCookieSession):
+    """Sesión cuyo contenido está en el almacén; la cookie solo guarda `sid`"""
+
+    def __init__(self, initial=None, sid=None, nueva=True, renovada=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.nueva = nueva
+        self.renovada = renovada  # Última escritura en el almacén (epoch)
+        # Para cambiar el id al iniciar o cerrar sesión (evita fijación de sesión)
+        self.usuario_inicial = dict.get(self, '_user_id')
+
+
+# ==================== ALMACENES ====================
+
+class AlmacenMemoria:
+    """Diccionario con vencimiento; misma interfaz que un cliente Redis"""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                return None
+            if valor[1] <= time.time():
+                del self._datos[clave]
+                return None
+            return valor[0]
+
+    def setex(self, clave, segundos, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.time() + segundos)
+        return True
+
+    def delete(self, *claves):
+        with self._lock:
+            return sum(1 for clave in claves if self._datos.pop(clave, None) is not None)
+
+
+class AlmacenBaseDatos:
+    """
+    Sesiones en la tabla 'sesiones' con interfaz de Redis.
+    Usa su propia conexión: nunca confirma cambios pendientes de la vista.
+    """
+
+    def _tabla(self):
+        from models import SesionGuardada
+        return SesionGuardada.__table__
+
+    def get(self, clave):
+        from models import db
+        tabla = self._tabla()
+        with db.engine.connect() as conexion:
+            fila = conexion.execute(
+                db.select(tabla.c.datos).where(tabla.c.id == clave, tabla.c.expira_en > datetime.utcnow())
+            ).first()
+        return fila.datos if fila else None
+
+    def setex(self, clave, segundos, valor):
+        from models import db
+        tabla = self._tabla()
+        expira_en = datetime.utcnow() + timedelta(seconds=segundos)
+        with db.engine.begin() as conexion:
+            actualizadas = conexion.execute(
+                tabla.update().where(tabla.c.id == clave).values(datos=valor, expira_en=expira_en)
+            ).rowcount
+            if not actualizadas:
+                conexion.execute(tabla.insert().values(id=clave, datos=valor, expira_en=expira_en))
+        return True
+
+    def delete(self, *claves):
+        from models import db
+        tabla = self._tabla()
+        with db.engine.begin() as conexion:
+            return conexion.execute(tabla.delete().where(tabla.c.id.in_(claves))).rowcount
+
+    def limpiar_vencidas(self, lote):
+        """Borrar sesiones vencidas de a `lote` filas (transacciones cortas). Retorna cuántas"""
+        from models import db
+        tabla = self._tabla()
+        total = 0
+        while True:
+            with db.engine.begin() as conexion:
+                ids = [fila.id for fila in conexion.execute(
+                    db.select(tabla.c.id).where(tabla.c.expira_en <= datetime.utcnow()).limit(lote)
+                )]
+                if ids:
+                    conexion.execute(tabla.delete().where(tabla.c.id.in_(ids)))
+            total += len(ids)
+            if len(ids) < lote:
+                return total
+
+
+def crear_almacen(app):
+    """Almacén según SESIONES_BACKEND"""
+    backend = app.config['SESIONES_BACKEND']
+    if backend == 'redis':
+        import redis
+        return redis.Redis.from_url(app.config['SESIONES_REDIS_URL'])
+    if backend == 'memoria':
+        return AlmacenMemoria()
+    return AlmacenBaseDatos()
+
+
+# ==================== INTERFAZ DE SESIÓN ====================
+
+class SesionServidorInterface(SessionInterface):
+    """SessionInterface de Flask que guarda el contenido en `almacen`"""
+
+    serializer = TaggedJSONSerializer()
+    session_class = SesionServidor
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+        # Cookies firmadas de antes del cambio: su contenido se pasa al almacén
+        self._cookie_anterior = SecureCookieSessionInterface()
+        self._ultima_limpieza = time.monotonic()
+        self._limpiando = False
+
+    def _firmador(self, app):
+        return Signer(app.secret_key, salt='sesion-servidor')
+
+    def _vigencia(self, app, session):
+        """Segundos que el almacén guarda la sesión"""
+        if session.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return int(app.config['SESIONES_TTL_TEMPORAL'].total_seconds())
+
+    def open_session(self, app, request):
+        # Imágenes, CSS y JS no usan la sesión: sin lectura del almacén por archivo
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            return self.session_class(sid=None)
+
+        valor = request.cookies.get(self.get_cookie_name(app))
+        if not valor:
+            return self.session_class(sid=secrets.token_urlsafe(32))
+
+        try:
+            sid = self._firmador(app).unsign(valor).decode()
+        except BadSignature:
+            # Cookie con la sesión completa (formato anterior): migrarla una vez
+            anterior = self._cookie_anterior.open_session(app, request)
+            sesion = self.session_class(anterior or None, sid=secrets.token_urlsafe(32))
+            sesion.modified = bool(anterior)
+            return sesion
+
+        datos = self.almacen.get(PREFIJO_CLAVE + sid)
+        if datos is None:
+            return self.session_class(sid=secrets.token_urlsafe(32))
+        if isinstance(datos, bytes):
+            datos = datos.decode()
+        guardado = self.serializer.loads(datos)
+        return self.session_class(guardado['datos'], sid=sid, nueva=False, renovada=guardado['renovada'])
+
+    def save_session(self, app, session, response):
+        if session.sid is None:
+            return  # Archivo estático: la cookie del navegador queda como estaba
+
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Sesión vaciada (logout): borrar del almacén y la cookie
+        if not session:
+            if session.modified:
+                if not session.nueva:
+                    self.almacen.delete(PREFIJO_CLAVE + session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            self._limpiar_si_corresponde(app)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+        # Sin cambios: renovar el vencimiento a lo sumo cada SESIONES_RENOVAR_CADA (no escribir en cada request)
+        if not session.modified and time.time() - session.renovada < app.config['SESIONES_RENOVAR_CADA']:
+            return
+
+        # Nuevo id al cambiar de usuario: un id conocido antes del login no sirve después
+        if not session.nueva and dict.get(session, '_user_id') != session.usuario_inicial:
+            self.almacen.delete(PREFIJO_CLAVE + session.sid)
+            session.sid = secrets.token_urlsafe(32)
+
+        session.renovada = int(time.time())
+        self.almacen.setex(PREFIJO_CLAVE + session.sid, self._vigencia(app, session),
+                           self.serializer.dumps({'datos': dict(session), 'renovada': session.renovada}))
+
+        response.set_cookie(
+            nombre,
+            self._firmador(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=dominio,
+            path=ruta,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+        self._limpiar_si_corresponde(app)
+
+    def _limpiar_si_corresponde(self, app):
+        """Cada SESIONES_GC_INTERVALO, borrar sesiones vencidas en un hilo aparte"""
+        if not hasattr(self.almacen, 'limpiar_vencidas') or self._limpiando:
+            return
+        if time.monotonic() - self._ultima_limpieza < app.config['SESIONES_GC_INTERVALO']:
+            return
+
+        self._limpiando = True
+        self._ultima_limpieza = time.monotonic()
+        threading.Thread(target=self._limpiar, args=(app,), daemon=True).start()
+
+    def _limpiar(self, app):
+        try:
+            with app.app_context():
+                self.almacen.limpiar_vencidas(app.config['SESIONES_GC_LOTE'])
+        except Exception as e:
+            app.logger.warning(f'No se pudieron limpiar las sesiones vencidas: {e}')
+        finally:
+            self._limpiando = False
+
+
+def iniciar_sesiones(app):
+    """Guardar las sesiones en el servidor (SESIONES_BACKEND='cookie' mantiene las de Flask)"""
+    if app.config['SESIONES_BACKEND'] == 'cookie':
+        return
+    app.session_interface = SesionServidorInterface(crear_almacen(app))
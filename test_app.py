@@ -13,16 +13,17 @@ print("PRUEBAS DE FUNCIONAMIENTO")
 print("="*60)
 
 try:
-    print("\n[1/5] Importando módulos...")
+    print("\n[1/8] Importando módulos...")
     from app import create_app
     from models import db, Admin, Afiliado, Producto, Pedido, Comision
     print("   ✓ Módulos importados correctamente")
 
-    print("\n[2/5] Creando aplicación...")
+    print("\n[2/8] Creando aplicación...")
     app = create_app()
+    app.config['TESTING'] = True  # Sin hilos de fondo (cola de pedidos) en las pruebas
     print("   ✓ Aplicación creada correctamente")
 
-    print("\n[3/5] Verificando modelos...")
+    print("\n[3/8] Verificando modelos...")
     with app.app_context():
         # Verificar que los campos nuevos existen
         inspector = db.inspect(db.engine)
@@ -44,7 +45,7 @@ try:
         else:
             print("   ✗ Campo 'validado_en' NO existe en 'pedidos'")
 
-    print("\n[4/5] Verificando rutas...")
+    print("\n[4/8] Verificando rutas...")
     with app.app_context():
         from routes import tienda, admin, afiliado, auth
         
@@ -63,7 +64,7 @@ try:
         else:
             print("   ✗ Ruta de tienda de vendedor NO encontrada")
 
-    print("\n[5/5] Verificando métodos de modelos...")
+    print("\n[5/8] Verificando métodos de modelos...")
     with app.app_context():
         # Probar método validar_para_admin
         pedido_test = Pedido.query.first()
@@ -87,6 +88,108 @@ try:
         else:
             print("   ⚠ No hay afiliados en la base de datos para probar")
 
+    print("\n[6/8] Verificando consultas por vista...")
+    with app.app_context():
+        from decimal import Decimal
+        from sqlalchemy import event
+        from services.listados import listar_comisiones, totales_comisiones
+
+        consultas = []
+        contar = lambda *args, **kwargs: consultas.append(1)
+        try:
+            # Comisiones de dos afiliados (se descartan al final): con la tabla vacía
+            # una consulta por fila (N+1) pasaría inadvertida
+            afiliados_prueba = []
+            for numero in range(2):
+                afiliado_prueba = Afiliado(nombre=f'Prueba {numero}', email=f'prueba{numero}@test_app.local',
+                                           codigo=f'TESTAPP{numero}', porcentaje_comision=Decimal('50'))
+                afiliado_prueba.set_password('prueba')
+                db.session.add(afiliado_prueba)
+                afiliados_prueba.append(afiliado_prueba)
+            db.session.flush()
+            for numero in range(12):
+                afiliado_prueba = afiliados_prueba[numero % 2]
+                pedido_prueba = Pedido(cliente_nombre='Prueba', cliente_telefono='0', cliente_direccion='-',
+                                       productos_json=[], total=Decimal('10.00'), afiliado_id=afiliado_prueba.id)
+                db.session.add(pedido_prueba)
+                db.session.add(Comision(pedido=pedido_prueba, afiliado_id=afiliado_prueba.id, margen=Decimal('4.00'),
+                                        monto=Decimal('2.00'), estado='generada'))
+            db.session.flush()
+            afiliado_id = afiliados_prueba[0].id
+            # Fuera de la sesión: las relaciones se cargan desde la base como en una vista
+            db.session.expunge_all()
+
+            event.listen(db.engine, 'before_cursor_execute', contar)
+
+            # Comisiones del admin: conteo + página (con afiliado) + totales
+            pagina = listar_comisiones(por_pagina=50)
+            totales_comisiones()
+            for comision in pagina.items:
+                comision.afiliado.nombre
+            if len(pagina.items) < 12 or len(consultas) > 3:
+                raise AssertionError(f'Comisiones del admin: {len(consultas)} consultas para '
+                                     f'{len(pagina.items)} filas (máximo 3)')
+            print(f"   ✓ Comisiones del admin: {len(consultas)} consultas para {len(pagina.items)} filas")
+
+            # Comisiones del afiliado: conteo + página + pedidos (selectin) + totales
+            del consultas[:]
+            pagina = listar_comisiones(afiliado_id=afiliado_id, por_pagina=50, con_pedido=True)
+            totales_comisiones(afiliado_id=afiliado_id)
+            for comision in pagina.items:
+                comision.pedido.productos_json
+            if len(pagina.items) != 6 or len(consultas) > 4:
+                raise AssertionError(f'Comisiones del afiliado: {len(consultas)} consultas para '
+                                     f'{len(pagina.items)} filas (máximo 4)')
+            print(f"   ✓ Comisiones del afiliado: {len(consultas)} consultas para {len(pagina.items)} filas")
+        finally:
+            if event.contains(db.engine, 'before_cursor_execute', contar):
+                event.remove(db.engine, 'before_cursor_execute', contar)
+            # Nada de esta prueba queda en la base de datos
+            db.session.rollback()
+
+    print("\n[7/8] Verificando comisión de un pedido pagado con PayPal...")
+    with app.app_context():
+        from decimal import Decimal
+        try:
+            # Mismo camino que paypal_capture_order: pedido nuevo, pago, validación y un solo commit
+            afiliado_prueba = Afiliado(nombre='Prueba', email='prueba@test_app.local', codigo='TESTAPP',
+                                       porcentaje_comision=Decimal('50'))
+            afiliado_prueba.set_password('prueba')
+            db.session.add(afiliado_prueba)
+            db.session.flush()
+
+            pedido_prueba = Pedido(cliente_nombre='Prueba', cliente_telefono='0', cliente_direccion='-',
+                                   productos_json=[{'id': 0, 'nombre': 'Prueba', 'cantidad': 2, 'precio': 10.0,
+                                                    'subtotal': 20.0, 'costo': 6.0, 'margen': 4.0}],
+                                   total=Decimal('20.00'), afiliado_id=afiliado_prueba.id)
+            db.session.add(pedido_prueba)
+            pedido_prueba.marcar_como_pagado(commit=False)
+            pedido_prueba.validar_para_admin(commit=False)
+            db.session.flush()
+
+            comisiones_prueba = Comision.query.filter_by(pedido_id=pedido_prueba.id).all()
+            if len(comisiones_prueba) != 1 or comisiones_prueba[0].monto != Decimal('4.00'):
+                raise AssertionError(f'El pedido validado generó {len(comisiones_prueba)} comisiones (se esperaba 1 de $4.00)')
+            print("   ✓ Comisión generada en la misma transacción del pedido")
+        finally:
+            # Nada de esta prueba queda en la base de datos
+            db.session.rollback()
+
+    print("\n[8/8] Verificando límite de intentos de login...")
+    if app.config['LIMITES_ACTIVOS']:
+        cliente = app.test_client()
+        rafaga, _ = app.config['LIMITES']['login']
+        intentos = rafaga * app.config['LIMITES_FACTOR_IP'] + 1
+        codigos = [
+            cliente.post('/auth/admin/login', data={'username': 'no-existe', 'password': 'incorrecta'}).status_code
+            for _ in range(intentos)
+        ]
+        if codigos[-1] != 429:
+            raise AssertionError(f'{intentos} logins fallidos seguidos sin respuesta 429')
+        print(f"   ✓ Login bloqueado con 429 después de {codigos.index(429)} intentos fallidos")
+    else:
+        print("   ⚠ LIMITES_ACTIVOS=0: límites desactivados")
+
     print("\n" + "="*60)
     print("✓ TODAS LAS PRUEBAS COMPLETADAS")
     print("="*60)